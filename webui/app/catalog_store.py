@@ -0,0 +1,206 @@
+# catalog_store.py — 扫描结果的持久化快照（SQLite）
+#
+# 容器重启后先从快照恢复三源数据（毫秒级），再由 main 在后台按三源指纹 +
+# 每项指纹增量复核，避免冷启动时把整个 workshop 的 project.json 重新读一遍。
+import json, os, sqlite3, threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .we_scan import FolderNode, VideoItem
+
+# 快照格式版本：VideoItem 字段或表结构变化时 +1，旧快照直接作废走全量扫描
+SNAPSHOT_VERSION = 2
+
+SOURCES = ("config", "workshop", "myprojects")
+
+_ITEM_FIELDS = VideoItem.FIELDS
+
+_lock = threading.Lock()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalog_meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalog_items (
+        src  TEXT NOT NULL,
+        id   TEXT NOT NULL,
+        item TEXT NOT NULL,
+        PRIMARY KEY (src, id)
+    )""")
+    # 扫过但不是视频（场景/网页壁纸、未下载完）的目录指纹，重启后不必再扫一遍
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalog_fps (
+        src TEXT NOT NULL,
+        id  TEXT NOT NULL,
+        fp  TEXT NOT NULL,
+        PRIMARY KEY (src, id)
+    )""")
+    # 预览图低清占位（LQIP + 主色），按预览图路径 + mtime/size 判定有效；不随快照整体覆盖
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS preview_placeholders (
+        path     TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        size     INTEGER NOT NULL,
+        lqip     TEXT NOT NULL,
+        color    TEXT NOT NULL
+    )""")
+    return conn
+
+
+def _item_to_row(src: str, v: VideoItem) -> tuple:
+    # 按字段顺序存成紧凑 JSON 数组，比 dict 小一半
+    return (src, v.id, json.dumps(v.astuple(), ensure_ascii=False, separators=(",", ":")))
+
+
+def _row_to_item(raw: str) -> Optional[VideoItem]:
+    try:
+        vals = json.loads(raw)
+    except Exception:
+        return None
+    if not isinstance(vals, list) or len(vals) != len(_ITEM_FIELDS):
+        return None
+    kw = dict(zip(_ITEM_FIELDS, vals))
+    kw["fp"] = tuple(kw.get("fp") or (0, 0, 0, 0, 0))
+    return VideoItem(**kw)
+
+
+def _folder_to_obj(node: FolderNode) -> list:
+    return [node.title, list(node.items), [_folder_to_obj(sf) for sf in node.subfolders]]
+
+
+def _folder_from_obj(obj: list) -> FolderNode:
+    title, items, subs = obj
+    return FolderNode(title=title, items=list(items), subfolders=[_folder_from_obj(sf) for sf in subs])
+
+
+def save_snapshot(db_path: str, snap: dict) -> None:
+    """
+    整体覆盖写入快照。snap 结构：
+      roots:        {"workshop": WORKSHOP_PATH, "we": WE_PATH}（路径变了快照作废）
+      sources:      {src: {"fp": 指纹, "pending": [...]}}
+      folder_roots: List[FolderNode]
+      install_dir:  config.json 的 ?installdirectory（myprojects 扫描要用）
+      items:        {src: {id: VideoItem}}
+      fps:          {src: {id: 指纹}}（扫过的全部目录，含非视频项）
+    """
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "roots": snap.get("roots") or {},
+        "sources": {
+            src: {
+                "fp": list(st.get("fp") or []) if st.get("fp") is not None else None,
+                "pending": sorted(st.get("pending") or []),
+            }
+            for src, st in (snap.get("sources") or {}).items()
+        },
+        "install_dir": snap.get("install_dir") or "",
+        "folder_roots": [_folder_to_obj(n) for n in (snap.get("folder_roots") or [])],
+    }
+    rows: List[tuple] = []
+    for src, items in (snap.get("items") or {}).items():
+        rows.extend(_item_to_row(src, v) for v in items.values())
+    fp_rows: List[tuple] = []
+    for src, fps in (snap.get("fps") or {}).items():
+        items = (snap.get("items") or {}).get(src) or {}
+        # 视频项的指纹已在 item 里，这里只存非视频目录
+        fp_rows.extend((src, k, json.dumps(list(fp))) for k, fp in fps.items() if k not in items)
+    with _lock:
+        conn = _connect(db_path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM catalog_items")
+                conn.execute("DELETE FROM catalog_fps")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO catalog_items(src, id, item) VALUES(?,?,?)", rows)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO catalog_fps(src, id, fp) VALUES(?,?,?)", fp_rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO catalog_meta(key, value) VALUES('snapshot', ?)",
+                    (json.dumps(meta, ensure_ascii=False, separators=(",", ":")),))
+        finally:
+            conn.close()
+
+
+def load_snapshot(db_path: str, roots: dict) -> Optional[dict]:
+    """读取快照；不存在、版本不符或根路径不一致时返回 None。结构同 save_snapshot。"""
+    if not os.path.isfile(db_path):
+        return None
+    with _lock:
+        conn = _connect(db_path)
+        try:
+            row = conn.execute("SELECT value FROM catalog_meta WHERE key='snapshot'").fetchone()
+            if not row:
+                return None
+            meta = json.loads(row[0])
+            if meta.get("version") != SNAPSHOT_VERSION or meta.get("roots") != roots:
+                return None
+            items: Dict[str, Dict[str, VideoItem]] = {src: {} for src in SOURCES}
+            fps: Dict[str, Dict[str, tuple]] = {src: {} for src in SOURCES}
+            for src, raw in conn.execute("SELECT src, item FROM catalog_items"):
+                v = _row_to_item(raw)
+                if v is not None and src in items:
+                    items[src][v.id] = v
+                    fps[src][v.id] = v.fp
+            for src, k, raw in conn.execute("SELECT src, id, fp FROM catalog_fps"):
+                if src in fps:
+                    fps[src][k] = tuple(json.loads(raw))
+        except Exception as e:
+            print("[catalog] 读取快照失败：", e)
+            return None
+        finally:
+            conn.close()
+    sources = {}
+    for src in SOURCES:
+        st = (meta.get("sources") or {}).get(src) or {}
+        fp = st.get("fp")
+        sources[src] = {
+            "fp": tuple(fp) if isinstance(fp, list) else None,
+            "pending": set(st.get("pending") or []),
+        }
+    return {
+        "roots": meta.get("roots") or {},
+        "sources": sources,
+        "install_dir": meta.get("install_dir") or "",
+        "folder_roots": [_folder_from_obj(o) for o in (meta.get("folder_roots") or [])],
+        "items": items,
+        "fps": fps,
+    }
+
+
+def load_placeholders(db_path: str) -> Dict[str, Tuple[int, int, str, str]]:
+    """预览图占位：preview_path → (mtime_ns, size, lqip, color)。"""
+    if not os.path.isfile(db_path):
+        return {}
+    with _lock:
+        conn = _connect(db_path)
+        try:
+            return {path: (mtime_ns, size, lqip, color) for path, mtime_ns, size, lqip, color in
+                    conn.execute("SELECT path, mtime_ns, size, lqip, color FROM preview_placeholders")}
+        except sqlite3.Error as e:
+            print("[catalog] 读取预览图占位失败：", e)
+            return {}
+        finally:
+            conn.close()
+
+
+def save_placeholders(db_path: str, rows: Iterable[Tuple[str, int, int, str, str]]) -> None:
+    """增量写入 (path, mtime_ns, size, lqip, color)，同一路径覆盖旧记录。"""
+    rows = list(rows)
+    if not rows:
+        return
+    with _lock:
+        conn = _connect(db_path)
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO preview_placeholders(path, mtime_ns, size, lqip, color) VALUES(?,?,?,?,?)",
+                    rows)
+        finally:
+            conn.close()
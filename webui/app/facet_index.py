@@ -0,0 +1,133 @@
+# facet_index.py — 分类属性（分级 / 来源 / 朝向 / 编码族）的位图索引
+#
+# 每个属性值一张位图（Python int，第 i 位 = 第 i 个 id），组合筛选就是位与/位或，
+# 某个文件夹里各属性值的数量是「子树位图 & 值位图」的 popcount，不再逐项比较字符串。
+# 位图按序号编码，id 序号取自建索引时的 id_map 迭代顺序；索引随快照（及探测列）整体重建。
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+_WS_ID_RE = re.compile(r"\d{10}")
+_DECODE_CACHE_SIZE = 32
+
+FACETS = ("rating", "source", "orientation", "codec")
+
+_CODEC_FAMILIES = {
+    "h264": "h264", "hevc": "hevc", "vp9": "vp9", "vp8": "vp8", "av1": "av1",
+    "mpeg4": "mpeg4", "msmpeg4v3": "mpeg4", "wmv3": "wmv", "wmv2": "wmv", "vc1": "wmv",
+}
+
+
+def source_of(vid: str) -> str:
+    """workshop（10 位创意工坊 id）/ mp（myprojects）/ p（config 引用的 projects 下文件）/ other。"""
+    if _WS_ID_RE.fullmatch(vid):
+        return "workshop"
+    if vid.startswith("mp:"):
+        return "mp"
+    if vid.startswith("p:"):
+        return "p"
+    return "other"
+
+
+def _bitmap(ordinals: Iterable[int], n: int) -> int:
+    buf = bytearray((n + 7) // 8)
+    for o in ordinals:
+        buf[o >> 3] |= 1 << (o & 7)
+    return int.from_bytes(buf, "little")
+
+
+class FacetIndex:
+    """
+    id_map 上的分类位图。media(vid) 返回该项的探测列（需有 width/height/codec 属性）或 None，
+    朝向与编码族据此分类，未探测的归为 unknown。建好后只读，可多线程共享。
+    """
+
+    def __init__(self, id_map: Dict[str, object], media: Callable[[str], Optional[object]]):
+        self.ids: List[str] = list(id_map)
+        self._ord: Dict[str, int] = {vid: i for i, vid in enumerate(self.ids)}
+        n = len(self.ids)
+        self.all = (1 << n) - 1
+        members: Dict[str, Dict[str, List[int]]] = {f: {} for f in FACETS}
+        for i, vid in enumerate(self.ids):
+            v = id_map[vid]
+            members["rating"].setdefault((getattr(v, "rating", "") or "").lower() or "unrated", []).append(i)
+            members["source"].setdefault(source_of(vid), []).append(i)
+            m = media(vid)
+            if m is not None and m.width > 0 and m.height > 0:
+                orient = "portrait" if m.height > m.width else "landscape"
+            else:
+                orient = "unknown"
+            members["orientation"].setdefault(orient, []).append(i)
+            codec = (m.codec if m is not None else "") or ""
+            members["codec"].setdefault(_CODEC_FAMILIES.get(codec, "other") if codec else "unknown", []).append(i)
+        self.bitmaps: Dict[str, Dict[str, int]] = {
+            f: {val: _bitmap(ords, n) for val, ords in vals.items()} for f, vals in members.items()
+        }
+        self._decoded: "OrderedDict[int, FrozenSet[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scope(self, ids: Iterable[str]) -> int:
+        """一组 id 的位图（不在索引里的忽略）。"""
+        ords = self._ord
+        return _bitmap((ords[vid] for vid in ids if vid in ords), len(self.ids))
+
+    def select(self, selection: Dict[str, Iterable[str]], skip: str = "") -> int:
+        """同一属性内多个值取并集，不同属性之间取交集；skip 指定的属性不参与（分面计数用）。"""
+        out = self.all
+        for facet, values in selection.items():
+            if facet == skip:
+                continue
+            vals = self.bitmaps.get(facet) or {}
+            bm = 0
+            for val in values:
+                bm |= vals.get(val, 0)
+            out &= bm
+        return out
+
+    def decode(self, bitmap: int) -> FrozenSet[str]:
+        """位图 → id 集合（按位图缓存）。"""
+        with self._lock:
+            hit = self._decoded.get(bitmap)
+            if hit is not None:
+                self._decoded.move_to_end(bitmap)
+                return hit
+        ids = self.ids
+        bits = bin(bitmap)[:1:-1]
+        out = frozenset(ids[m.start()] for m in re.finditer("1", bits))
+        with self._lock:
+            self._decoded[bitmap] = out
+            while len(self._decoded) > _DECODE_CACHE_SIZE:
+                self._decoded.popitem(last=False)
+        return out
+
+    def counts(self, scope: int, selection: Optional[Dict[str, Iterable[str]]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        scope 内每个属性值的数量。带 selection 时按常规分面规则：
+        某属性的计数受其它属性的已选值约束，但不受自身已选值约束（方便多选同一属性）。
+        """
+        selection = selection or {}
+        out: Dict[str, Dict[str, int]] = {}
+        for facet, vals in self.bitmaps.items():
+            base = scope & self.select(selection, skip=facet) if selection else scope
+            out[facet] = {val: (bm & base).bit_count() for val, bm in sorted(vals.items())}
+        return out
+
+
+def parse_facets(raw: Iterable[str]) -> Dict[str, Tuple[str, ...]]:
+    """["rating:mature", "source:workshop,mp"] → {"rating": ("mature",), "source": ("workshop", "mp")}；未知属性忽略。"""
+    out: Dict[str, List[str]] = {}
+    for item in raw:
+        for part in (item or "").split():
+            facet, _, vals = part.partition(":")
+            facet = facet.strip().lower()
+            if facet not in FACETS:
+                continue
+            for val in vals.split(","):
+                val = val.strip().lower()
+                if val and val not in out.setdefault(facet, []):
+                    out[facet].append(val)
+    return {f: tuple(v) for f, v in out.items() if v}
@@ -0,0 +1,219 @@
+# fs_watch.py — 基于 inotify 的目录变化通知（Linux，ctypes 直调 libc，无额外依赖）
+#
+# 扫描源原本靠定期 stat/scandir 根目录取指纹；本机文件系统上改由内核推送变化，
+# 并精确给出是哪个一级子目录变了，增量扫描只碰这些项。
+# SMB/CIFS/NFS/FUSE 等网络或虚拟挂载上 inotify 收不到远端改动，由调用方退回轮询。
+import ctypes, ctypes.util, errno, os, struct, sys, threading
+from typing import Callable, Dict, Optional, Set
+
+IN_ATTRIB        = 0x00000004
+IN_CLOSE_WRITE   = 0x00000008
+IN_MOVED_FROM    = 0x00000040
+IN_MOVED_TO      = 0x00000080
+IN_CREATE        = 0x00000100
+IN_DELETE        = 0x00000200
+IN_DELETE_SELF   = 0x00000400
+IN_MOVE_SELF     = 0x00000800
+IN_UNMOUNT       = 0x00002000
+IN_Q_OVERFLOW    = 0x00004000
+IN_IGNORED       = 0x00008000
+IN_ONLYDIR       = 0x01000000
+IN_DONT_FOLLOW   = 0x02000000
+IN_EXCL_UNLINK   = 0x04000000
+IN_ISDIR         = 0x40000000
+IN_CLOEXEC       = 0o2000000
+
+_ENTRY_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+_SELF_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT
+_DIR_FLAGS = IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+
+_EVENT_HDR = struct.Struct("iIII")   # wd, mask, cookie, len
+
+# inotify 收不到远端改动的文件系统（前缀匹配 fuse.*）
+REMOTE_FS_TYPES = {
+    "cifs", "smb3", "smbfs", "nfs", "nfs4", "9p", "virtiofs", "fuse", "fuseblk",
+    "ceph", "glusterfs", "afs", "davfs", "drvfs", "vboxsf", "prl_fs", "sshfs",
+}
+
+_libc = None
+_libc_lock = threading.Lock()
+
+
+def _load_libc():
+    global _libc
+    with _libc_lock:
+        if _libc is None:
+            try:
+                lib = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                lib.inotify_init1.argtypes = [ctypes.c_int]
+                lib.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                lib.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+                _libc = lib
+            except (OSError, AttributeError):
+                _libc = False
+    return _libc or None
+
+
+def inotify_available() -> bool:
+    return sys.platform.startswith("linux") and _load_libc() is not None
+
+
+def mount_fs_type(path: str) -> str:
+    """path 所在挂载点的文件系统类型（读 /proc/mounts，取最长前缀匹配），未知返回空串。"""
+    try:
+        real = os.path.realpath(path)
+        best, fstype = "", ""
+        with open("/proc/mounts", "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mnt = parts[1].replace("\\040", " ")
+                if (real == mnt or real.startswith(mnt.rstrip("/") + "/")) and len(mnt) >= len(best):
+                    best, fstype = mnt, parts[2]
+        return fstype
+    except OSError:
+        return ""
+
+
+def is_remote_fs(path: str) -> bool:
+    t = mount_fs_type(path)
+    return t in REMOTE_FS_TYPES or t.startswith("fuse.")
+
+
+class TreeWatcher:
+    """
+    监听 root 下一级条目的增删改；watch_children=True 时再给每个一级子目录加一个 watch，
+    子目录内文件的写入/替换也归到该子目录名下。
+    on_event(names) 在后台线程回调，一批事件合并一次：
+      names 为变化的一级条目名集合；None 表示事件队列溢出或根目录失效，需要整体重新比对。
+    根目录被删除/移走/卸载后 alive=False，调用方应退回轮询。
+    """
+
+    def __init__(self, root: str, accept: Callable[[str], bool],
+                 on_event: Callable[[Optional[Set[str]]], None], watch_children: bool = False):
+        self.root = root
+        self.accept = accept
+        self.on_event = on_event
+        self.watch_children = watch_children
+        self.alive = False
+        self.error = ""
+        self.events = 0
+        self.watch_failures = 0
+        self._fd = -1
+        self._root_wd = -1
+        self._children: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def watches(self) -> int:
+        return len(self._children) + (1 if self._root_wd >= 0 else 0)
+
+    def start(self) -> bool:
+        libc = _load_libc()
+        if libc is None:
+            self.error = "libc inotify 不可用"
+            return False
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            self.error = f"inotify_init1: {os.strerror(ctypes.get_errno())}"
+            return False
+        self._fd = fd
+        wd = self._add(self.root, _ENTRY_MASK | _SELF_MASK | _DIR_FLAGS)
+        if wd < 0:
+            os.close(fd)
+            self._fd = -1
+            return False
+        self._root_wd = wd
+        self.alive = True
+        if self.watch_children:
+            self.add_children()
+        threading.Thread(target=self._loop, daemon=True,
+                         name=f"inotify:{os.path.basename(self.root) or self.root}").start()
+        return True
+
+    def add_children(self):
+        """为现有的一级子目录补 watch（已存在的 watch 内核会复用同一个 wd）。"""
+        try:
+            with os.scandir(self.root) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False) and self.accept(e.name):
+                        self._add_child(e.name)
+        except OSError:
+            pass
+
+    def _add(self, path: str, mask: int) -> int:
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            self.error = f"inotify_add_watch({path}): {os.strerror(err)}"
+            if err == errno.ENOSPC and not self.watch_failures:
+                print(f"[watch] ⚠ inotify watch 数达到上限（fs.inotify.max_user_watches），"
+                      f"{self.root} 下部分子目录改由定期巡检发现变化")
+            self.watch_failures += 1
+        return wd
+
+    def _add_child(self, name: str):
+        wd = self._add(os.path.join(self.root, name), _ENTRY_MASK | _SELF_MASK | _DIR_FLAGS)
+        if wd >= 0:
+            with self._lock:
+                self._children[wd] = name
+
+    def _loop(self):
+        buf_size = 64 * 1024
+        while self.alive:
+            try:
+                data = os.read(self._fd, buf_size)
+            except InterruptedError:
+                continue
+            except OSError as e:
+                self.error = f"read: {e}"
+                break
+            names: Optional[Set[str]] = set()
+            lost = False
+            off = 0
+            while off + _EVENT_HDR.size <= len(data):
+                wd, mask, _cookie, ln = _EVENT_HDR.unpack_from(data, off)
+                name = data[off + _EVENT_HDR.size: off + _EVENT_HDR.size + ln].split(b"\0", 1)[0]
+                off += _EVENT_HDR.size + ln
+                self.events += 1
+                if mask & IN_Q_OVERFLOW:
+                    names = None
+                    continue
+                if wd == self._root_wd:
+                    if mask & (_SELF_MASK | IN_IGNORED):
+                        lost = True
+                        continue
+                    n = os.fsdecode(name)
+                    if not n or not self.accept(n):
+                        continue
+                    if self.watch_children and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add_child(n)
+                    if names is not None:
+                        names.add(n)
+                    continue
+                with self._lock:
+                    child = self._children.get(wd)
+                    if mask & IN_IGNORED:
+                        self._children.pop(wd, None)
+                if child is not None and names is not None:
+                    names.add(child)
+            if lost:
+                self.alive = False
+                self.error = "根目录被删除、移动或卸载"
+                names = None
+            if names is None:
+                if self.watch_children and self.alive:
+                    self.add_children()
+                self.on_event(None)
+            elif names:
+                self.on_event(names)
+        self.alive = False
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {"root": self.root, "alive": self.alive, "watches": self.watches,
+                "events": self.events, "watch_failures": self.watch_failures, "error": self.error}
@@ -1,10 +1,13 @@
 # app/main.py (fs-35 audio-direct: add /media/audio/{vid_id} + inplace faststart + keepalive)
 import os, math, mimetypes, re, sqlite3, threading, io, hashlib, subprocess, glob, shutil, json, signal
 import time, logging, asyncio  # ★ 新增：用于 /api/keepalive 时间与日志过滤
+import functools
+import itertools
 import secrets  # ★ 新增
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
 from pathlib import Path
-from typing import List, Tuple, NamedTuple
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple, NamedTuple
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 
@@ -53,6 +56,7 @@ from fastapi.responses import (
     RedirectResponse,
     Response,
     JSONResponse,   # ★ 新增：用于 /api/faststart 返回标准 JSON
+    StreamingResponse,
 )
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -84,14 +88,22 @@ class DirectPlayFileResponse(FileResponse):
 
 from .steam_authors import schedule_steam_author_enrich
 from .we_scan import (
-    load_we_config, extract_folders_list, build_folder_tree, scan_workshop_items,
-    scan_single_workshop_item, scan_single_myproject_item,
-    scan_myprojects_items, scan_config_linked_project_videos,
-    collect_unassigned_items, find_node_by_path, all_ids_recursive, delete_id_dir,
-    delete_myprojects_local_dir, delete_we_projects_path_video,
+    extract_folders_list, build_folder_tree, config_manager,
+    scan_workshop_ids, scan_myproject_dirs, parallel_map,
+    config_linked_video_keys, scan_config_linked_keys, merge_config_linked_items,
+    FolderIndex, VideoItem, catalog_memory_report, delete_id_dir,
+    delete_myprojects_local_dir, delete_we_projects_path_video, item_fingerprint,
     create_folder as ws_create_folder, move_items as ws_move_items, move_folders as ws_move_folders, delete_folders as ws_delete_folders,
 )
-from .models import ScanResponse, FolderOut, VideoOut, DeleteRequest, PlaylistRequest, FolderDeleteRequest
+from .catalog_store import load_snapshot as catalog_load_snapshot, save_snapshot as catalog_save_snapshot
+from .catalog_store import load_placeholders as catalog_load_placeholders, save_placeholders as catalog_save_placeholders
+from .media_probe import MediaColumns, ProbeStore
+from .fs_watch import TreeWatcher, inotify_available, is_remote_fs, mount_fs_type
+from .text_index import TextIndex
+from .facet_index import FacetIndex, parse_facets
+from . import thumbs
+from .thumbs import BytesLRU, ThumbEngine, PRIORITY_STILL, PRIORITY_RENDER, PRIORITY_BACKGROUND
+from .models import ScanResponse, FolderOut, DeleteRequest, PlaylistRequest, FolderDeleteRequest
 
 # === 可配置路径 ===
 WORKSHOP_PATH = os.getenv("WORKSHOP_PATH", "/data/workshop/content/431960")
@@ -354,14 +366,14 @@ class PlaybackNegotiateRequest(BaseModel):
 # ========= 预览图缓存 =========
 PREVIEW_CACHE_DIR = os.getenv("PREVIEW_CACHE_DIR", os.path.join(DATA_DIR, "preview_cache"))
 os.makedirs(PREVIEW_CACHE_DIR, exist_ok=True)
-_cache_locks = {}
-_cache_global_lock = threading.Lock()
-
-def _get_cache_lock(path: str) -> threading.Lock:
-    with _cache_global_lock:
-        if path not in _cache_locks:
-            _cache_locks[path] = threading.Lock()
-        return _cache_locks[path]
+# 缩略图渲染进程数（Pillow 解码/缩放/编码不占请求线程和 GIL）；0 = 单个后台线程渲染，不开子进程
+PREVIEW_WORKERS = max(0, int(os.getenv("PREVIEW_WORKERS", str(min(4, os.cpu_count() or 1)))))
+PREVIEW_RENDER_TIMEOUT_SEC = float(os.getenv("PREVIEW_RENDER_TIMEOUT_SEC", "30"))
+_THUMBS = ThumbEngine(PREVIEW_WORKERS)
+# 最近返回过的小缩略图字节常驻内存（按字节预算 LRU），命中时不再 stat/算 key/读盘；0 = 关闭
+PREVIEW_MEM_CACHE_MB = max(0.0, float(os.getenv("PREVIEW_MEM_CACHE_MB", "64")))
+PREVIEW_MEM_CACHE_ITEM_KB = max(1, int(os.getenv("PREVIEW_MEM_CACHE_ITEM_KB", "512")))
+_PREVIEW_MEM = BytesLRU(int(PREVIEW_MEM_CACHE_MB * 1024 * 1024), PREVIEW_MEM_CACHE_ITEM_KB * 1024)
 
 # ========= FastAPI 应用 =========
 app = FastAPI(title="Wallpaper WebUI")
@@ -394,13 +406,163 @@ def api_keepalive(request: Request):
         "Connection": "close"
     })
 
-def _sort_key(idx: int):
-  if idx == 0: return (lambda v: v.mtime, True)
-  if idx == 1: return (lambda v: v.mtime, False)
-  if idx == 2: return (lambda v: v.size, True)
-  if idx == 3: return (lambda v: v.size, False)
-  if idx == 4: return (lambda v: v.title.casefold(), True)
-  return (lambda v: v.title.casefold(), False)
+# ---- 探测列：时长 / 分辨率 / 码率 / 编码，供排序与 q 筛选 ----
+# 只读探测库里已有的记录（后台预探测负责填充），请求路径上不触发 ffprobe；
+# 未探测或记录已过期（文件指纹对不上）的项视为未知：排序时排在最后，媒体筛选不命中。
+_MEDIA_COLS_REFRESH_SEC = 5.0
+_media_cols_lock = threading.Lock()
+_MEDIA_COLS = {"id_map": None, "store_version": -1, "built_at": 0.0, "version": 0, "cols": {}}
+
+def _media_columns(id_map: Dict[str, VideoItem]) -> Tuple[int, Dict[str, MediaColumns]]:
+  """
+  (版本, id → MediaColumns)。换代时重建；后台探测陆续写入时最多每 5 秒重建一次。
+  版本每次重建 +1，排序缓存与 ETag 以它为键。
+  """
+  with _media_cols_lock:
+    c = _MEDIA_COLS
+    store_version, by_path = _PROBE_STORE.columns()
+    if c["id_map"] is id_map and (c["store_version"] == store_version
+                                  or time.time() - c["built_at"] < _MEDIA_COLS_REFRESH_SEC):
+      return c["version"], c["cols"]
+    cols: Dict[str, MediaColumns] = {}
+    for vid, v in id_map.items():
+      m = by_path.get(os.path.abspath(v.video_path)) if v.video_path else None
+      if m is None:
+        continue
+      fp = v.fp
+      if fp[4] and (m.mtime_ns != fp[3] or m.size != fp[4]):
+        continue
+      cols[vid] = m
+    c.update(id_map=id_map, store_version=store_version, built_at=time.time(),
+             version=c["version"] + 1, cols=cols)
+    return c["version"], cols
+
+# ---- 分类位图：分级 / 来源 / 朝向 / 编码族，组合筛选与分面计数都在位图上做 ----
+# 朝向与编码族取自探测列，随 _media_columns() 版本一起重建；其余属性只随换代变化。
+_facet_lock = threading.Lock()
+_FACETS = {"id_map": None, "media_version": -1, "index": None}
+_MEDIA_FACETS = ("orientation", "codec")
+
+def _facet_index(id_map: Dict[str, VideoItem]) -> Tuple[int, FacetIndex]:
+  """(探测列版本, FacetIndex)；同一代、同一探测列版本内复用。"""
+  media_version, media = _media_columns(id_map)
+  with _facet_lock:
+    c = _FACETS
+    if c["id_map"] is id_map and c["media_version"] == media_version:
+      return media_version, c["index"]
+  fi = FacetIndex(id_map, media.get)
+  with _facet_lock:
+    _FACETS.update(id_map=id_map, media_version=media_version, index=fi)
+  return media_version, fi
+
+def _narrow_facet(selection: Dict[str, Tuple[str, ...]], facet: str, values: Tuple[str, ...]) -> None:
+  """在已有选择上再收窄一个属性（同一属性的两次条件取交集）。"""
+  if facet in selection:
+    values = tuple(v for v in selection[facet] if v in values)
+  selection[facet] = values
+
+def _facet_selection(facet: List[str], media_terms: List["MediaFilterTerm"]) -> Dict[str, Tuple[str, ...]]:
+  """facet 参数 + q 里的 is:portrait / is:landscape（朝向条件改走位图，从 media_terms 中移除）。"""
+  selection = parse_facets(facet)
+  for t in [t for t in media_terms if t.key == "orient"]:
+    _narrow_facet(selection, "orientation", (t.value,))
+    media_terms.remove(t)
+  return selection
+
+def _facet_key(selection: Dict[str, Tuple[str, ...]]) -> tuple:
+  return tuple(sorted(selection.items()))
+
+def _uses_media_facets(selection: Dict[str, Tuple[str, ...]]) -> bool:
+  return any(f in selection for f in _MEDIA_FACETS)
+
+# sort_idx 6~11：按 (倒序, 正序) 成对，对应时长 / 像素数 / 码率
+_MEDIA_SORT_COLS = {
+  3: lambda m: m.duration,
+  4: lambda m: m.width * m.height,
+  5: lambda m: m.bit_rate,
+}
+SORT_IDX_MAX = 11
+
+def _is_media_sort(idx: int) -> bool:
+  return idx // 2 in _MEDIA_SORT_COLS
+
+def _sort_key(idx: int, media: Optional[Dict[str, MediaColumns]] = None):
+  """返回 (key(vid, v), 是否倒序)。媒体排序需传入 _media_columns() 的结果。"""
+  if idx == 0: return (lambda vid, v: v.mtime, True)
+  if idx == 1: return (lambda vid, v: v.mtime, False)
+  if idx == 2: return (lambda vid, v: v.size, True)
+  if idx == 3: return (lambda vid, v: v.size, False)
+  if idx == 4: return (lambda vid, v: v.title.casefold(), True)
+  if idx == 5 or not _is_media_sort(idx): return (lambda vid, v: v.title.casefold(), False)
+  col, media = _MEDIA_SORT_COLS[idx // 2], media or {}
+  rev = idx % 2 == 0
+  # 未知值在倒序/正序下都排最后
+  missing = float("-inf") if rev else float("inf")
+  def key(vid, v):
+    m = media.get(vid)
+    return col(m) if m is not None else missing
+  return (key, rev)
+
+# ---- 预计算排序：每代 id_map 每种排序键算一次「并列名次」，每个文件夹的排序结果缓存复用 ----
+# 名次相同 ⇔ 排序键相同，按名次做稳定排序与按原 key 排序结果完全一致（含并列项的先后）。
+# 带筛选的请求直接从已排好的列表里按顺序挑出命中项，不再排序。
+# 媒体排序的缓存键额外带上探测列版本，后台探测有新结果后自动换一份。
+_SORTED_CACHE_SIZE = 32
+_sort_cache_lock = threading.Lock()
+_SORT_CACHE = {"id_map": None, "ranks": {}, "lists": OrderedDict()}
+
+def _sort_ranks(id_map: Dict[str, VideoItem], sort_idx: int) -> Dict[str, int]:
+  """
+  id → 并列名次（升序）。sort_idx 按 (倒序, 正序) 成对，同一代 id_map 上每对共用一份；
+  媒体排序的未知项在倒序/正序下都排最后，两个方向分别计算。
+  """
+  media_version, media = _media_columns(id_map) if _is_media_sort(sort_idx) else (0, None)
+  key, _ = _sort_key(sort_idx, media)
+  ck = (sort_idx, media_version) if media is not None else sort_idx // 2
+  with _sort_cache_lock:
+    if _SORT_CACHE["id_map"] is not id_map:
+      _SORT_CACHE.update(id_map=id_map, ranks={}, lists=OrderedDict())
+    ranks = _SORT_CACHE["ranks"].get(ck)
+  if ranks is not None:
+    return ranks
+  keyed = sorted(((key(vid, v), vid) for vid, v in id_map.items()), key=lambda kv: kv[0])
+  ranks, r, prev = {}, -1, object()
+  for k, vid in keyed:
+    if r < 0 or k != prev:
+      r += 1
+      prev = k
+    ranks[vid] = r
+  with _sort_cache_lock:
+    if _SORT_CACHE["id_map"] is id_map:
+      cache = _SORT_CACHE["ranks"]
+      if media is not None:
+        for old in [c for c in cache if isinstance(c, tuple) and c[0] == sort_idx]:
+          del cache[old]
+      cache[ck] = ranks
+  return ranks
+
+def _sorted_ids(id_map: Dict[str, VideoItem], cache_key: tuple, ids_fn, sort_idx: int) -> List[str]:
+  """
+  按 sort_idx 排好序的 id 列表（同一代 id_map 内按 cache_key 缓存，调用方不得修改返回值）。
+  ids_fn() 给出待排序的 id（只应含 id_map 中存在的项），仅在未命中缓存时调用。
+  """
+  ck = cache_key + (sort_idx, _media_columns(id_map)[0] if _is_media_sort(sort_idx) else 0)
+  with _sort_cache_lock:
+    if _SORT_CACHE["id_map"] is id_map:
+      hit = _SORT_CACHE["lists"].get(ck)
+      if hit is not None:
+        _SORT_CACHE["lists"].move_to_end(ck)
+        return hit
+  ranks = _sort_ranks(id_map, sort_idx)
+  _, rev = _sort_key(sort_idx)
+  out = sorted(ids_fn(), key=ranks.__getitem__, reverse=rev)
+  with _sort_cache_lock:
+    if _SORT_CACHE["id_map"] is id_map:
+      lists = _SORT_CACHE["lists"]
+      lists[ck] = out
+      while len(lists) > _SORTED_CACHE_SIZE:
+        lists.popitem(last=False)
+  return out
 
 # ======== 扫描结果内存缓存（按需扫描：三源独立指纹检测）========
 # 将数据拆为三个独立源，各自有独立的 mtime 指纹 + 防抖，互不干扰：
@@ -414,6 +576,31 @@ SCAN_DEBOUNCE_SEC = float(os.getenv("SCAN_DEBOUNCE_SEC", "5"))
 SCAN_FINGERPRINT_INTERVAL = float(os.getenv("SCAN_FINGERPRINT_INTERVAL", "10"))
 # Steam 下载壁纸时目录可能先创建但文件尚未就位，pending 机制定期重试这些未完成项
 SCAN_PENDING_RECHECK_SEC = float(os.getenv("SCAN_PENDING_RECHECK_SEC", "30"))
+# 并发扫描：单项扫描是 open+json+若干 stat，网络挂载上主要耗在往返延迟，
+# 用有界线程池重叠等待。全量扫描总是并发；增量一次超过 SCAN_PARALLEL_MIN 项才并发。
+# auto：扫描根在网络挂载（SMB/NFS/FUSE）上用 8 线程，本地盘串行（本地盘上线程池只会更慢，见 webui/bench_scan.py）
+def _default_scan_workers() -> int:
+    return 8 if any(is_remote_fs(p) for p in (WORKSHOP_PATH, WE_PATH)) else 1
+
+_scan_workers_env = os.getenv("SCAN_WORKERS", "auto").strip().lower()
+SCAN_WORKERS = _default_scan_workers() if _scan_workers_env in ("", "auto") else max(1, int(_scan_workers_env))
+SCAN_PARALLEL_MIN = max(1, int(os.getenv("SCAN_PARALLEL_MIN", "16")))
+# 逐项指纹巡检间隔（秒）：发现 Steam 就地更新的项目（换视频、改标题），0 = 关闭定期巡检
+SCAN_ITEM_SWEEP_INTERVAL = float(os.getenv("SCAN_ITEM_SWEEP_INTERVAL", "600"))
+# inotify 变化通知：auto = Linux 本地文件系统上启用、网络挂载（SMB/NFS/FUSE）退回轮询；
+# 1 = 强制启用（宿主机本身就是写入方时也可用于网络挂载）；0 = 关闭，一律轮询指纹
+SCAN_INOTIFY = os.getenv("SCAN_INOTIFY", "auto").strip().lower()
+# /api/scan、/api/folder_videos 的浏览器缓存秒数：请求带上当前快照版本（cv）时可直接用缓存，
+# 不带或版本已过期时只允许带 If-None-Match 回源校验（304）；0 = 一律回源校验
+SCAN_HTTP_MAX_AGE = max(0, int(os.getenv("SCAN_HTTP_MAX_AGE", "300")))
+# UI 编辑文件夹（新建/移动/删除）后合并写回 config.json 的等待秒数：窗口内的连续编辑只写一次；0 = 每次编辑立即写
+CONFIG_WRITE_DELAY_SEC = max(0.0, float(os.getenv("CONFIG_WRITE_DELAY_SEC", "0.5")))
+# /api/scan/events 保活间隔（秒，同时是无 inotify 时服务端检查源指纹的节拍）与断线重连间隔（毫秒）
+SCAN_EVENTS_HEARTBEAT_SEC = max(1.0, float(os.getenv("SCAN_EVENTS_HEARTBEAT_SEC", "15")))
+SCAN_EVENTS_RETRY_MS = 5000
+
+def _scan_workers_for(n: int) -> int:
+    return SCAN_WORKERS if n >= SCAN_PARALLEL_MIN else 1
 
 _SCAN_LOCK = threading.RLock()
 
@@ -425,6 +612,10 @@ def _make_source():
         "last_fp_time": 0.0,
         "pending": set(),
         "pending_checked_at": 0.0,
+        # inotify 监听中：不再轮询指纹，由事件设置 change_at 并记录变化项
+        "watch": False,
+        "changed": set(),         # 事件报告的变化项键（增量扫描只碰这些）
+        "resync": False,          # 事件溢出/监听刚建立 → 下一轮整体比对目录清单
     }
 
 _SRC_CFG = _make_source()        # config.json 源
@@ -432,21 +623,39 @@ _SRC_CFG_DATA = {                 # config 源的扫描结果
     "we_cfg": {},
     "folder_roots": [],
     "items": {},                  # config-linked project videos
+    # 原始键 → 扫描结果（None = 文件缺失/缺预览，config 再变化时重试）；
+    # config 变化只扫新增键与指纹巡检报告变化的键，文件夹树单独重建
+    "linked": {},
+    "cfg_version": -1,            # 读取时 WeConfigManager 的版本，用于认领自己的写回
 }
 
+# fps：扫过的每个项目目录 → item_fingerprint（含非视频目录，避免反复重扫场景/网页壁纸）
 _SRC_WS = _make_source()         # workshop 源
-_SRC_WS_DATA = {"items": {}}
+_SRC_WS_DATA = {"items": {}, "fps": {}}
 
 _SRC_MP = _make_source()         # myprojects 源
-_SRC_MP_DATA = {"items": {}}
-
-_MERGED = {                       # 合并后的最终缓存
-    "valid": False,
-    "folder_roots": None,
-    "id_map": None,
-    "root_unassigned": None,
-    "path_map": None,
-}
+_SRC_MP_DATA = {"items": {}, "fps": {}}   # 键与 item.id 一致："mp:<目录名>"
+
+# ---- 已发布的目录快照（stale-while-revalidate）----
+# 三源合并结果打包成不可变快照整体替换发布；读者只取 _CATALOG 引用，从不等扫描锁。
+# 重扫由后台 worker 在持锁状态下完成，完成前读者继续拿上一代快照。
+# generation 每次发布 +1，其它缓存可以用它做键。
+class CatalogSnapshot(NamedTuple):
+  generation: int
+  folder_roots: list
+  id_map: Dict[str, VideoItem]
+  root_unassigned: List[str]
+  folder_index: FolderIndex       # 路径 → 节点 + 子树 id 区间
+  built_at: float
+
+_CATALOG = None                   # Optional[CatalogSnapshot]
+# 进程启动标识：generation 每次启动都从 1 重新计数，拼上它才能跨重启区分快照
+_BOOT_ID = secrets.token_hex(4)
+_RESCAN_WAKE = threading.Event()  # 唤醒后台 worker 检查三源是否变化
+_reader_wake_at = 0.0             # 读者上次唤醒 worker 的 monotonic 时间
+
+# 标题/上传者倒排索引（/api/scan 的 q 筛选），随三源合并增量维护
+_TEXT_INDEX = TextIndex()
 
 # ---- 指纹采集（每个源只 stat 自己关心的路径）----
 
@@ -458,6 +667,15 @@ def _fp_config():
     except OSError:
         return (0, 0)
 
+def _config_written(version: int, fp):
+    """WeConfigManager 写回 config.json 后：config 源已经是这份内容时直接认领新指纹，不再重读一遍。"""
+    with _SCAN_LOCK:
+        if not _SRC_CFG["dirty"] and _SRC_CFG_DATA["cfg_version"] == version:
+            _SRC_CFG["fp"] = fp
+
+# config.json 的解析结果缓存在内存里，UI 编辑直接改内存副本并合并写回
+_WE_CONFIG = config_manager(WE_PATH, write_delay=CONFIG_WRITE_DELAY_SEC, on_write=_config_written)
+
 def _fp_workshop():
     try:
         st = os.stat(WORKSHOP_PATH)
@@ -497,6 +715,16 @@ def _check_source(src: dict, fp_fn) -> bool:
     if src["pending"] and (now - src["pending_checked_at"]) >= SCAN_PENDING_RECHECK_SEC:
         src["dirty"] = True
         return True
+    if src["watch"]:
+        # inotify：事件到达时已记下 change_at，这里只做防抖判定，不碰文件系统
+        if src["change_at"] == 0.0 or now - src["change_at"] < SCAN_DEBOUNCE_SEC:
+            return False
+        src["change_at"] = 0.0
+        # 只有根指纹可比的源（config.json）：自身写入引起的事件在重读后指纹已一致
+        if not (src["changed"] or src["resync"]) and fp_fn() == src["fp"]:
+            return False
+        src["dirty"] = True
+        return True
     if now - src["last_fp_time"] < SCAN_FINGERPRINT_INTERVAL:
         return False
     fp = fp_fn()
@@ -519,223 +747,664 @@ def _finish_source(src: dict, fp_fn):
     src["fp"] = fp_fn()
     src["last_fp_time"] = time.time()
     src["change_at"] = 0.0
+    src["changed"] = set()
+    src["resync"] = False
+
+def _touched_keys(src: dict, full: bool):
+    """inotify 监听中的增量扫描只需处理事件报告的项 + pending；返回 None 表示整体比对目录清单。"""
+    if full or not src["watch"] or src["resync"]:
+        return None
+    return src["changed"] | src["pending"]
+
+def _existing_item_dirs(keys, dir_of) -> Dict[str, str]:
+    out = {}
+    for k in keys:
+        d = dir_of(k)
+        if os.path.isdir(d) and not os.path.islink(d):
+            out[k] = d
+    return out
+
+def _sync_source_items(src: dict, data: dict, current: Dict[str, str], scan_fn, full: bool,
+                       touched=None):
+    """
+    按目录清单 + 逐项指纹同步单个源（调用方需持有 _SCAN_LOCK）：
+      - 消失的目录 → 删除；新增目录与 pending 中的项 → 重扫
+      - 重扫后不是视频的目录只记下指纹；指纹仍在变（下载中）的放进 pending 下轮重试
+    current: {键: 项目目录}；scan_fn(键集合) → {键: VideoItem | None}。
+    full=True 为首次全量扫描，非视频目录直接记指纹不进 pending。
+    touched 不为 None 时（inotify 给出了确切变化项）current 只含 touched 中仍存在的目录，
+    只删除/重扫这些项，其余保持不动。重扫结果与原项内容相同时沿用原对象。
+    返回 (重扫成功数, 删除数, pending, 项是否有变化)；指纹/pending 的变化不算（不影响快照内容）。
+    """
+    items, fps = data["items"], data["fps"]
+    known = set(fps) | set(items)
+    if touched is None:
+        removed = known - current.keys()
+        to_scan = (current.keys() - known) | (src["pending"] & current.keys())
+    else:
+        removed = (touched & known) - current.keys()
+        to_scan = set(current)
+    changed = False
+    for k in removed:
+        if items.pop(k, None) is not None:
+            changed = True
+        fps.pop(k, None)
+
+    scanned, pending = 0, set()
+    for k, item in scan_fn(to_scan).items():
+        if item:
+            old = items.get(k)
+            if old is None or old != item:
+                items[k] = item
+                changed = True
+            fps[k] = item.fp
+            scanned += 1
+            continue
+        if items.pop(k, None) is not None:
+            changed = True
+        live = item_fingerprint(current[k])
+        if not full and live != fps.get(k):
+            pending.add(k)
+        fps[k] = live
+    src["pending"] = pending
+    src["pending_checked_at"] = time.time()
+    return scanned, len(removed), pending, changed
+
+def _sync_config_linked(keys: Dict[str, str]):
+    """
+    按原始键集合（config_linked_video_keys 的结果）增量同步 config 链接视频（调用方需持有 _SCAN_LOCK）：
+    只扫新增键、上次未扫到的键与 pending（指纹巡检报告变化）中的键，删掉的键直接丢弃，
+    其余沿用缓存，UI 里移动一个视频不再把所有链接文件重新 stat / 读 project.json。
+    返回合成后的链接项是否有变化（内容相同的项沿用旧对象，逐个比身份即可）。
+    """
+    cache = _SRC_CFG_DATA["linked"]
+    pending = _SRC_CFG["pending"]
+    todo = {k: rel for k, rel in keys.items() if cache.get(k) is None or k in pending}
+    scanned = {}
+    if todo:
+        try:
+            scanned = scan_config_linked_keys(WE_PATH, todo, _scan_workers_for(len(todo)))
+        except Exception as e:
+            print(f"[scan] ⚠ 扫描 config 链接项失败: {e}")
+    removed = len(cache.keys() - keys.keys())
+    linked = {k: scanned[k] if k in scanned else cache.get(k) for k in keys}
+    prev_items = _SRC_CFG_DATA["items"]
+    items = merge_config_linked_items(linked, prev_items)
+    _SRC_CFG_DATA["linked"] = linked
+    _SRC_CFG_DATA["items"] = items
+    _SRC_CFG["pending"] = set()
+    _SRC_CFG["pending_checked_at"] = time.time()
+    if cache or todo:
+        _log_source_sync("config 链接项", sum(1 for v in scanned.values() if v), removed, set())
+    return items.keys() != prev_items.keys() or any(v is not prev_items[k] for k, v in items.items())
+
+def _linked_cache_from_items(items: Dict[str, VideoItem]) -> Dict[str, VideoItem]:
+    """由合成后的链接项还原「原始键 → 项」缓存（快照恢复用；别名键指向同一项）。"""
+    return {k: v for v in items.values() for k in (v.we_config_key, *v.we_config_key_aliases)}
+
+def _log_source_sync(name: str, scanned: int, removed: int, pending: set):
+    parts = []
+    if scanned: parts.append(f"+{scanned}")
+    if removed: parts.append(f"-{removed}")
+    if pending: parts.append(f"待完成:{len(pending)}")
+    print(f"[scan] {name} 增量扫描: {' '.join(parts) or '无变化'}")
+
+# ---- 三源合并 ----
+
+def _merge_sources() -> dict:
+    """把三源数据合并成新一代快照并发布（调用方需持有 _SCAN_LOCK），返回合并后的 id_map。"""
+    global _CATALOG
+    folder_roots = _SRC_CFG_DATA["folder_roots"]
+    id_map = {}
+    id_map.update(_SRC_WS_DATA["items"])
+    id_map.update(_SRC_MP_DATA["items"])
+    id_map.update(_SRC_CFG_DATA["items"])
+
+    folder_index = FolderIndex(folder_roots, id_map)
+    _TEXT_INDEX.update(id_map)
+    prev = _CATALOG
+    _CATALOG = CatalogSnapshot(
+        generation=(prev.generation + 1) if prev else 1,
+        folder_roots=folder_roots, id_map=id_map,
+        root_unassigned=folder_index.root_unassigned, folder_index=folder_index,
+        built_at=time.time(),
+    )
 
-# ---- 主扫描入口 ----
+    schedule_steam_author_enrich(id_map)
+    _schedule_media_probe(id_map, prev.id_map if prev else None)
+    _schedule_preview_pregen(id_map, prev.id_map if prev else None)
+    _schedule_preview_lqip(id_map, prev.id_map if prev else None)
+    return id_map
+
+def _wake_rescan_throttled():
+    """
+    读者触发的源检查，至多每 SCAN_FINGERPRINT_INTERVAL 秒一次：指纹本就按该间隔限频，
+    更密的唤醒只会让 worker 空转一轮加锁检查（媒体/HLS 请求每秒可达数百次）。
+    """
+    global _reader_wake_at
+    now = time.monotonic()
+    if now - _reader_wake_at >= max(1.0, SCAN_FINGERPRINT_INTERVAL):
+        _reader_wake_at = now
+        _RESCAN_WAKE.set()
+
+def _catalog() -> CatalogSnapshot:
+    """
+    读者入口：返回最新发布的快照，不取扫描锁；顺带（限频）唤醒后台 worker 检查三源变化，
+    有变化时由 worker 重扫并发布下一代。只有启动后尚无任何快照时才等待首次扫描。
+    """
+    _wake_rescan_throttled()
+    snap = _CATALOG
+    if snap is None:
+        snap = _refresh_catalog()
+    return snap
 
 def _scan_state():
+    """兼容旧调用：(folder_roots, id_map, root_unassigned)，取自最新快照。"""
+    snap = _catalog()
+    return snap.folder_roots, snap.id_map, snap.root_unassigned
+
+# ---- 持久化快照：重启后先恢复，再后台增量复核 ----
+# 快照里保存三源 items、逐项指纹、文件夹树和三源指纹；
+# 启动时直接发布快照，随后：
+#   - 三源指纹与快照不一致 → 照常走防抖 + 增量扫描（目录增删）
+#   - 逐项指纹巡检（_sweep_item_changes）发现的变化项 → 放进该源 pending，只重扫这些项
+CATALOG_DB = os.getenv("CATALOG_DB", os.path.join(DATA_DIR, "catalog.db"))
+CATALOG_SAVE_DELAY_SEC = float(os.getenv("CATALOG_SAVE_DELAY_SEC", "3"))
+
+_catalog_save_guard = threading.Lock()
+_catalog_save_timer = None
+_CATALOG_STATE = {"restored": False, "restored_items": 0, "restore_ms": 0.0, "saved_at": 0.0}
+
+def _catalog_roots() -> dict:
+    return {"workshop": WORKSHOP_PATH, "we": WE_PATH}
+
+def _catalog_snapshot_data() -> dict:
+    with _SCAN_LOCK:
+        we_cfg = _SRC_CFG_DATA.get("we_cfg") or {}
+        return {
+            "roots": _catalog_roots(),
+            "sources": {
+                "config": {"fp": _SRC_CFG["fp"], "pending": set(_SRC_CFG["pending"])},
+                "workshop": {"fp": _SRC_WS["fp"], "pending": set(_SRC_WS["pending"])},
+                "myprojects": {"fp": _SRC_MP["fp"], "pending": set(_SRC_MP["pending"])},
+            },
+            "install_dir": str(we_cfg.get("?installdirectory") or "") if isinstance(we_cfg, dict) else "",
+            "folder_roots": list(_SRC_CFG_DATA.get("folder_roots") or []),
+            "items": {
+                "config": dict(_SRC_CFG_DATA["items"]),
+                "workshop": dict(_SRC_WS_DATA["items"]),
+                "myprojects": dict(_SRC_MP_DATA["items"]),
+            },
+            "fps": {
+                "workshop": dict(_SRC_WS_DATA["fps"]),
+                "myprojects": dict(_SRC_MP_DATA["fps"]),
+            },
+        }
+
+def _save_catalog_snapshot():
+    try:
+        catalog_save_snapshot(CATALOG_DB, _catalog_snapshot_data())
+        _CATALOG_STATE["saved_at"] = time.time()
+    except Exception as e:
+        print(f"[catalog] ⚠ 保存快照失败: {e}")
+
+def _schedule_catalog_save():
+    """扫描完成后延迟落盘（连续多次扫描只写最后一次）。"""
+    global _catalog_save_timer
+    with _catalog_save_guard:
+        if _catalog_save_timer is not None:
+            _catalog_save_timer.cancel()
+        t = threading.Timer(CATALOG_SAVE_DELAY_SEC, _save_catalog_snapshot)
+        t.daemon = True
+        _catalog_save_timer = t
+        t.start()
+
+def _restore_catalog_snapshot() -> bool:
+    """启动时从快照恢复三源数据并发布合并结果；成功返回 True。"""
+    t0 = time.time()
+    try:
+        snap = catalog_load_snapshot(CATALOG_DB, _catalog_roots())
+    except Exception as e:
+        print(f"[catalog] ⚠ 读取快照失败: {e}")
+        snap = None
+    if not snap:
+        return False
+    with _SCAN_LOCK:
+        if _CATALOG is not None:
+            return False
+        _SRC_CFG_DATA.update(
+            # 快照只保存 myprojects 扫描用到的 ?installdirectory；config 变化后会整体重读
+            we_cfg={"?installdirectory": snap["install_dir"]} if snap["install_dir"] else {},
+            folder_roots=snap["folder_roots"],
+            items=snap["items"]["config"],
+            linked=_linked_cache_from_items(snap["items"]["config"]),
+        )
+        _SRC_WS_DATA.update(items=snap["items"]["workshop"], fps=snap["fps"]["workshop"])
+        _SRC_MP_DATA.update(items=snap["items"]["myprojects"], fps=snap["fps"]["myprojects"])
+        for name, src in (("config", _SRC_CFG), ("workshop", _SRC_WS), ("myprojects", _SRC_MP)):
+            st = snap["sources"][name]
+            src.update(dirty=st["fp"] is None, fp=st["fp"], change_at=0.0,
+                       last_fp_time=0.0, pending=set(st["pending"]), pending_checked_at=0.0)
+        id_map = _merge_sources()
+    _CATALOG_STATE.update(restored=True, restored_items=len(id_map),
+                          restore_ms=round((time.time() - t0) * 1000, 1))
+    print(f"[catalog] 已从快照恢复 {len(id_map)} 个视频项（{_CATALOG_STATE['restore_ms']} ms），后台复核中 ...")
+    return True
+
+# ---- 逐项指纹巡检：发现就地修改（目录名不变，内容变了）----
+
+_SWEEP_LOCK = threading.Lock()
+_SWEEP_STATE = {"runs": 0, "last_at": 0.0, "last_ms": 0.0, "checked": 0, "changed": 0}
+
+def _sweep_item_changes() -> int:
+    """
+    逐项重算指纹（不持锁 stat），与记录不一致的项放进所属源的 pending 并标记 dirty，
+    下一次 _refresh_catalog 只重扫这些项（config 链接项按原始键记入 pending，随 config 源重扫）。
+    返回变化项数。
+    """
+    if not _SWEEP_LOCK.acquire(blocking=False):
+        return 0  # 已有巡检在跑
+    try:
+        t0 = time.time()
+        mp_root = os.path.join(WE_PATH, "projects", "myprojects")
+        with _SCAN_LOCK:
+            # (源, 键, 项目目录, 视频路径, 记录的指纹)
+            entries = []
+            for src, data, dir_of in (
+                    (_SRC_WS, _SRC_WS_DATA, lambda k: os.path.join(WORKSHOP_PATH, k)),
+                    (_SRC_MP, _SRC_MP_DATA, lambda k: os.path.join(mp_root, k[3:]))):
+                items = data["items"]
+                for k, fp in data["fps"].items():
+                    v = items.get(k)
+                    entries.append((src, k, dir_of(k), v.video_path if v else "", fp))
+            for k, v in _SRC_CFG_DATA["linked"].items():
+                if v is not None:
+                    entries.append((_SRC_CFG, k, os.path.dirname(v.video_path), v.video_path, v.fp))
+
+        lives = parallel_map(lambda e: item_fingerprint(e[2], e[3]), entries,
+                             _scan_workers_for(len(entries)))
+        changed = [e for e, live in zip(entries, lives) if live != e[4]]
+
+        with _SCAN_LOCK:
+            for src, k, _, _, _ in changed:
+                src["pending"].add(k)
+                src["dirty"] = True
+        n_ws = sum(1 for e in changed if e[0] is _SRC_WS)
+        n_mp = sum(1 for e in changed if e[0] is _SRC_MP)
+        n_cfg = len(changed) - n_ws - n_mp
+        _SWEEP_STATE.update(runs=_SWEEP_STATE["runs"] + 1, last_at=time.time(),
+                            last_ms=round((time.time() - t0) * 1000, 1),
+                            checked=len(entries), changed=len(changed))
+        if changed:
+            print(f"[scan] 指纹巡检：workshop 变化 {n_ws}，myprojects 变化 {n_mp}"
+                  f"{'，config 链接项变化 ' + str(n_cfg) if n_cfg else ''}（共检查 {len(entries)} 项）")
+        return len(changed)
+    finally:
+        _SWEEP_LOCK.release()
+
+def _item_sweep_loop():
+    while True:
+        time.sleep(SCAN_ITEM_SWEEP_INTERVAL)
+        try:
+            if _CATALOG is not None and _sweep_item_changes():
+                _refresh_catalog()
+        except Exception as e:
+            print(f"[scan] ⚠ 指纹巡检失败: {e}")
+
+# ---- inotify：本地文件系统上由内核推送变化，替代指纹轮询 ----
+
+_WATCHERS: Dict[str, TreeWatcher] = {}
+_WATCH_STATE: Dict[str, dict] = {}
+
+def _on_watch_event(name: str, src: dict, key_of, watcher: TreeWatcher, names):
+    with _SCAN_LOCK:
+        if names is None:
+            src["resync"] = True
+        elif key_of is not None:
+            src["changed"] |= {key_of(n) for n in names}
+        if src["change_at"] == 0.0:
+            src["change_at"] = time.time()
+        _RESCAN_WAKE.set()   # worker 会等到防抖结束再重扫，无需等下一个请求
+        if src["watch"] and not watcher.alive:
+            # 根目录被删/移走/卸载 → 退回指纹轮询，并立即整体比对一次
+            src.update(watch=False, dirty=True, last_fp_time=0.0)
+            _WATCH_STATE[name] = {"mode": "polling", "reason": watcher.error}
+            print(f"[watch] ⚠ {name} 监听失效（{watcher.error}），改为指纹轮询")
+
+def _start_scan_watchers():
+    """为三源建立 inotify 监听；不可用的源保持原有指纹轮询。建立后整体比对一次，补上建立前的变化。"""
+    mp_root = os.path.join(WE_PATH, "projects", "myprojects")
+    specs = (
+        ("config", _SRC_CFG, WE_PATH, lambda n: n == "config.json", False, None),
+        ("workshop", _SRC_WS, WORKSHOP_PATH, lambda n: n.isdigit(), True, lambda n: n),
+        ("myprojects", _SRC_MP, mp_root,
+         lambda n: not n.startswith(".") and ".." not in n, True, lambda n: f"mp:{n}"),
+    )
+    for name, src, root, accept, children, key_of in specs:
+        if SCAN_INOTIFY in ("0", "off", "false", "no"):
+            _WATCH_STATE[name] = {"mode": "polling", "reason": "SCAN_INOTIFY=0"}
+            continue
+        if not inotify_available():
+            _WATCH_STATE[name] = {"mode": "polling", "reason": "inotify 不可用"}
+            continue
+        if not os.path.isdir(root):
+            _WATCH_STATE[name] = {"mode": "polling", "reason": "目录不存在"}
+            continue
+        fstype = mount_fs_type(root)
+        if SCAN_INOTIFY == "auto" and is_remote_fs(root):
+            _WATCH_STATE[name] = {"mode": "polling", "reason": f"{fstype} 挂载不支持 inotify"}
+            print(f"[watch] {name} 位于 {fstype} 挂载，保持指纹轮询")
+            continue
+        t0 = time.time()
+        w = TreeWatcher(root, accept, lambda names: None, children)
+        w.on_event = (lambda names, name=name, src=src, key_of=key_of, w=w:
+                      _on_watch_event(name, src, key_of, w, names))
+        if not w.start():
+            _WATCH_STATE[name] = {"mode": "polling", "reason": w.error}
+            print(f"[watch] ⚠ {name} 建立 inotify 失败（{w.error}），保持指纹轮询")
+            continue
+        _WATCHERS[name] = w
+        _WATCH_STATE[name] = {"mode": "inotify", "fs": fstype}
+        with _SCAN_LOCK:
+            src.update(watch=True, resync=True, dirty=True)
+        print(f"[watch] {name} 使用 inotify（{w.watches} 个 watch，{(time.time() - t0) * 1000:.0f} ms）")
+
+def _startup_scan(restored: bool):
+    """启动扫描：先建立 inotify 监听；已从快照恢复则检查三源指纹并逐项巡检，否则直接全量扫描。"""
+    _start_scan_watchers()
+    _refresh_catalog()
+    if restored and _sweep_item_changes():
+        _refresh_catalog()
+
+# ---- 后台重扫 worker ----
+
+def _debounce_wait_sec():
+    """有源处于防抖期时返回距防抖结束的秒数（worker 届时自行醒来重扫），否则 None。"""
+    now = time.time()
+    waits = [src["change_at"] + SCAN_DEBOUNCE_SEC - now
+             for src in (_SRC_CFG, _SRC_WS, _SRC_MP) if src["change_at"]]
+    return max(0.05, min(waits)) if waits else None
+
+def _catalog_worker():
+    while True:
+        with _SCAN_LOCK:
+            timeout = _debounce_wait_sec()
+        _RESCAN_WAKE.wait(timeout)
+        _RESCAN_WAKE.clear()
+        try:
+            _refresh_catalog()
+        except Exception as e:
+            print(f"[scan] ⚠ 后台重扫失败: {e}")
+        time.sleep(0.05)   # 读者密集时合并唤醒
+
+# ---- 主扫描入口（只由后台线程或写操作调用，读者用 _catalog()）----
+
+def _refresh_catalog() -> CatalogSnapshot:
+    """检查三源变化，按需重扫并发布新一代快照；无变化时直接返回当前快照。"""
     with _SCAN_LOCK:
         cfg_dirty = _check_source(_SRC_CFG, _fp_config)
         ws_dirty = _check_source(_SRC_WS, _fp_workshop)
         mp_dirty = _check_source(_SRC_MP, _fp_myprojects)
         any_dirty = cfg_dirty or ws_dirty or mp_dirty
 
-        if not any_dirty and _MERGED["valid"]:
-            return _MERGED["folder_roots"], _MERGED["id_map"], _MERGED["root_unassigned"]
+        if not any_dirty and _CATALOG is not None:
+            return _CATALOG
+        # 重扫后项与文件夹树都没变（pending 定期重试、无效的 inotify 事件、手动刷新）就不发布新一代：
+        # 换代会让所有 ETag / cv 缓存失效，并推 SSE 让每个在线页面重载网格
+        content_changed = False
 
         # --- 按需扫描各源（只扫描变化的部分）---
         if cfg_dirty:
-            print("[scan] config.json 变化，重新读取配置与 linked-projects ...")
+            print("[scan] config.json 变化，重新读取配置 ...")
+            # 配置本体留在 WeConfigManager 里，这里只取文件夹树、链接键与 myprojects 要用的安装目录
             try:
-                we_cfg = load_we_config(WE_PATH)
-                folders_list = extract_folders_list(we_cfg)
-                folder_roots = build_folder_tree(folders_list)
+                with _WE_CONFIG.reading() as cfg:
+                    if not isinstance(cfg, dict):
+                        raise ValueError("config.json 顶层不是对象")
+                    cfg_version = _WE_CONFIG.version
+                    folder_roots = build_folder_tree(extract_folders_list(cfg))
+                    linked_keys = config_linked_video_keys(cfg)
+                    install_dir = cfg.get("?installdirectory")
+                we_cfg = {"?installdirectory": install_dir} if install_dir else {}
             except Exception as e:
                 print(f"[scan] ⚠ 读取 config.json 失败: {e}")
                 print(f"[scan]   WE_PATH={WE_PATH!r}, config.json 路径={os.path.join(WE_PATH, 'config.json')!r}")
                 print(f"[scan]   WE_PATH 是否存在: {os.path.isdir(WE_PATH)}")
-                we_cfg = {}
-                folder_roots = []
-            linked = {}
-            try:
-                linked = dict(scan_config_linked_project_videos(
-                    WE_PATH, we_cfg if isinstance(we_cfg, dict) else {}))
-            except Exception:
-                pass
-            _SRC_CFG_DATA.update(we_cfg=we_cfg, folder_roots=folder_roots, items=linked)
+                cfg_version, we_cfg, folder_roots, linked_keys = -1, {}, [], {}
+            if _sync_config_linked(linked_keys) or folder_roots != _SRC_CFG_DATA["folder_roots"]:
+                content_changed = True
+            _SRC_CFG_DATA.update(we_cfg=we_cfg, folder_roots=folder_roots, cfg_version=cfg_version)
             _finish_source(_SRC_CFG, _fp_config)
 
         if ws_dirty:
-            old_items = _SRC_WS_DATA["items"]
-            if not old_items:
+            full = not _SRC_WS_DATA["fps"]
+            if full:
                 print("[scan] workshop 首次全量扫描 ...")
                 if not os.path.isdir(WORKSHOP_PATH):
                     print(f"[scan] ⚠ WORKSHOP_PATH 不存在或不是目录: {WORKSHOP_PATH!r}")
-                _SRC_WS_DATA["items"] = dict(scan_workshop_items(WORKSHOP_PATH))
+            # 只列根目录取目录名，diff 出新增/删除；就地修改由指纹巡检放进 pending。
+            # inotify 监听中则连根目录都不列，只看事件报告的项
+            touched = _touched_keys(_SRC_WS, full)
+            if touched is not None:
+                current = _existing_item_dirs(touched, lambda k: os.path.join(WORKSHOP_PATH, k))
             else:
-                # 增量：只列根目录取目录名，diff 出新增/删除
-                current_dirs = set()
+                current = {}
                 try:
                     with os.scandir(WORKSHOP_PATH) as entries:
                         for e in entries:
                             if e.is_dir(follow_symlinks=False) and e.name.isdigit():
-                                current_dirs.add(e.name)
+                                current[e.name] = e.path
                 except Exception:
                     pass
-                old_ids = set(old_items.keys())
-                added = current_dirs - old_ids
-                removed = old_ids - current_dirs
-                to_scan = added | _SRC_WS["pending"]
-
-                for rid in removed:
-                    old_items.pop(rid, None)
-
-                scanned, pending = 0, set()
-                for nid in to_scan:
-                    if nid not in current_dirs:
-                        continue
-                    item = scan_single_workshop_item(WORKSHOP_PATH, nid)
-                    if item:
-                        old_items[nid] = item
-                        scanned += 1
-                    else:
-                        pending.add(nid)
-
-                _SRC_WS["pending"] = pending
-                _SRC_WS["pending_checked_at"] = time.time()
-                parts = []
-                if scanned: parts.append(f"+{scanned}")
-                if removed: parts.append(f"-{len(removed)}")
-                if pending: parts.append(f"待完成:{len(pending)}")
-                print(f"[scan] workshop 增量扫描: {' '.join(parts) or '无变化'}")
+            scanned, removed, pending, items_changed = _sync_source_items(
+                _SRC_WS, _SRC_WS_DATA, current,
+                lambda keys: scan_workshop_ids(WORKSHOP_PATH, keys, _scan_workers_for(len(keys))),
+                full, touched)
+            content_changed |= items_changed
+            if not full:
+                _log_source_sync("workshop", scanned, removed, pending)
 
             _finish_source(_SRC_WS, _fp_workshop)
 
         if mp_dirty:
             we_cfg = _SRC_CFG_DATA.get("we_cfg", {})
-            old_items = _SRC_MP_DATA["items"]
-            if not old_items:
+            we_cfg = we_cfg if isinstance(we_cfg, dict) else {}
+            mp_root = os.path.join(WE_PATH, "projects", "myprojects")
+            full = not _SRC_MP_DATA["fps"]
+            if full:
                 print("[scan] myprojects 首次全量扫描 ...")
-                mp_root = os.path.join(WE_PATH, "projects", "myprojects")
                 if not os.path.isdir(mp_root):
                     print(f"[scan] ⚠ myprojects 目录不存在: {mp_root!r}")
-                try:
-                    _SRC_MP_DATA["items"] = dict(
-                        scan_myprojects_items(WE_PATH, we_cfg if isinstance(we_cfg, dict) else {}))
-                except Exception:
-                    _SRC_MP_DATA["items"] = {}
+            touched = _touched_keys(_SRC_MP, full)
+            if touched is not None:
+                current = _existing_item_dirs(touched, lambda k: os.path.join(mp_root, k[3:]))
             else:
-                mp_root = os.path.join(WE_PATH, "projects", "myprojects")
-                current_dirs = set()
+                current = {}
                 try:
                     with os.scandir(mp_root) as entries:
                         for e in entries:
                             if e.is_dir(follow_symlinks=False) and not e.name.startswith(".") and ".." not in e.name:
-                                current_dirs.add(e.name)
+                                current[f"mp:{e.name}"] = e.path
                 except Exception:
                     pass
-                old_ids = {k[3:] for k in old_items.keys()}  # "mp:xxx" → "xxx"
-                added = current_dirs - old_ids
-                removed = old_ids - current_dirs
-                pending_dirs = {p[3:] if p.startswith("mp:") else p for p in _SRC_MP["pending"]}
-                to_scan = added | pending_dirs
-
-                for rdir in removed:
-                    old_items.pop(f"mp:{rdir}", None)
-
-                scanned, pending = 0, set()
-                for ndir in to_scan:
-                    if ndir not in current_dirs:
-                        continue
-                    item = scan_single_myproject_item(WE_PATH, we_cfg if isinstance(we_cfg, dict) else {}, ndir)
-                    if item:
-                        old_items[item.id] = item
-                        scanned += 1
-                    else:
-                        pending.add(f"mp:{ndir}")
-
-                _SRC_MP["pending"] = pending
-                _SRC_MP["pending_checked_at"] = time.time()
-                parts = []
-                if scanned: parts.append(f"+{scanned}")
-                if removed: parts.append(f"-{len(removed)}")
-                if pending: parts.append(f"待完成:{len(pending)}")
-                print(f"[scan] myprojects 增量扫描: {' '.join(parts) or '无变化'}")
 
-            _finish_source(_SRC_MP, _fp_myprojects)
+            def _scan_mp(keys):
+                found = scan_myproject_dirs(WE_PATH, we_cfg, {k[3:] for k in keys},
+                                            _scan_workers_for(len(keys)))
+                return {f"mp:{name}": item for name, item in found.items()}
 
-        # --- 合并三源结果 ---
-        folder_roots = _SRC_CFG_DATA["folder_roots"]
-        id_map = {}
-        id_map.update(_SRC_WS_DATA["items"])
-        id_map.update(_SRC_MP_DATA["items"])
-        id_map.update(_SRC_CFG_DATA["items"])
-
-        root_unassigned = collect_unassigned_items(id_map, folder_roots)
-
-        def _build_path_map():
-            path_map = {}
-            def rec(parts: List[str], subfolders, vids):
-                path_str = "/" + "/".join(parts) if parts else "/"
-                all_vids = list(vids)
-                for sf in (subfolders or []):
-                    child_parts = parts + [sf.title]
-                    child_subfolders, child_vids = find_node_by_path(folder_roots, child_parts)
-                    _, _, child_all = rec(child_parts, child_subfolders, child_vids)
-                    all_vids.extend(child_all)
-                path_map[path_str] = {"subfolders": subfolders, "vids": list(vids), "all_vids": all_vids}
-                return subfolders, vids, all_vids
-            rec([], folder_roots, root_unassigned[:])
-            return path_map
-
-        path_map = _build_path_map()
-        _MERGED.update(valid=True, folder_roots=folder_roots, id_map=id_map,
-                       root_unassigned=root_unassigned, path_map=path_map)
-
-        schedule_steam_author_enrich(id_map)
+            scanned, removed, pending, items_changed = _sync_source_items(
+                _SRC_MP, _SRC_MP_DATA, current, _scan_mp, full, touched)
+            content_changed |= items_changed
+            if not full:
+                _log_source_sync("myprojects", scanned, removed, pending)
+
+            _finish_source(_SRC_MP, _fp_myprojects)
 
         changed = []
         if cfg_dirty: changed.append("config")
         if ws_dirty: changed.append("workshop")
         if mp_dirty: changed.append("myprojects")
-        print(f"[scan] 扫描完成 [{'+'.join(changed)}]，共 {len(id_map)} 个视频项")
+        # 源指纹 / pending 仍要落盘，下次启动从这里接着巡检
+        _schedule_catalog_save()
+        if not content_changed and _CATALOG is not None:
+            print(f"[scan] 扫描完成 [{'+'.join(changed)}]，内容无变化（仍为第 {_CATALOG.generation} 代）")
+            return _CATALOG
+
+        # --- 合并三源结果 ---
+        id_map = _merge_sources()
+        print(f"[scan] 扫描完成 [{'+'.join(changed)}]，共 {len(id_map)} 个视频项（第 {_CATALOG.generation} 代）")
+        _publish_catalog_event(changed)
 
-        return _MERGED["folder_roots"], _MERGED["id_map"], _MERGED["root_unassigned"]
+        return _CATALOG
 
 
 def _invalidate_scan_cache():
-    """使所有扫描源失效并清空数据（供前端「刷新」按钮调用，下次走全量扫描）。"""
+    """使所有扫描源失效并清空数据（/api/scan/refresh?full=1，下次走全量扫描）。已发布的快照不受影响。"""
     with _SCAN_LOCK:
         for src in (_SRC_CFG, _SRC_WS, _SRC_MP):
             src["dirty"] = True
             src["change_at"] = 0.0
             src["pending"] = set()
-        _SRC_WS_DATA["items"] = {}
-        _SRC_MP_DATA["items"] = {}
-        _MERGED["valid"] = False
-        _MERGED["path_map"] = None
+        _SRC_CFG_DATA.update(linked={})
+        _SRC_WS_DATA.update(items={}, fps={})
+        _SRC_MP_DATA.update(items={}, fps={})
 
 def _invalidate_config_cache():
-    """仅使 config.json 源失效（供 UI 端文件夹增删移动后调用，不触发 workshop/myprojects 重扫描）。"""
+    """
+    UI 端文件夹增删移动写完 config.json 后调用：只重读 config 源（不触发 workshop/myprojects 重扫描），
+    并同步发布新快照，保证前端随后的请求能看到自己的修改。
+    """
     with _SCAN_LOCK:
         _SRC_CFG["dirty"] = True
         _SRC_CFG["change_at"] = 0.0
-        _MERGED["valid"] = False
-        _MERGED["path_map"] = None
+        _refresh_catalog()
 
 @app.post("/api/scan/refresh")
-def api_scan_refresh():
-    """使扫描缓存失效，下次 /api/scan 将重新扫描文件列表。供前端「刷新」按钮调用。"""
-    _invalidate_scan_cache()
-    return {"ok": True}
+def api_scan_refresh(full: int = 0):
+    """
+    供前端「刷新」按钮调用。默认增量：逐项指纹巡检 + 三源目录重新 diff，只重扫变化项；
+    full=1 时清空缓存走全量扫描。
+    用户主动点的刷新同步完成重扫，返回时新快照已发布；重扫后内容无变化则不换代，generation 保持不变。
+    """
+    if full:
+        _invalidate_scan_cache()
+        snap = _refresh_catalog()
+        return {"ok": True, "full": True, "generation": snap.generation}
+    changed = _sweep_item_changes()
+    with _SCAN_LOCK:
+        for src in (_SRC_CFG, _SRC_WS, _SRC_MP):
+            src["dirty"] = True
+            src["change_at"] = 0.0
+        snap = _refresh_catalog()
+    return {"ok": True, "full": False, "changed": changed, "generation": snap.generation}
 
 @app.get("/api/scan/watch")
-def api_scan_watch():
-    """轻量检测扫描源是否变化；只做指纹判断，不主动执行全量扫描。"""
-    with _SCAN_LOCK:
-        cfg_dirty = _check_source(_SRC_CFG, _fp_config)
-        ws_dirty = _check_source(_SRC_WS, _fp_workshop)
-        mp_dirty = _check_source(_SRC_MP, _fp_myprojects)
-        changed = bool(cfg_dirty or ws_dirty or mp_dirty or not _MERGED.get("valid"))
-        return {
-            "changed": changed,
-            "sources": {
-                "config": bool(cfg_dirty),
-                "workshop": bool(ws_dirty),
-                "myprojects": bool(mp_dirty),
-            },
-            "merged_valid": bool(_MERGED.get("valid")),
-            "ts": int(time.time()),
-        }
+def api_scan_watch(since: str = Query("", description="前端当前数据所属的快照版本（/api/scan 返回的 catalog）")):
+    """
+    轻量检测扫描源是否变化；只做指纹判断，有变化时唤醒后台 worker 重扫，本身不扫描。
+    since 为前端当前数据的快照版本：已发布更新的快照（或服务已重启）时 changed=True。
+    兼容旧前端直接传 generation 数字。
+    扫描进行中不等锁，直接按已知状态返回。
+    """
+    sources = {}
+    if _SCAN_LOCK.acquire(blocking=False):
+        try:
+            sources = {
+                "config": _check_source(_SRC_CFG, _fp_config),
+                "workshop": _check_source(_SRC_WS, _fp_workshop),
+                "myprojects": _check_source(_SRC_MP, _fp_myprojects),
+            }
+        finally:
+            _SCAN_LOCK.release()
+        scanning = False
+    else:
+        scanning = True
+        sources = {"config": _SRC_CFG["dirty"], "workshop": _SRC_WS["dirty"], "myprojects": _SRC_MP["dirty"]}
+    dirty = any(sources.values())
+    if dirty or scanning:
+        _RESCAN_WAKE.set()
+    snap = _CATALOG
+    generation = snap.generation if snap else 0
+    tag = _catalog_tag(snap)
+    if since and since != "-1":
+        changed = since != (str(generation) if since.isdigit() else tag)
+    else:
+        changed = bool(dirty or snap is None)
+    return {
+        "changed": bool(changed),
+        "sources": {k: bool(v) for k, v in sources.items()},
+        "scanning": scanning,
+        "generation": generation,
+        "catalog": tag,
+        "merged_valid": snap is not None,
+        "ts": int(time.time()),
+    }
+
+# ---- 目录变化推送（SSE）：每发布一代快照立即通知所有打开的页面，取代各标签页 15 秒一次的轮询 ----
+# 订阅者是 (事件循环, asyncio.Queue)；发布发生在扫描线程里，经 call_soon_threadsafe 投递。
+_catalog_subscribers: set = set()
+_catalog_subscribers_lock = threading.Lock()
+
+def _catalog_event(sources: List[str]) -> dict:
+    snap = _CATALOG
+    return {
+        "generation": snap.generation if snap else 0,
+        "catalog": _catalog_tag(snap),
+        "sources": sources,
+        "items": len(snap.id_map) if snap else 0,
+        "ts": int(time.time()),
+    }
+
+def _publish_catalog_event(sources: List[str]):
+    with _catalog_subscribers_lock:
+        subs = list(_catalog_subscribers)
+    if not subs:
+        return
+    ev = _catalog_event(sources)
+    for loop, queue in subs:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, ev)
+        except RuntimeError:
+            pass  # 事件循环已关闭，连接随之结束
+
+def _sse_message(event: str, data: dict) -> str:
+    return f"event: {event}\nid: {data.get('catalog', '')}\ndata: {_json_dumps(data)}\n\n"
+
+@app.get("/api/scan/events")
+async def api_scan_events(request: Request):
+    """
+    SSE：连上先推一条当前版本，之后每发布一代快照推一条
+    event: catalog / data: {generation, catalog, sources: 本次重扫的源, items, ts}。
+    空闲时每 SCAN_EVENTS_HEARTBEAT_SEC 秒发一行注释保活，同时唤醒后台 worker 做一次（限频的）源指纹检查，
+    没有 inotify 时也能发现变化；多少个页面在线都只有这一份检查。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    sub = (loop, queue)
+    with _catalog_subscribers_lock:
+        _catalog_subscribers.add(sub)
+    _wake_rescan_throttled()
+
+    async def gen():
+        try:
+            yield f"retry: {SCAN_EVENTS_RETRY_MS}\n" + _sse_message("catalog", _catalog_event([]))
+            while True:
+                try:
+                    ev = await asyncio.wait_for(queue.get(), timeout=SCAN_EVENTS_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    _wake_rescan_throttled()
+                    yield ": ping\n\n"
+                    continue
+                yield _sse_message("catalog", ev)
+        finally:
+            with _catalog_subscribers_lock:
+                _catalog_subscribers.discard(sub)
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/diag")
 def api_diag():
@@ -745,7 +1414,8 @@ def api_diag():
     ws_count = len(_SRC_WS_DATA.get("items", {}))
     mp_count = len(_SRC_MP_DATA.get("items", {}))
     cfg_count = len(_SRC_CFG_DATA.get("items", {}))
-    id_map = _MERGED.get("id_map") or {}
+    snap = _CATALOG
+    id_map = snap.id_map if snap else {}
 
     ws_subdirs = 0
     if os.path.isdir(WORKSHOP_PATH):
@@ -785,7 +1455,24 @@ def api_diag():
             "total_merged": len(id_map),
             "workshop_subdirs": ws_subdirs,
         },
-        "scan_merged_valid": _MERGED.get("valid", False),
+        "scan_merged_valid": snap is not None,
+        "catalog_generation": snap.generation if snap else 0,
+        "catalog_built_at": snap.built_at if snap else 0.0,
+        "catalog_snapshot": dict(_CATALOG_STATE, db=CATALOG_DB),
+        "media_probe": dict(_PROBE_STORE.stats(), db=MEDIA_PROBE_DB),
+        "item_sweep": dict(_SWEEP_STATE, interval_sec=SCAN_ITEM_SWEEP_INTERVAL),
+        "text_index": _TEXT_INDEX.stats(),
+        "scan_event_subscribers": len(_catalog_subscribers),
+        "we_config": _WE_CONFIG.stats(),
+        "thumbs": _THUMBS.stats(),
+        "preview_mem_cache": _PREVIEW_MEM.stats(),
+        "preview_pregen": _preview_pregen_status(),
+        "preview_lqip": _preview_lqip_status(),
+        "memory": catalog_memory_report(id_map, snap.folder_index if snap else None),
+        "scan_watch": {
+            name: dict(st, **(_WATCHERS[name].stats() if name in _WATCHERS else {}))
+            for name, st in _WATCH_STATE.items()
+        },
         "issues": checks,
         "gpu": _hls_gpu_diag(),
         "runtime_env_files": list(_RUNTIME_ENV_LOADED),
@@ -796,76 +1483,68 @@ def _fs_safe_vid_token(vid_id: str) -> str:
   """用于缓存文件名等本地路径片段（避免 Windows 非法字符）。"""
   return re.sub(r'[<>:"/\\|?*]', "_", str(vid_id))
 
-def _build_video_out(id_map, vid_id) -> VideoOut:
-  v = id_map[vid_id]
-  is_ws = bool(re.fullmatch(r"\d{10}", str(vid_id)))
-  qid = quote(str(vid_id), safe="")
-  return VideoOut(
-    id=str(vid_id),
-    title=v.title,
-    author=getattr(v, "author", "") or "",
-    mtime=v.mtime,
-    size=v.size,
-    rating=v.rating or "",
-    preview_url=f"/media/preview/{qid}",
-    video_url=f"/media/video/{qid}",
-    workshop_url=f"https://steamcommunity.com/sharedfiles/filedetails/?id={vid_id}" if is_ws else "",
-    is_workshop=is_ws,
-  )
+_WS_ID_RE = re.compile(r"\d{10}")
+_json_dumps = functools.partial(json.dumps, ensure_ascii=False, separators=(",", ":"))
+
+def _video_out_record(vid_id: str, v) -> dict:
+  """VideoOut 的字段（含 author），直接产出 dict，不经 Pydantic。"""
+  is_ws = bool(_WS_ID_RE.fullmatch(vid_id))
+  qid = quote(vid_id, safe="")
+  return {
+    "id": vid_id,
+    "title": v.title,
+    "author": getattr(v, "author", "") or "",
+    "mtime": float(v.mtime),
+    "size": int(v.size),
+    "rating": v.rating or "",
+    "preview_url": f"/media/preview/{qid}",
+    "video_url": f"/media/video/{qid}",
+    "workshop_url": f"https://steamcommunity.com/sharedfiles/filedetails/?id={vid_id}" if is_ws else "",
+    "is_workshop": is_ws,
+  }
+
+# 每项 VideoOut 预先序列化好的 JSON 文本：按 VideoItem 对象缓存，三源合并时未变化的项沿用同一对象，
+# 换代后绝大多数条目仍可复用；上传者由 Steam 就地补全时按 author 判定失效，低清占位算好后按占位对象判定失效。
+_VIDEO_JSON_CACHE = {"id_map": None, "rows": {}}
+_video_json_lock = threading.Lock()
+
+def _video_out_json(id_map: Dict[str, VideoItem], vids: List[str]) -> List[str]:
+  with _video_json_lock:
+    if _VIDEO_JSON_CACHE["id_map"] is not id_map:
+      old = _VIDEO_JSON_CACHE["rows"]
+      _VIDEO_JSON_CACHE.update(id_map=id_map, rows={k: e for k, e in old.items() if id_map.get(k) is e[0]})
+    rows = _VIDEO_JSON_CACHE["rows"]
+  out = []
+  for vid in vids:
+    v = id_map[vid]
+    ent = rows.get(vid)
+    author = getattr(v, "author", "") or ""
+    ph = _LQIP_FOR.get(vid)
+    if ph is not None and ph[0] is not v:
+      ph = None
+    if ent is None or ent[0] is not v or ent[1] != author or ent[2] is not ph:
+      rec = _video_out_record(str(vid), v)
+      if ph is not None:
+        rec["lqip"], rec["color"] = ph[1], ph[2]
+      ent = (v, author, ph, _json_dumps(rec))
+      rows[vid] = ent
+    out.append(ent[3])
+  return out
 
-_video_orientation_cache = {}
 def _video_orientation_meta(v):
   """
-  返回用于前端壁纸模式筛选竖屏/横屏的轻量元数据。
-  只在用户打开文件夹播放菜单时按需 ffprobe，并按 path+mtime+size 缓存。
+  返回用于前端壁纸模式筛选竖屏/横屏的轻量元数据（取自共享的媒体探测库，未探测过的现场 ffprobe 一次）。
   """
   path = getattr(v, "video_path", "") or ""
-  if not path or not os.path.isfile(path):
+  info = _PROBE_STORE.get(path) if path else None
+  if not info:
     return {"width": 0, "height": 0, "orientation": "unknown"}
-  key = (path, float(getattr(v, "mtime", 0) or 0), int(getattr(v, "size", 0) or 0))
-  cached = _video_orientation_cache.get(key)
-  if cached:
-    return cached
-  meta = {"width": 0, "height": 0, "orientation": "unknown"}
-  try:
-    p = subprocess.run(
-      [
-        "ffprobe", "-v", "error",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
-        "-of", "json",
-        path,
-      ],
-      stdout=subprocess.PIPE,
-      stderr=subprocess.PIPE,
-      text=True,
-      timeout=5,
-    )
-    info = json.loads(p.stdout or "{}")
-    streams = info.get("streams") or []
-    st = streams[0] if streams else {}
-    w = int(st.get("width") or 0)
-    h = int(st.get("height") or 0)
-    rot = 0
-    try:
-      rot = int((st.get("tags") or {}).get("rotate") or 0)
-    except Exception:
-      rot = 0
-    for sd in (st.get("side_data_list") or []):
-      if "rotation" in sd:
-        try:
-          rot = int(float(sd.get("rotation") or 0))
-        except Exception:
-          pass
-        break
-    if abs(rot) % 180 == 90:
-      w, h = h, w
-    if w > 0 and h > 0:
-      meta = {"width": w, "height": h, "orientation": "portrait" if h > w else "landscape"}
-  except Exception:
-    pass
-  _video_orientation_cache[key] = meta
-  return meta
+  w, h = info.get("width") or 0, info.get("height") or 0
+  if abs(info.get("rotation") or 0) % 180 == 90:
+    w, h = h, w
+  if w > 0 and h > 0:
+    return {"width": w, "height": h, "orientation": "portrait" if h > w else "landscape"}
+  return {"width": 0, "height": 0, "orientation": "unknown"}
 
 def _template_ts(request: Request):
   try:
@@ -894,7 +1573,12 @@ def prewarm_scan():
   threading.Thread(target=_hls_log_startup_gpu_probe, daemon=True, name="gpu-probe").start()
   threading.Thread(target=_hls_preview_idle_reaper, daemon=True, name="hls-preview-reaper").start()
   threading.Thread(target=_hls_hw_slot_recovery, daemon=True, name="hls-slot-recovery").start()
-  threading.Thread(target=_scan_state, daemon=True).start()
+  # 快照恢复只读本地 SQLite，放在启动钩子里同步完成，保证首个请求就能拿到目录
+  restored = _restore_catalog_snapshot()
+  threading.Thread(target=_startup_scan, args=(restored,), daemon=True, name="scan-startup").start()
+  threading.Thread(target=_catalog_worker, daemon=True, name="scan-worker").start()
+  if SCAN_ITEM_SWEEP_INTERVAL > 0:
+    threading.Thread(target=_item_sweep_loop, daemon=True, name="scan-item-sweep").start()
 
 # ==========（新）已播放 API ==========
 @app.get("/api/watched")
@@ -1142,6 +1826,92 @@ def _parse_scan_filter(q: str) -> List[ScanFilterTerm]:
     terms.append(ScanFilterTerm(tok.casefold(), field, exact))
   return terms
 
+class MediaFilterTerm(NamedTuple):
+  key: str     # codec | res | dur | br | orient
+  op: str      # = > >= < <=（codec / orient 只有 =）
+  value: object
+
+_MEDIA_FILTER_RE = re.compile(r"^(codec|res|dur|br|is):(.+)$", re.I)
+_MEDIA_CMP_RE = re.compile(r"^(>=|<=|>|<|=)?(\d+(?:\.\d+)?)([a-z]*)$")
+_CODEC_ALIASES = {"h265": "hevc", "x265": "hevc", "avc": "h264", "x264": "h264", "h.264": "h264", "h.265": "hevc"}
+_ORIENT_WORDS = {"portrait": "portrait", "竖屏": "portrait", "landscape": "landscape", "横屏": "landscape"}
+# 数值单位：res 以短边像素计（4k = 2160），dur 以秒计，br 以 kbps 计
+_MEDIA_UNITS = {
+  "res": {"": 1, "p": 1, "k": 540},
+  "dur": {"": 1, "s": 1, "m": 60, "h": 3600},
+  "br": {"": 1, "k": 1, "m": 1000},
+}
+
+def _parse_media_filter(q: str) -> Tuple[List[MediaFilterTerm], str]:
+  """
+  从筛选串里取出媒体条件（依赖探测库，未探测的项不命中），返回 (条件, 剩余的文本筛选串)：
+  - codec:hevc          视频编码（h265/avc 等别名自动归一）
+  - res:>=2160 / res:4k 短边分辨率，可带 p / k
+  - dur:<30 / dur:>5m   时长，单位 s/m/h，默认秒
+  - br:>20m             码率，单位 k/m，默认 kbps
+  - is:portrait / is:landscape（或 is:竖屏 / is:横屏）
+  写法不合法的词原样留给文本筛选。
+  """
+  terms: List[MediaFilterTerm] = []
+  rest: List[str] = []
+  for tok in (q or "").split():
+    m = _MEDIA_FILTER_RE.match(tok)
+    term = None
+    if m:
+      key, val = m.group(1).lower(), m.group(2).strip().casefold()
+      if key == "codec":
+        term = MediaFilterTerm("codec", "=", _CODEC_ALIASES.get(val, val))
+      elif key == "is":
+        if val in _ORIENT_WORDS:
+          term = MediaFilterTerm("orient", "=", _ORIENT_WORDS[val])
+      else:
+        cm = _MEDIA_CMP_RE.match(val)
+        if cm and cm.group(3) in _MEDIA_UNITS[key]:
+          term = MediaFilterTerm(key, cm.group(1) or "=", float(cm.group(2)) * _MEDIA_UNITS[key][cm.group(3)])
+    if term is None:
+      rest.append(tok)
+    else:
+      terms.append(term)
+  return terms, " ".join(rest)
+
+def _media_value_matches(x: float, op: str, y: float) -> bool:
+  if op == ">": return x > y
+  if op == ">=": return x >= y
+  if op == "<": return x < y
+  if op == "<=": return x <= y
+  return round(x) == round(y)
+
+def _media_passes(m: Optional[MediaColumns], terms: List[MediaFilterTerm]) -> bool:
+  if not terms:
+    return True
+  if m is None:
+    return False
+  for t in terms:
+    if t.key == "codec":
+      ok = m.codec == t.value
+    elif t.key == "orient":
+      if m.width <= 0 or m.height <= 0:
+        return False
+      ok = (m.height > m.width) == (t.value == "portrait")
+    elif t.key == "res":
+      short = min(m.width, m.height)
+      ok = short > 0 and _media_value_matches(short, t.op, t.value)
+    elif t.key == "dur":
+      ok = m.duration > 0 and _media_value_matches(m.duration, t.op, t.value)
+    else:
+      ok = m.bit_rate > 0 and _media_value_matches(m.bit_rate / 1000.0, t.op, t.value)
+    if not ok:
+      return False
+  return True
+
+_EXACT_WORD_SEP = r"[\s\-_·|/\\，。！？、：；（）【】《》「」『』\"'\[\]{}<>]"
+
+@functools.lru_cache(maxsize=256)
+def _exact_word_patterns(word_cf: str):
+  w = re.escape(word_cf)
+  return (re.compile(r"(?<!\w)" + w + r"(?!\w)", re.UNICODE),
+          re.compile(r"(?:^|" + _EXACT_WORD_SEP + r")" + w + r"(?:$|" + _EXACT_WORD_SEP + r")"))
+
 def _contains_exact_word(text_cf: str, word_cf: str) -> bool:
   if not word_cf:
     return True
@@ -1149,10 +1919,10 @@ def _contains_exact_word(text_cf: str, word_cf: str) -> bool:
     return False
   if text_cf == word_cf:
     return True
-  if re.search(r"(?<!\w)" + re.escape(word_cf) + r"(?!\w)", text_cf, re.UNICODE):
-    return True
-  sep = r"[\s\-_·|/\\，。！？、：；（）【】《》「」『』\"'\[\]{}<>]"
-  return bool(re.search(r"(?:^|" + sep + r")" + re.escape(word_cf) + r"(?:$|" + sep + r")", text_cf))
+  if word_cf not in text_cf:
+    return False
+  word_re, sep_re = _exact_word_patterns(word_cf)
+  return bool(word_re.search(text_cf) or sep_re.search(text_cf))
 
 def _text_matches_term(text_cf: str, term: ScanFilterTerm) -> bool:
   if not term.text:
@@ -1182,64 +1952,131 @@ def _video_passes_scan_filter(v, mature_only: bool, terms: List[ScanFilterTerm])
       return False
   return True
 
+def _catalog_tag(snap) -> str:
+  """快照版本串（启动标识.代数），前端据此拼 cv 参数、轮询 /api/scan/watch。"""
+  return f"{_BOOT_ID}.{snap.generation}" if snap else ""
+
+def _catalog_etag(request: Request, snap, media_version: int = 0, lqip_version: int = 0,
+                  probe_version: int = 0) -> str:
+  """
+  强 ETag：快照版本 + 文本索引版本（Steam 补全上传者是就地改项，不换快照）+ 端点与全部查询参数；
+  按探测列排序/筛选时再带上探测列版本，响应里带低清占位的（只有 /api/scan）再带上占位版本，
+  逐项带探测结果的（with_orientation）再带上探测库版本。
+  只依赖这些即可判定响应体是否相同，不必先把响应算出来。
+  """
+  raw = "|".join((
+    _catalog_tag(snap),
+    str(_TEXT_INDEX.content_version(snap.id_map)),
+    str(lqip_version),
+    str(media_version),
+    str(probe_version),
+    request.url.path,
+    urlencode(sorted(request.query_params.multi_items())),
+  ))
+  return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24] + '"'
+
+def _catalog_cache_headers(request: Request, snap, etag: str, stable: bool = True) -> dict:
+  # URL 里的 cv 等于当前版本 → 这个 URL 的内容在该版本内不变，允许浏览器直接复用（前进/后退不回源）；
+  # 否则（未带 cv、cv 已过期）每次都要带 If-None-Match 校验。
+  # stable=False：响应在同一版本内也会变（逐项带探测结果，后台探测陆续写入），总是校验
+  if stable and SCAN_HTTP_MAX_AGE > 0 and request.query_params.get("cv") == _catalog_tag(snap):
+    cc = f"private, max-age={SCAN_HTTP_MAX_AGE}"
+  else:
+    cc = "private, no-cache"
+  return {"ETag": etag, "Cache-Control": cc}
+
+def _etag_matches(request: Request, etag: str) -> bool:
+  inm = request.headers.get("if-none-match")
+  if not inm:
+    return False
+  if inm.strip() == "*":
+    return True
+  return any(t.strip().removeprefix("W/") == etag for t in inm.split(","))
+
+def _scan_filter_matches(id_map: Dict[str, VideoItem], terms: List[ScanFilterTerm]):
+  """整个目录中满足筛选词的 id 集合：倒排索引求交得候选，再用 _video_passes_scan_filter 复核。"""
+  return _TEXT_INDEX.match(id_map, terms, lambda v: _video_passes_scan_filter(v, False, terms))
+
+def _facet_matches(id_map: Dict[str, VideoItem], selection: Dict[str, Tuple[str, ...]]):
+  """满足分类选择的 id 集合（位图求交后解码，按位图缓存）。"""
+  _, fi = _facet_index(id_map)
+  return fi.decode(fi.select(selection))
+
 # ========== 扫描 / 列表 ==========
 @app.get("/api/scan")
 def api_scan(
+  request: Request,
   path: str = Query("/", description="形如 /A/B"),
   page: int = Query(1, ge=1),
   per_page: int = Query(45, ge=1, le=500),  # 放宽到 500
-  sort_idx: int = Query(0, ge=0, le=5),
+  sort_idx: int = Query(0, ge=0, le=SORT_IDX_MAX),
   mature_only: bool = Query(False),
-  q: str = Query("", description="筛选：a:上传者 t:标题 =全字匹配，空格分词且全部包含")
+  q: str = Query("", description="筛选：a:上传者 t:标题 =全字匹配，空格分词且全部包含；"
+                                 "codec: res: dur: br: is:portrait/landscape 按探测信息筛选"),
+  facet: List[str] = Query([], description="分类筛选，如 rating:mature source:workshop,mp orientation:portrait"),
+  cv: str = Query("", description="前端已知的快照版本，仅用于区分缓存"),
 ):
-  folder_roots, id_map, root_unassigned = _scan_state()
+  snap = _catalog()
+  id_map, index = snap.id_map, snap.folder_index
+  media_terms, q_text = _parse_media_filter(q)
+  selection = _facet_selection(facet, media_terms)
+  has_facets = bool(selection)
+  if mature_only:
+    _narrow_facet(selection, "rating", ("mature",))
+  media_version, media = (_media_columns(id_map)
+                          if media_terms or _is_media_sort(sort_idx) or _uses_media_facets(selection) else (0, None))
+  # 占位版本先于响应体读取：其间新发布的占位只会让 ETag 偏旧、下次再换，不会让旧 ETag 对上新内容
+  etag = _catalog_etag(request, snap, media_version, _LQIP_STATE["version"])
+  headers = _catalog_cache_headers(request, snap, etag)
+  if _etag_matches(request, etag):
+    return Response(status_code=304, headers=headers)
 
-  # 规范化路径 & 直接命中子路径缓存
   parts = [p for p in path.split("/") if p]
-  norm_path = ("/" + "/".join(parts)) if parts else "/"
-  with _SCAN_LOCK:
-    pm = _MERGED.get("path_map") or {}
-    entry = pm.get(norm_path)
-
-  if entry:
-    current_subfolders = entry["subfolders"] or []
-    current_item_ids = list(entry["vids"] or [])
-    breadcrumb = parts
-  else:
-    # 兜底（理论上不会走到）
-    if not parts:
-      current_subfolders = folder_roots
-      current_item_ids = root_unassigned[:]
-      breadcrumb = []
-    else:
-      current_subfolders, current_item_ids = find_node_by_path(folder_roots, parts)
-      breadcrumb = parts
+  breadcrumb = parts
+  node = index.node(parts)
+  current_subfolders = node.children if node else []
+  current_item_ids = node.items if node else []
 
-  filter_terms = _parse_scan_filter(q)
-  has_filter = bool(filter_terms)
+  filter_terms = _parse_scan_filter(q_text)
+  has_filter = bool(filter_terms or media_terms or has_facets)
+  matched = _scan_filter_matches(id_map, filter_terms) if filter_terms else None
+  allowed = _facet_matches(id_map, selection) if selection else None
 
   def _passes(vid: str) -> bool:
-    return _video_passes_scan_filter(id_map.get(vid), mature_only, filter_terms)
+    if allowed is not None and vid not in allowed:
+      return False
+    if matched is not None and vid not in matched:
+      return False
+    return not media_terms or _media_passes(media.get(vid), media_terms)
 
   # 当前目录「直属」视频按过滤条件保留；搜索时也只平铺当前层，不把子文件夹里
   # 的命中项拉上来，避免用户反馈的「搜索后全部被拍平」。
-  vids: List[str] = [vid for vid in current_item_ids if _passes(vid)]
-
-  key, rev = _sort_key(sort_idx)
-  vids.sort(key=lambda _id: key(id_map[_id]), reverse=rev)
+  ordered = _sorted_ids(id_map, ("items", node.path if node else None),
+                        lambda: [vid for vid in current_item_ids if vid in id_map], sort_idx)
+  if has_filter or mature_only:
+    vids: List[str] = [vid for vid in ordered if _passes(vid)]
+  else:
+    vids = ordered
 
   # 文件夹渲染：
   #   - 无搜索词：展示所有子文件夹（原行为）
   #   - 有搜索词：仅展示「其下（递归）存在匹配视频」的子文件夹；点进去后因为
   #     前端仍会携带 q 参数请求，内部照样按关键词过滤。这样就保留了目录结构。
+  #   count 为子树内（递归）符合筛选条件的视频数：命中集合换算成有序位置数组后，
+  #   每个子文件夹只需两次二分，不再遍历子树。
+  positions = None
+  if has_filter or mature_only:
+    positions = index.cached_positions(
+      (id(id_map), tuple(filter_terms), tuple(media_terms), _facet_key(selection),
+       media_version if media_terms or _uses_media_facets(selection) else 0),
+      lambda: [vid for vid in (matched if matched is not None else allowed if allowed is not None else id_map)
+               if _passes(vid)])
   folders_out: List[FolderOut] = []
   for sf in current_subfolders:
-    if has_filter:
-      sub_ids = all_ids_recursive([sf])
-      if not any(_passes(i) for i in sub_ids):
-        continue
-    # ★ 激进加速：不再递归统计数量（前端已不显示），统一返回 0
-    folders_out.append(FolderOut(title=sf.title, count=0))
+    count = index.count_in(sf, positions) if positions is not None else sf.end - sf.start
+    if has_filter and not count:
+      continue
+    folders_out.append(FolderOut(title=sf.title, count=count))
 
   total_tiles = len(folders_out) + len(vids)
   total_pages = max(1, math.ceil(total_tiles / per_page))
@@ -1248,88 +2085,146 @@ def api_scan(
   start = (page - 1) * per_page
   end = min(start + per_page, total_tiles)
 
-  tiles = []
-  tiles.extend(("folder", f) for f in folders_out)
-  tiles.extend(("video", v) for v in vids)
-  show_tiles = tiles[start:end]
+  # 文件夹排在视频前面：按页区间分别切片，不再拼整个 tiles 列表
+  nf = len(folders_out)
+  out_folders = folders_out[start:min(end, nf)]
+  out_videos = _video_out_json(id_map, vids[max(0, start - nf):max(0, end - nf)])
 
-  out_folders: List[FolderOut] = []
-  out_videos: List[VideoOut] = []
-  for typ, obj in show_tiles:
-    if typ == "folder":
-      out_folders.append(obj)
-    else:
-      out_videos.append(_build_video_out(id_map, obj))
-
-  # ★ 提前序列化 JSON（绕过 Pydantic 实例化/校验）
-  return JSONResponse(content={
+  # ★ 视频条目直接拼接预先序列化的 JSON 文本（绕过 Pydantic 与逐项 json 编码）
+  head = _json_dumps({
     "breadcrumb": breadcrumb,
     "folders": [f.dict() for f in out_folders],
-    "videos": [v.dict() for v in out_videos],
     "page": page,
     "total_pages": total_pages,
-    "total_items": total_tiles
+    "total_items": total_tiles,
+    "generation": snap.generation,
+    "catalog": _catalog_tag(snap),
   })
+  body = head[:-1] + ',"videos":[' + ",".join(out_videos) + "]}"
+  return Response(content=body.encode("utf-8"), media_type="application/json", headers=headers)
+
+def _folder_video_item(id_map: Dict[str, VideoItem], vid: str, with_orientation: bool) -> dict:
+  v = id_map[vid]
+  item = {
+    "id": vid,
+    "title": v.title,
+  }
+  if with_orientation:
+    meta = _video_orientation_meta(v)
+    item.update({
+      "width": meta.get("width", 0),
+      "height": meta.get("height", 0),
+      "orientation": meta.get("orientation", "unknown"),
+    })
+  return item
+
+# 流式输出：首批很小，尽快让前端开播；朝向探测（每项一次 ffprobe）在批内并发
+_FOLDER_STREAM_FIRST_BATCH = 8
+_FOLDER_STREAM_BATCH = 64
+_FOLDER_STREAM_PROBE_WORKERS = 4
+
+def _iter_folder_videos_ndjson(id_map: Dict[str, VideoItem], vids: List[str], with_orientation: bool):
+  """按排序顺序逐批产出 NDJSON 行（每行一个 {id,title[,width,height,orientation]}）。"""
+  workers = _FOLDER_STREAM_PROBE_WORKERS if with_orientation else 1
+  i, size = 0, _FOLDER_STREAM_FIRST_BATCH
+  while i < len(vids):
+    part = parallel_map(lambda vid: _folder_video_item(id_map, vid, with_orientation), vids[i:i + size], workers)
+    yield "".join(_json_dumps(it) + "\n" for it in part).encode("utf-8")
+    i += size
+    size = _FOLDER_STREAM_BATCH
 
 # 递归取文件夹视频；with_meta=1 时返回 [{id,title}]，否则 ids
+# stream=1 时改为 NDJSON 流（隐含 with_meta），按排序顺序边算边发，超大文件夹/朝向探测不必等全部完成
 @app.get("/api/folder_videos")
 def api_folder_videos(
+  request: Request,
   path: str = Query("/", description="形如 /A/B"),
-  sort_idx: int = Query(0, ge=0, le=5),
+  sort_idx: int = Query(0, ge=0, le=SORT_IDX_MAX),
   mature_only: bool = Query(False),
   with_meta: bool = Query(False),
-  with_orientation: bool = Query(False)
+  with_orientation: bool = Query(False),
+  stream: bool = Query(False, description="NDJSON 流式输出"),
+  q: str = Query("", description="可选筛选，语法同 /api/scan"),
+  facet: List[str] = Query([], description="分类筛选，语法同 /api/scan"),
+  cv: str = Query("", description="前端已知的快照版本，仅用于区分缓存"),
 ):
-  folder_roots, id_map, root_unassigned = _scan_state()
-  parts = [p for p in path.split("/") if p]
-  if not parts:
-    current_subfolders = folder_roots
-    current_item_ids = root_unassigned[:]
-  else:
-    current_subfolders, current_item_ids = find_node_by_path(folder_roots, parts)
-
-  candidates = set(current_item_ids)
-  candidates.update(all_ids_recursive(current_subfolders))
-
-  vids: List[str] = []
-  for vid in candidates:
-    v = id_map.get(vid)
-    if not v:
-      continue
-    if mature_only and (v.rating or "").lower() != "mature":
-      continue
-    vids.append(vid)
-
-  key, rev = _sort_key(sort_idx)
-  vids.sort(key=lambda _id: key(id_map[_id]), reverse=rev)
+  snap = _catalog()
+  id_map, index = snap.id_map, snap.folder_index
+  media_terms, q_text = _parse_media_filter(q)
+  selection = _facet_selection(facet, media_terms)
+  if mature_only:
+    _narrow_facet(selection, "rating", ("mature",))
+  media_version, media = (_media_columns(id_map)
+                          if media_terms or _is_media_sort(sort_idx) or _uses_media_facets(selection) else (0, None))
+  # with_orientation 的每一项取自探测库（未探测的现场探测）：探测库版本先于响应体读取，
+  # 期间有新结果写入只会让 ETag 偏旧、下次重取；探测失败不改版本，结果确实不变
+  probe_version = _PROBE_STORE.version if with_orientation else 0
+  etag = _catalog_etag(request, snap, media_version, probe_version=probe_version)
+  headers = _catalog_cache_headers(request, snap, etag, stable=not with_orientation)
+  if _etag_matches(request, etag):
+    return Response(status_code=304, headers=headers)
+  node = index.node([p for p in path.split("/") if p])
+  vids = _sorted_ids(id_map, ("subtree", node.path if node else None),
+                     lambda: [vid for vid in set(index.subtree_ids(node) if node else ()) if vid in id_map],
+                     sort_idx)
+  if selection:
+    allowed = _facet_matches(id_map, selection)
+    vids = [vid for vid in vids if vid in allowed]
+  filter_terms = _parse_scan_filter(q_text)
+  if filter_terms:
+    matched = _scan_filter_matches(id_map, filter_terms)
+    vids = [vid for vid in vids if vid in matched]
+  if media_terms:
+    vids = [vid for vid in vids if _media_passes(media.get(vid), media_terms)]
+  if stream:
+    return StreamingResponse(_iter_folder_videos_ndjson(id_map, vids, with_orientation),
+                             media_type="application/x-ndjson", headers=headers)
   if with_meta:
-    items = []
-    for i in vids:
-      v = id_map[i]
-      item = {
-        "id": i,
-        "title": v.title,
-      }
-      if with_orientation:
-        meta = _video_orientation_meta(v)
-        item.update({
-          "width": meta.get("width", 0),
-          "height": meta.get("height", 0),
-          "orientation": meta.get("orientation", "unknown"),
-        })
-      items.append(item)
-    return {"items": items}
-  return {"ids": vids}
+    items = [_folder_video_item(id_map, i, with_orientation) for i in vids]
+    return JSONResponse(content={"items": items}, headers=headers)
+  return JSONResponse(content={"ids": vids}, headers=headers)
+
+# 文件夹（递归）内各分类属性值的数量；q 与其它属性的已选值会收窄计数，属性自身的已选值不会
+@app.get("/api/facets")
+def api_facets(
+  request: Request,
+  path: str = Query("/", description="形如 /A/B"),
+  mature_only: bool = Query(False),
+  q: str = Query("", description="可选筛选，语法同 /api/scan"),
+  facet: List[str] = Query([], description="已选分类，语法同 /api/scan"),
+  cv: str = Query("", description="前端已知的快照版本，仅用于区分缓存"),
+):
+  snap = _catalog()
+  id_map, index = snap.id_map, snap.folder_index
+  media_terms, q_text = _parse_media_filter(q)
+  selection = _facet_selection(facet, media_terms)
+  if mature_only:
+    _narrow_facet(selection, "rating", ("mature",))
+  # 计数里总有朝向/编码族，结果随探测列变化
+  media_version, fi = _facet_index(id_map)
+  etag = _catalog_etag(request, snap, media_version)
+  headers = _catalog_cache_headers(request, snap, etag)
+  if _etag_matches(request, etag):
+    return Response(status_code=304, headers=headers)
+  node = index.node([p for p in path.split("/") if p])
+  ids = set(index.subtree_ids(node)) if node else set()
+  filter_terms = _parse_scan_filter(q_text)
+  if filter_terms:
+    ids &= _scan_filter_matches(id_map, filter_terms)
+  if media_terms:
+    _, media = _media_columns(id_map)
+    ids = {vid for vid in ids if _media_passes(media.get(vid), media_terms)}
+  scope = fi.scope(ids)
+  return JSONResponse(content={
+    "path": path,
+    "total": (scope & fi.select(selection)).bit_count(),
+    "facets": fi.counts(scope, selection),
+    "catalog": _catalog_tag(snap),
+  }, headers=headers)
 
 # === 右键/菜单用：列出“移动到 …”二级菜单（包含已有文件夹与子文件夹） ===
 @app.get("/api/folders_menu")  # ★ 新增
 def api_folders_menu():
-  try:
-    we_cfg = load_we_config(WE_PATH)
-    lst = extract_folders_list(we_cfg)
-  except Exception:
-    lst = []
-
   def rec(nodes, prefix):
     out = []
     for n in (nodes or []):
@@ -1338,7 +2233,12 @@ def api_folders_menu():
       out.append({"title": title, "path": path, "children": rec(n.get("subfolders") or [], path)})
     return out
 
-  return {"tree": rec(lst, "/")}
+  # 直接读内存中的配置（含尚未落盘的编辑），不再每次解析 config.json
+  try:
+    with _WE_CONFIG.reading() as cfg:
+      return {"tree": rec(extract_folders_list(cfg), "/")}
+  except Exception:
+    return {"tree": []}
 
 # === 在当前路径下新建文件夹（写 config.json，先 .bak 再写入） ===
 @app.post("/api/folder/create")  # ★ 新增
@@ -2044,13 +2944,48 @@ def _ext_from_mime(mime: str) -> str:
   if "webp" in mime: return ".webp"
   return mimetypes.guess_extension(mime) or ".bin"
 
-@app.get("/media/preview/{vid_id}")
-def media_preview(vid_id: str, request: Request,
-                  s: int | None = Query(default=None, ge=32, le=2048, description="方形缩略图边长"),
-                  fmt: str | None = Query(default=None, description="webp|jpeg|png|auto"),
-                  q: int = Query(default=80, ge=10, le=100)):
-  # 构建原图信息
-  from PIL import Image, ImageSequence  # 需要 pillow
+_PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_PREVIEW_ANIMATED_MIMES = ("image/gif", "image/webp")
+
+def _preview_headers(etag: str, last_mod: str) -> dict:
+  return {"ETag": etag, "Last-Modified": last_mod, "Cache-Control": _PREVIEW_CACHE_CONTROL, "Vary": "Accept"}
+
+def _preview_cache_path(vid_id: str, st: os.stat_result, s: int | None, target_fmt: str | None,
+                        q: int, src_mime: str, still: bool = False) -> Tuple[str, str]:
+  """(缓存文件路径, key_hash)。still=True 为动图首帧占位的缓存。"""
+  key_raw = f"{vid_id}|{int(st.st_mtime)}|{st.st_size}|{s or 0}|{target_fmt or 'orig'}|{q}"
+  if still:
+    key_raw += "|still"
+  key_hash = hashlib.sha1(key_raw.encode("utf-8")).hexdigest()[:20]
+  out_ext = ".webp" if (target_fmt == "webp") else (".jpg" if target_fmt in ("jpg","jpeg") else (".png" if target_fmt=="png" else _ext_from_mime(src_mime)))
+  return os.path.join(PREVIEW_CACHE_DIR, f"{_fs_safe_vid_token(vid_id)}_{key_hash}{out_ext}"), key_hash
+
+def _preview_target_fmt(request: Request, fmt: str | None) -> str | None:
+  if fmt is None or fmt == "auto":
+    return "webp" if _client_supports_webp(request) else None
+  f = (fmt or "").lower().strip()
+  if f in ("webp","jpeg","jpg","png"): return "jpg" if f=="jpg" else f
+  return None  # 未知 → 不转码
+
+def _preview_mem_fill(mkey: tuple, item, path: str, mime: str, etag: str, last_mod: str) -> bytes | None:
+  """小于单项上限的缓存文件读进内存 LRU，返回字节（没收进去返回 None，照常走 FileResponse）。"""
+  if _PREVIEW_MEM.budget <= 0:
+    return None
+  try:
+    if os.path.getsize(path) > _PREVIEW_MEM.max_item:
+      return None
+    with open(path, "rb") as f:
+      body = f.read()
+  except OSError:
+    return None
+  _PREVIEW_MEM.put(mkey, (item, etag, last_mod, mime, body), len(body))
+  return body
+
+def _preview_plan(vid_id: str, request: Request, s: int | None, fmt: str | None, q: int):
+  """
+  /media/preview 的同步部分：查目录、stat 源文件、算缓存 key。
+  能直接回应（原图 / 304 / 命中缓存）时返回 Response，否则返回待渲染的参数 dict。
+  """
   _, id_map, _ = _scan_state()
   v = id_map.get(vid_id)
   if not v: raise HTTPException(404)
@@ -2065,14 +3000,7 @@ def media_preview(vid_id: str, request: Request,
   last_mod = _last_modified_str(src_path)
 
   # 如果未请求缩放/转码，就直接走原图（保持你之前的强缓存行为）
-  want_auto = (fmt is None or fmt == "auto")
-  target_fmt = None
-  if want_auto:
-    target_fmt = "webp" if _client_supports_webp(request) else None
-  else:
-    f = (fmt or "").lower().strip()
-    if f in ("webp","jpeg","jpg","png"): target_fmt = "jpg" if f=="jpg" else f
-    else: target_fmt = None  # 未知 → 不转码
+  target_fmt = _preview_target_fmt(request, fmt)
 
   # 是否需要处理
   need_resize = s is not None
@@ -2083,165 +3011,476 @@ def media_preview(vid_id: str, request: Request,
     inm = request.headers.get("if-none-match")
     ims = request.headers.get("if-modified-since")
     if inm == src_etag:
-      return Response(status_code=304, headers={
-        "ETag": src_etag, "Last-Modified": last_mod,
-        "Cache-Control": "public, max-age=31536000, immutable",
-        "Vary": "Accept",
-      })
+      return Response(status_code=304, headers=_preview_headers(src_etag, last_mod))
     if ims:
       try:
         ims_dt = parsedate_to_datetime(ims)
         if int(os.stat(src_path).st_mtime) <= int(ims_dt.timestamp()):
-          return Response(status_code=304, headers={
-            "ETag": src_etag, "Last-Modified": last_mod,
-            "Cache-Control": "public, max-age=31536000, immutable",
-            "Vary": "Accept",
-          })
+          return Response(status_code=304, headers=_preview_headers(src_etag, last_mod))
       except Exception:
         pass
-    return FileResponse(src_path, media_type=src_mime, headers={
-      "ETag": src_etag, "Last-Modified": last_mod,
-      "Cache-Control": "public, max-age=31536000, immutable",
-      "Vary": "Accept",
-    })
+    return FileResponse(src_path, media_type=src_mime, headers=_preview_headers(src_etag, last_mod))
 
   # 生成缓存 key
   st = os.stat(src_path)
-  fs_vid = _fs_safe_vid_token(vid_id)
-  key_raw = f"{vid_id}|{int(st.st_mtime)}|{st.st_size}|{s or 0}|{target_fmt or 'orig'}|{q}"
-  key_hash = hashlib.sha1(key_raw.encode("utf-8")).hexdigest()[:20]
-  out_ext = ".webp" if (target_fmt == "webp") else (".jpg" if target_fmt in ("jpg","jpeg") else (".png" if target_fmt=="png" else _ext_from_mime(src_mime)))
-  cache_path = os.path.join(PREVIEW_CACHE_DIR, f"{fs_vid}_{key_hash}{out_ext}")
+  cache_path, key_hash = _preview_cache_path(vid_id, st, s, target_fmt, q, src_mime)
   etag = f'W/"prev-{key_hash}"'
 
   # 条件缓存（对加工品）
   inm = request.headers.get("if-none-match")
   if inm == etag and os.path.isfile(cache_path):
-    return Response(status_code=304, headers={
-      "ETag": etag, "Last-Modified": last_mod,
-      "Cache-Control": "public, max-age=31536000, immutable",
-      "Vary": "Accept",
-    })
+    return Response(status_code=304, headers=_preview_headers(etag, last_mod))
 
   # 命中文件缓存
+  mkey = (vid_id, s or 0, target_fmt, q)
   if os.path.isfile(cache_path):
     mime = mimetypes.guess_type(cache_path)[0] or "image/webp"
-    return FileResponse(cache_path, media_type=mime, headers={
-      "ETag": etag, "Last-Modified": last_mod,
-      "Cache-Control": "public, max-age=31536000, immutable",
-      "Vary": "Accept",
-    })
+    body = _preview_mem_fill(mkey, v, cache_path, mime, etag, last_mod)
+    if body is not None:
+      return Response(content=body, media_type=mime, headers=_preview_headers(etag, last_mod))
+    return FileResponse(cache_path, media_type=mime, headers=_preview_headers(etag, last_mod))
+
+  # 可能是动图且要转动态 WebP：另备一份首帧静态图，正式结果没出来前先拿它占位
+  still_path = None
+  if target_fmt == "webp" and src_mime in _PREVIEW_ANIMATED_MIMES:
+    still_path, _ = _preview_cache_path(vid_id, st, s, target_fmt, q, src_mime, still=True)
+  return {
+    "item": v, "mkey": mkey,
+    "src_path": src_path, "src_mime": src_mime, "src_etag": src_etag, "last_mod": last_mod,
+    "size": s or 0, "target_fmt": target_fmt, "q": q,
+    "cache_path": cache_path, "etag": etag,
+    "still_path": still_path, "still_ready": bool(still_path and os.path.isfile(still_path)),
+  }
 
-  # 需要生成：加锁防并发
-  lock = _get_cache_lock(cache_path)
-  with lock:
-    # 双检：可能别的请求已生成
-    if os.path.isfile(cache_path):
-      mime = mimetypes.guess_type(cache_path)[0] or "image/webp"
-      return FileResponse(cache_path, media_type=mime, headers={
-        "ETag": etag, "Last-Modified": last_mod,
-        "Cache-Control": "public, max-age=31536000, immutable",
-        "Vary": "Accept",
+def _wrap_job(fut) -> asyncio.Future:
+  """concurrent Future → asyncio Future；异常由调用方按需读取，未读取的不再告警。"""
+  af = asyncio.wrap_future(fut)
+  af.add_done_callback(lambda f: f.cancelled() or f.exception())
+  return af
+
+@app.get("/media/preview/{vid_id}")
+async def media_preview(vid_id: str, request: Request,
+                        s: int | None = Query(default=None, ge=32, le=2048, description="方形缩略图边长"),
+                        fmt: str | None = Query(default=None, description="webp|jpeg|png|auto"),
+                        q: int = Query(default=80, ge=10, le=100)):
+  """
+  缩略图：命中缓存直接回文件；否则交给渲染进程池（同一缓存文件的并发请求合并），这里只等结果。
+  动图转动态 WebP 较慢：首帧静态图先渲染好就先返回它（不缓存），动图在后台继续渲染，下次请求即命中。
+  渲染失败或超时回原图。最近返回过的小缩略图直接从内存 LRU 回（项目对象没换即有效，不 stat）。
+  """
+  snap = _CATALOG
+  if snap is not None and (s is not None or fmt is not None):
+    item = snap.id_map.get(vid_id)
+    hit = _PREVIEW_MEM.get((vid_id, s or 0, _preview_target_fmt(request, fmt), q),
+                           check=lambda e: item is not None and e[0] is item)
+    if hit is not None:
+      _, etag, last_mod, mime, body = hit
+      if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=_preview_headers(etag, last_mod))
+      return Response(content=body, media_type=mime, headers=_preview_headers(etag, last_mod))
+
+  plan = await asyncio.to_thread(_preview_plan, vid_id, request, s, fmt, q)
+  if isinstance(plan, Response):
+    return plan
+
+  src_path, cache_path = plan["src_path"], plan["cache_path"]
+  final = _wrap_job(_THUMBS.submit(cache_path, thumbs.render, src_path, cache_path,
+                                   plan["size"], plan["target_fmt"], plan["q"]))
+  deadline = time.monotonic() + PREVIEW_RENDER_TIMEOUT_SEC
+  still_path = plan["still_path"]
+  if still_path:
+    if plan["still_ready"]:
+      still = asyncio.get_running_loop().create_future()
+      still.set_result((still_path, True))
+    else:
+      still = _wrap_job(_THUMBS.submit(still_path, thumbs.render, src_path, still_path,
+                                       plan["size"], plan["target_fmt"], plan["q"], True,
+                                       priority=PRIORITY_STILL))
+    await asyncio.wait({final, still}, timeout=PREVIEW_RENDER_TIMEOUT_SEC,
+                       return_when=asyncio.FIRST_COMPLETED)
+    # 首帧先好、且源确实是动图：先回占位（no-store，之后的请求会拿到缓存好的动图）
+    if not final.done() and still.done() and not still.exception() and still.result()[1]:
+      return FileResponse(still_path, media_type="image/webp", headers={
+        "Cache-Control": "no-store", "Vary": "Accept", "X-Preview-Placeholder": "1",
       })
+  if not final.done():
+    await asyncio.wait({final}, timeout=max(0.0, deadline - time.monotonic()))
+
+  if final.done() and not final.exception():
+    mime = mimetypes.guess_type(cache_path)[0] or "image/webp"
+    body = await asyncio.to_thread(_preview_mem_fill, plan["mkey"], plan["item"], cache_path, mime,
+                                   plan["etag"], plan["last_mod"])
+    if body is not None:
+      return Response(content=body, media_type=mime, headers=_preview_headers(plan["etag"], plan["last_mod"]))
+    return FileResponse(cache_path, media_type=mime, headers=_preview_headers(plan["etag"], plan["last_mod"]))
+  # 出错/超时兜底：直接原图，但不能带缩略图 URL 的一年强缓存（不带 ETag），渲染好后下次请求即拿到缩略图
+  return FileResponse(src_path, media_type=plan["src_mime"], headers={
+    "Cache-Control": "no-store", "Vary": "Accept",
+  })
 
-    # 处理图像
+# ======= 缩略图预生成：每代快照发布后在后台按前端实际请求的尺寸/格式渲染进 preview_cache =======
+def _parse_pregen_specs(raw: str) -> List[Tuple[int, str, int]]:
+  """"256:webp:80,512:jpg" → [(256, "webp", 80), (512, "jpg", 80)]；无法解析的项忽略。"""
+  specs = []
+  for part in (raw or "").split(","):
+    part = part.strip()
+    if not part:
+      continue
+    size, fmt, q = (part.split(":") + ["", ""])[:3]
+    fmt = (fmt or "webp").strip().lower()
+    fmt = "jpg" if fmt == "jpeg" else fmt
     try:
-      im = Image.open(src_path)
-    except Exception:
-      # 打不开 → 直接原图兜底
-      return FileResponse(src_path, media_type=src_mime, headers={
-        "ETag": src_etag, "Last-Modified": last_mod,
-        "Cache-Control": "public, max-age=31536000, immutable",
-        "Vary": "Accept",
-      })
+      size, q = int(size), int(q or 80)
+    except ValueError:
+      size = 0
+    if not (32 <= size <= 2048 and 10 <= q <= 100 and fmt in ("webp", "jpg", "png")):
+      print(f"[config] PREVIEW_PREGEN 忽略无效项: {part}")
+      continue
+    specs.append((size, fmt, q))
+  return specs
+
+# 与网格缩略图 URL（?s=256&fmt=webp&q=80）一致；空串 = 关闭预生成
+PREVIEW_PREGEN_SPECS = _parse_pregen_specs(os.getenv("PREVIEW_PREGEN", "256:webp:80"))
+PREVIEW_PREGEN_CONCURRENCY = max(1, int(os.getenv("PREVIEW_PREGEN_CONCURRENCY", "1")))
+# 每个预生成线程的 CPU 占空比（0~1）：渲染耗时 t 后歇 t×(1/占空比−1) 秒
+PREVIEW_PREGEN_CPU_BUDGET = min(1.0, max(0.05, float(os.getenv("PREVIEW_PREGEN_CPU_BUDGET", "0.5"))))
+PREVIEW_PREGEN_PAUSE_ON_TRANSCODE = os.getenv("PREVIEW_PREGEN_PAUSE_ON_TRANSCODE", "1") == "1"
+# 首代快照（冷启动全量扫描 / 每次重启从快照恢复）默认不预生成，只处理之后新增或重扫过的项；
+# 设为 1 则首代把整个目录排入一次（已缓存的直接跳过），用于老库的批量回填
+PREVIEW_PREGEN_BACKFILL = os.getenv("PREVIEW_PREGEN_BACKFILL", "0") == "1"
+
+_pregen_cv = threading.Condition()
+_pregen_queue: "deque[str]" = deque()
+_pregen_queued: set = set()
+_pregen_recent: "deque[float]" = deque(maxlen=4096)
+_PREGEN = {
+  "workers": 0, "active": 0, "enqueued": 0, "paused": "",
+  "rendered": 0, "cached": 0, "failed": 0, "missing": 0, "render_sec": 0.0,
+}
 
-    # 判断动图
-    is_animated = getattr(im, "is_animated", False) and getattr(im, "n_frames", 1) > 1
-
-    def _resize_square(img):
-      """等比缩到最短边>=s，然后居中裁切 s×s；若 s 未给则原尺寸"""
-      if not s: return img
-      w, h = img.size
-      if w == 0 or h == 0: return img
-      # 先等比缩放使“短边”>= s（尽量少放大）
-      short = float(min(w, h))
-      scale = s / short
-      new_w = max(s, int(w * scale))
-      new_h = max(s, int(h * scale))
-      if (new_w, new_h) != (w, h):
-        img = img.resize((new_w, new_h), Image.LANCZOS)
-      left = max((img.width - s) // 2, 0)
-      top  = max((img.height - s) // 2, 0)
-      img = img.crop((left, top, left + s, top + s))
-      return img
-
-    tmp_path = cache_path + ".tmp"
+def _schedule_preview_pregen(id_map: Dict[str, VideoItem], prev_map: Optional[Dict[str, VideoItem]]):
+  """
+  新一代快照里新增或重扫过的项排进预生成队列。首代只在 PREVIEW_PREGEN_BACKFILL 时整库排入：
+  重启后首代就是恢复的快照，否则每次重启都会把整库重新 stat 一遍。
+  """
+  if not PREVIEW_PREGEN_SPECS or (prev_map is None and not PREVIEW_PREGEN_BACKFILL):
+    return
+  vids = [vid for vid, v in id_map.items()
+          if v.preview_path and (prev_map is None or prev_map.get(vid) is not v)]
+  if not vids:
+    return
+  with _pregen_cv:
+    n = 0
+    for vid in vids:
+      if vid not in _pregen_queued:
+        _pregen_queued.add(vid)
+        _pregen_queue.append(vid)
+        n += 1
+    _PREGEN["enqueued"] += n
+    while _PREGEN["workers"] < PREVIEW_PREGEN_CONCURRENCY:
+      _PREGEN["workers"] += 1
+      threading.Thread(target=_preview_pregen_worker, daemon=True,
+                       name=f"preview-pregen-{_PREGEN['workers']}").start()
+    _pregen_cv.notify_all()
+
+def _preview_pregen_pause_reason() -> str:
+  """预生成需要让路的原因：有播放转码在跑 / 有浏览器请求的缩略图在排队；空串 = 可以继续。"""
+  if PREVIEW_PREGEN_PAUSE_ON_TRANSCODE and _hls_running_job_count() > 0:
+    return "transcode"
+  if _THUMBS.backlog(PRIORITY_RENDER) > 0:
+    return "requests"
+  return ""
 
+def _preview_pregen_one(vid: str) -> str:
+  snap = _CATALOG
+  v = snap.id_map.get(vid) if snap else None
+  src_path = v.preview_path if v else ""
+  try:
+    st = os.stat(src_path) if src_path else None
+  except OSError:
+    st = None
+  if st is None:
+    return "missing"
+  src_mime = mimetypes.guess_type(src_path)[0] or "image/gif"
+  todo = []
+  for size, fmt, q in PREVIEW_PREGEN_SPECS:
+    cache_path, _ = _preview_cache_path(vid, st, size, fmt, q, src_mime)
+    if not os.path.isfile(cache_path):
+      todo.append((cache_path, size, fmt, q))
+  if not todo:
+    return "cached"
+  while True:
+    reason = _preview_pregen_pause_reason()
+    with _pregen_cv:
+      _PREGEN["paused"] = reason
+    if not reason:
+      break
+    time.sleep(2.0)
+  t0 = time.perf_counter()
+  for cache_path, size, fmt, q in todo:
+    _THUMBS.submit(cache_path, thumbs.render, src_path, cache_path, size, fmt, q,
+                   priority=PRIORITY_BACKGROUND).result()
+  dt = time.perf_counter() - t0
+  with _pregen_cv:
+    _PREGEN["render_sec"] += dt
+  if PREVIEW_PREGEN_CPU_BUDGET < 1.0:
+    time.sleep(dt * (1.0 / PREVIEW_PREGEN_CPU_BUDGET - 1.0))
+  return "rendered"
+
+def _preview_pregen_worker():
+  while True:
+    with _pregen_cv:
+      while not _pregen_queue:
+        _pregen_cv.wait()
+      vid = _pregen_queue.popleft()
+      _pregen_queued.discard(vid)
+      _PREGEN["active"] += 1
     try:
-      if is_animated and (target_fmt == "webp"):
-        # 转 WebP 动图
-        frames = []
-        durations = []
-        try:
-          from PIL import ImageSequence
-          for f in ImageSequence.Iterator(im):
-            frame = f.convert("RGBA")
-            frame = _resize_square(frame)
-            frames.append(frame)
-            durations.append(f.info.get("duration", im.info.get("duration", 40)))
-        except Exception:
-          # 退化：取第一帧静态
-          frame = im.convert("RGBA")
-          frame = _resize_square(frame)
-          frames = [frame]
-          durations = [im.info.get("duration", 40)]
-        if not frames:
-          frames = [im.convert("RGBA")]
-          frames[0] = _resize_square(frames[0])
-          durations = [40]
-        frames[0].save(tmp_path, format="WEBP", save_all=True,
-                       append_images=frames[1:] if len(frames)>1 else None,
-                       duration=durations, loop=0, quality=q, method=6)
-      else:
-        # 静态图或不转码动图：导出为 webp/jpeg/png/或原格式
-        # 统一先转成 RGB(A) 以避免模式问题
-        fmt_out = ("WEBP" if target_fmt == "webp" else
-                   "JPEG" if target_fmt in ("jpg","jpeg") else
-                   "PNG"  if target_fmt == "png" else None)
-        base = im.convert("RGBA") if im.mode not in ("RGB","RGBA") else im
-        base = _resize_square(base) if need_resize else base
-        save_kwargs = {}
-        if fmt_out == "JPEG":
-          base = base.convert("RGB")
-          save_kwargs.update(dict(quality=q, progressive=True, optimize=True))
-        elif fmt_out == "WEBP":
-          save_kwargs.update(dict(quality=q, method=6))
-        elif fmt_out == "PNG":
-          save_kwargs.update(dict(optimize=True))
-        # 未指定 fmt_out → 按原后缀导出（尽量保真）
-        out_fmt_final = fmt_out or (im.format if im.format in ("PNG","JPEG","WEBP","GIF") else "PNG")
-        base.save(tmp_path, format=out_fmt_final, **save_kwargs)
-
-      # 原子落盘
-      os.replace(tmp_path, cache_path)
-      mime = mimetypes.guess_type(cache_path)[0] or "image/webp"
-      return FileResponse(cache_path, media_type=mime, headers={
-        "ETag": etag, "Last-Modified": last_mod,
-        "Cache-Control": "public, max-age=31536000, immutable",
-        "Vary": "Accept",
-      })
-    except Exception:
-      # 出错兜底：直接原图
-      try:
-        if os.path.exists(tmp_path):
-          os.remove(tmp_path)
-      except Exception:
-        pass
-      return FileResponse(src_path, media_type=src_mime, headers={
-        "ETag": src_etag, "Last-Modified": last_mod,
-        "Cache-Control": "public, max-age=31536000, immutable",
-        "Vary": "Accept",
-      })
+      result = _preview_pregen_one(vid)
+    except Exception as e:
+      print(f"[preview] 预生成缩略图失败 {vid}: {e}")
+      result = "failed"
+    with _pregen_cv:
+      _PREGEN["active"] -= 1
+      _PREGEN[result] += 1
+      if result in ("rendered", "failed"):
+        _pregen_recent.append(time.time())
+
+def _preview_pregen_status() -> dict:
+  now = time.time()
+  with _pregen_cv:
+    st = dict(_PREGEN)
+    backlog = len(_pregen_queue)
+    per_min = sum(1 for t in _pregen_recent if now - t <= 60)
+  render_sec = st.pop("render_sec")
+  return {
+    "enabled": bool(PREVIEW_PREGEN_SPECS),
+    "specs": [f"{size}:{fmt}:{q}" for size, fmt, q in PREVIEW_PREGEN_SPECS],
+    "max_workers": PREVIEW_PREGEN_CONCURRENCY,
+    "cpu_budget": PREVIEW_PREGEN_CPU_BUDGET,
+    "backfill": PREVIEW_PREGEN_BACKFILL,
+    "backlog": backlog,
+    "per_min": per_min,
+    "eta_sec": round(backlog / per_min * 60) if per_min else None,
+    "avg_render_ms": round(render_sec / st["rendered"] * 1000, 1) if st["rendered"] else 0.0,
+    **st,
+  }
+
+# ======= 低清占位（LQIP）：每张预览图算一次 16px WebP + 主色，随 /api/scan 下发，瓦片不等缩略图即可上色 =======
+PREVIEW_LQIP = os.getenv("PREVIEW_LQIP", "1") == "1"
+_LQIP_BATCH = 64
+# 新算好的占位攒着，至多每这么多秒（或队列排空时）发布一次：发布会换 /api/scan 的 ETag，
+# 首次回填上万张时每批都换会让网格反复整页重取
+_LQIP_PUBLISH_SEC = 5.0
+
+_lqip_cv = threading.Condition()
+_lqip_queue: "deque[str]" = deque()
+_lqip_queued: set = set()
+_lqip_job_seq = itertools.count(1)
+# 已算好的结果（首次用时从 catalog.db 读入）：preview_path → (mtime_ns, size, lqip, color)，只由 worker 读写
+_LQIP_BY_PATH: Dict[str, tuple] = {}
+# 下发用：vid → (VideoItem, lqip, color)；项目对象换了（重扫过）即视为失效，/api/scan 取用时不 stat
+_LQIP_FOR: Dict[str, tuple] = {}
+_lqip_unpublished: Dict[str, tuple] = {}
+_lqip_published_at = 0.0
+_LQIP_STATE = {"running": False, "version": 0, "computed": 0, "reused": 0, "failed": 0, "missing": 0, "paused": ""}
+
+def _schedule_preview_lqip(id_map: Dict[str, VideoItem], prev_map: Optional[Dict[str, VideoItem]]):
+  """新一代快照里新增或重扫过的项排进占位队列；首代全部排入（库里已有且预览图未变的直接复用）。"""
+  if not PREVIEW_LQIP:
+    return
+  with _lqip_cv:
+    for vid in [k for k in _LQIP_FOR if k not in id_map]:
+      del _LQIP_FOR[vid]
+    for vid in [k for k in _lqip_unpublished if k not in id_map]:
+      del _lqip_unpublished[vid]
+  vids = [vid for vid, v in id_map.items()
+          if v.preview_path and (prev_map is None or prev_map.get(vid) is not v)]
+  if not vids:
+    return
+  with _lqip_cv:
+    for vid in vids:
+      if vid not in _lqip_queued:
+        _lqip_queued.add(vid)
+        _lqip_queue.append(vid)
+    if not _LQIP_STATE["running"]:
+      _LQIP_STATE["running"] = True
+      threading.Thread(target=_preview_lqip_worker, daemon=True, name="preview-lqip").start()
+    _lqip_cv.notify()
+
+def _preview_lqip_batch(batch: List[str]):
+  snap = _CATALOG
+  ready: Dict[str, tuple] = {}
+  todo = []
+  counts = {"reused": 0, "computed": 0, "failed": 0, "missing": 0}
+  for vid in batch:
+    v = snap.id_map.get(vid) if snap else None
+    path = v.preview_path if v else ""
+    try:
+      st = os.stat(path) if path else None
+    except OSError:
+      st = None
+    if st is None:
+      counts["missing"] += 1
+      continue
+    known = _LQIP_BY_PATH.get(path)
+    if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+      ready[vid] = (v, known[2], known[3])
+      counts["reused"] += 1
+    else:
+      todo.append((vid, v, path, st.st_mtime_ns, st.st_size))
+  if todo:
+    while True:
+      reason = _preview_pregen_pause_reason()
+      with _lqip_cv:
+        _LQIP_STATE["paused"] = reason
+        _lqip_publish_locked()   # 暂停期间也把之前攒下的按时发布出去
+      if not reason:
+        break
+      time.sleep(2.0)
+    results = _THUMBS.submit(f"lqip:{next(_lqip_job_seq)}", thumbs.render_placeholders,
+                             [t[2] for t in todo], priority=PRIORITY_BACKGROUND).result()
+    rows = []
+    for (vid, v, path, mtime_ns, size), res in zip(todo, results):
+      if res is None:
+        counts["failed"] += 1
+        continue
+      lqip, color = res
+      _LQIP_BY_PATH[path] = (mtime_ns, size, lqip, color)
+      rows.append((path, mtime_ns, size, lqip, color))
+      ready[vid] = (v, lqip, color)
+      counts["computed"] += 1
+    try:
+      catalog_save_placeholders(CATALOG_DB, rows)
+    except Exception as e:
+      print(f"[preview] 保存预览图占位失败: {e}")
+  with _lqip_cv:
+    _lqip_unpublished.update(ready)
+    for k, n in counts.items():
+      _LQIP_STATE[k] += n
+    _lqip_publish_locked()
+
+def _lqip_publish_locked():
+  """攒下的占位并入下发表并换版本；距上次发布不足 _LQIP_PUBLISH_SEC 且队列还有活时先不发布。"""
+  global _lqip_published_at
+  if not _lqip_unpublished:
+    return
+  now = time.monotonic()
+  if _lqip_queue and now - _lqip_published_at < _LQIP_PUBLISH_SEC:
+    return
+  _LQIP_FOR.update(_lqip_unpublished)
+  _lqip_unpublished.clear()
+  _LQIP_STATE["version"] += 1
+  _lqip_published_at = now
+
+def _preview_lqip_worker():
+  _LQIP_BY_PATH.update(catalog_load_placeholders(CATALOG_DB))
+  while True:
+    with _lqip_cv:
+      while not _lqip_queue:
+        _lqip_cv.wait()
+      batch = [_lqip_queue.popleft() for _ in range(min(_LQIP_BATCH, len(_lqip_queue)))]
+      _lqip_queued.difference_update(batch)
+    try:
+      _preview_lqip_batch(batch)
+    except Exception as e:
+      print(f"[preview] 计算预览图占位失败: {e}")
+      with _lqip_cv:
+        _LQIP_STATE["failed"] += len(batch)
+        _lqip_publish_locked()
+
+def _preview_lqip_status() -> dict:
+  with _lqip_cv:
+    st = dict(_LQIP_STATE)
+    st["backlog"] = len(_lqip_queue)
+  st.pop("running")
+  return {"enabled": PREVIEW_LQIP, "known": len(_LQIP_FOR), **st}
+
+# ======= 网格雪碧图：一页瓦片的首帧拼成一张图，首屏一次请求铺满，动图缩略图再照常懒加载 =======
+PREVIEW_SPRITE_DIR = os.path.join(PREVIEW_CACHE_DIR, "sprites")
+os.makedirs(PREVIEW_SPRITE_DIR, exist_ok=True)
+PREVIEW_SPRITE_MAX_FILES = max(1, int(os.getenv("PREVIEW_SPRITE_MAX_FILES", "200")))
+_SPRITE_MAX_TILES = 500
+_SPRITE_SPECS_MAX = 256
+_SPRITE_QUALITY = 70
+# key → (源预览图路径列表, 边长, 列数)；图片请求凭 key 找回要拼的内容
+_sprite_specs: "OrderedDict[str, Tuple[List[str], int, int]]" = OrderedDict()
+_sprite_specs_lock = threading.Lock()
+
+class SpriteRequest(BaseModel):
+  ids: List[str]
+  s: int = 96
+
+def _prune_sprites():
+  """只留最近的 PREVIEW_SPRITE_MAX_FILES 张（旧代快照的雪碧图不会再被请求）。"""
+  try:
+    with os.scandir(PREVIEW_SPRITE_DIR) as it:
+      files = [(e.stat().st_mtime, e.path) for e in it if e.is_file() and e.name.endswith(".webp")]
+  except OSError:
+    return
+  if len(files) <= PREVIEW_SPRITE_MAX_FILES:
+    return
+  files.sort()
+  for _, path in files[:len(files) - PREVIEW_SPRITE_MAX_FILES]:
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+@app.post("/api/preview/sprite")
+def api_preview_sprite(req: SpriteRequest):
+  """
+  一组视频（通常是网格一页，最多 500 个）的首帧雪碧图图集：
+  {url, tile, cols, rows, width, height, tiles: {id: [x, y]}}；没有预览图的 id 不出现在 tiles 里。
+  图片按快照版本 + 边长 + id 列表缓存，url 不变即可长期缓存；url 首次请求时才渲染。
+  """
+  size = min(256, max(32, int(req.s)))
+  snap = _catalog()
+  ids, sources, seen = [], [], set()
+  for vid in req.ids[:_SPRITE_MAX_TILES]:
+    vid = str(vid)
+    v = snap.id_map.get(vid)
+    if vid in seen or not v or not v.preview_path:
+      continue
+    seen.add(vid)
+    ids.append(vid)
+    sources.append(v.preview_path)
+  cols = max(1, math.ceil(math.sqrt(len(ids))))
+  rows = max(1, math.ceil(len(ids) / cols))
+  key_raw = f"{_catalog_tag(snap)}|{size}|{','.join(ids)}"
+  key = hashlib.sha1(key_raw.encode("utf-8")).hexdigest()[:20]
+  if ids:
+    with _sprite_specs_lock:
+      _sprite_specs[key] = (sources, size, cols)
+      _sprite_specs.move_to_end(key)
+      while len(_sprite_specs) > _SPRITE_SPECS_MAX:
+        _sprite_specs.popitem(last=False)
+  return {
+    "url": f"/media/sprite/{key}.webp" if ids else "",
+    "tile": size, "cols": cols, "rows": rows,
+    "width": cols * size, "height": rows * size,
+    "tiles": {vid: [(i % cols) * size, (i // cols) * size] for i, vid in enumerate(ids)},
+  }
+
+@app.get("/media/sprite/{key}.webp")
+async def media_sprite(key: str):
+  if not re.fullmatch(r"[0-9a-f]{20}", key):
+    raise HTTPException(404)
+  path = os.path.join(PREVIEW_SPRITE_DIR, f"{key}.webp")
+  headers = {"ETag": f'W/"sprite-{key}"', "Cache-Control": _PREVIEW_CACHE_CONTROL}
+  if not os.path.isfile(path):
+    with _sprite_specs_lock:
+      spec = _sprite_specs.get(key)
+    if spec is None:
+      raise HTTPException(404)
+    sources, size, cols = spec
+    job = _wrap_job(_THUMBS.submit(path, thumbs.render_sprite, sources, path, size, cols, _SPRITE_QUALITY,
+                                   priority=PRIORITY_RENDER))
+    await asyncio.wait({job}, timeout=PREVIEW_RENDER_TIMEOUT_SEC)
+    if not job.done() or job.exception():
+      raise HTTPException(503, detail="sprite not ready")
+    await asyncio.to_thread(_prune_sprites)
+  return FileResponse(path, media_type="image/webp", headers=headers)
 
 # =======================
 # HLS 切片（ffmpeg 输出 m3u8 + ts 段，HLS.js 播）
@@ -3215,104 +4454,110 @@ def _hls_cache_complete(out_dir: str, src_path: str) -> bool:
   except Exception:
     return False
 
-_hls_probe_cache: dict[tuple[str, int, int], dict] = {}
-def _probe_hls_codecs(src_path: str) -> dict:
-  """探测 HLS copy 是否能被浏览器/HLS.js 稳定解析。"""
-  try:
-    st = os.stat(src_path)
-    key = (os.path.abspath(src_path), int(st.st_mtime), int(st.st_size))
-  except Exception:
-    return {"video": "", "audio": "", "pix_fmt": "", "ok": False}
-  cached = _hls_probe_cache.get(key)
-  if cached:
-    return cached
-  info = {"video": "", "audio": "", "pix_fmt": "", "duration": 0.0, "ok": False}
+# ---- 媒体探测 ----
+# 每个文件只跑一次完整 ffprobe，按 (path, mtime_ns, size) 存进 SQLite，重启后直接复用；
+# HLS 编码判定、时长、竖横屏、音轨校验都从这份记录取值。
+MEDIA_PROBE_DB = os.getenv("MEDIA_PROBE_DB", os.path.join(DATA_DIR, "media_probe.db"))
+_PROBE_STORE = ProbeStore(MEDIA_PROBE_DB)
+
+# ---- 后台预探测 ----
+# 每发布一代快照，把新增/变化项的视频排进队列，由低优先级线程池预先探测；
+# 用户打开文件夹（竖横屏筛选）或点播放（HLS 编码判定）时元数据已在探测库里。
+# 与请求路径上的探测共用 _PROBE_STORE，同一文件并发只跑一次 ffprobe。
+MEDIA_PROBE_WORKERS = max(0, int(os.getenv("MEDIA_PROBE_WORKERS", "2")))
+MEDIA_PROBE_NICE = int(os.getenv("MEDIA_PROBE_NICE", "10"))
+
+_probe_cv = threading.Condition()
+_probe_queue: "deque[str]" = deque()
+_probe_queued: set = set()
+_probe_recent: "deque[float]" = deque(maxlen=4096)   # 实际探测完成时间，算吞吐
+_PROBE_PIPELINE = {
+  "workers": 0, "active": 0, "enqueued": 0,
+  "probed": 0, "cached": 0, "failed": 0, "missing": 0, "probe_sec": 0.0,
+}
+
+def _schedule_media_probe(id_map: Dict[str, VideoItem], prev_map: Optional[Dict[str, VideoItem]]):
+  """新一代快照里对象变了（新增或重扫过）的项排进预探测队列；首代全部排入，已探测过的会直接跳过。"""
+  if MEDIA_PROBE_WORKERS <= 0:
+    return
+  paths = [v.video_path for vid, v in id_map.items()
+           if v.video_path and (prev_map is None or prev_map.get(vid) is not v)]
+  if not paths:
+    return
+  with _probe_cv:
+    n = 0
+    for p in paths:
+      if p not in _probe_queued:
+        _probe_queued.add(p)
+        _probe_queue.append(p)
+        n += 1
+    _PROBE_PIPELINE["enqueued"] += n
+    while _PROBE_PIPELINE["workers"] < MEDIA_PROBE_WORKERS:
+      _PROBE_PIPELINE["workers"] += 1
+      threading.Thread(target=_media_probe_worker, daemon=True,
+                       name=f"media-probe-{_PROBE_PIPELINE['workers']}").start()
+    _probe_cv.notify_all()
+
+def _media_probe_worker():
+  # nice 在 Linux 上按线程生效，ffprobe 子进程继承，不跟播放/转码抢 CPU
   try:
-    p = subprocess.run(
-      [
-        "ffprobe", "-v", "error",
-        "-show_entries", "stream=index,codec_type,codec_name,pix_fmt,width,height,duration,avg_frame_rate,r_frame_rate,color_space,color_transfer,color_primaries:format=duration",
-        "-of", "json",
-        src_path,
-      ],
-      stdout=subprocess.PIPE,
-      stderr=subprocess.PIPE,
-      text=True,
-      timeout=10,
-    )
-    data = json.loads(p.stdout or "{}")
-    format_duration = 0.0
-    video_duration = 0.0
-    audio_duration = 0.0
+    os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), MEDIA_PROBE_NICE)
+  except (AttributeError, OSError):
+    pass
+  while True:
+    with _probe_cv:
+      while not _probe_queue:
+        _probe_cv.wait()
+      path = _probe_queue.popleft()
+      _probe_queued.discard(path)
+      _PROBE_PIPELINE["active"] += 1
+    t0 = time.perf_counter()
     try:
-      format_duration = float((data.get("format") or {}).get("duration") or 0)
-    except Exception:
-      pass
-    for s in (data.get("streams") or []):
-      typ = (s.get("codec_type") or "").lower()
-      try:
-        d = float(s.get("duration") or 0)
-      except Exception:
-        d = 0.0
-      if typ == "video" and d > 0 and video_duration <= 0:
-        video_duration = d
-      elif typ == "audio" and d > 0 and audio_duration <= 0:
-        audio_duration = d
-      if typ == "video" and not info["video"]:
-        info["video"] = (s.get("codec_name") or "").lower()
-        info["pix_fmt"] = (s.get("pix_fmt") or "").lower()
-        try:
-          info["width"] = int(s.get("width") or 0)
-          info["height"] = int(s.get("height") or 0)
-        except Exception:
-          info["width"] = info["height"] = 0
-        info["color_space"] = (s.get("color_space") or "").lower()
-        info["color_transfer"] = (s.get("color_transfer") or "").lower()
-        info["color_primaries"] = (s.get("color_primaries") or "").lower()
-        for rate_key in ("avg_frame_rate", "r_frame_rate"):
-          rate = (s.get(rate_key) or "").strip()
-          if "/" in rate:
-            try:
-              n, d = rate.split("/", 1)
-              fps = float(n) / max(1.0, float(d))
-              if fps > 0:
-                info["fps"] = fps
-                break
-            except Exception:
-              pass
-      elif typ == "audio" and not info["audio"]:
-        info["audio"] = (s.get("codec_name") or "").lower()
-    # Media-library style runtime: prefer the primary video stream, then container,
-    # then audio. This avoids long audio/container tails stretching the player UI
-    # past the point where video can actually continue.
-    info["duration"] = max(0.0, video_duration or format_duration or audio_duration)
-    info["format_duration"] = max(0.0, format_duration)
-    info["video_duration"] = max(0.0, video_duration)
-    info["audio_duration"] = max(0.0, audio_duration)
-  except Exception as e:
-    logging.warning("[hls] ffprobe failed for %s: %s", src_path, e)
-  info["ok"] = True
-  _hls_probe_cache[key] = info
-  return info
+      result = _PROBE_STORE.ensure(path)
+    except Exception as e:
+      print(f"[probe] 后台探测异常 {path}: {e}")
+      result = "failed"
+    dt = time.perf_counter() - t0
+    with _probe_cv:
+      _PROBE_PIPELINE["active"] -= 1
+      _PROBE_PIPELINE[result] += 1
+      if result in ("probed", "failed"):
+        _PROBE_PIPELINE["probe_sec"] += dt
+        _probe_recent.append(time.time())
+
+@app.get("/api/probe/status")
+def api_probe_status():
+  """后台预探测进度：积压数、吞吐（最近 60 秒每分钟探测数）、预计剩余时间与探测库统计。"""
+  now = time.time()
+  with _probe_cv:
+    st = dict(_PROBE_PIPELINE)
+    backlog = len(_probe_queue)
+    per_min = sum(1 for t in _probe_recent if now - t <= 60)
+  probe_sec = st.pop("probe_sec")
+  ran = st["probed"] + st["failed"]
+  return {
+    "enabled": MEDIA_PROBE_WORKERS > 0,
+    "max_workers": MEDIA_PROBE_WORKERS,
+    "backlog": backlog,
+    "per_min": per_min,
+    "eta_sec": round(backlog / per_min * 60) if per_min else None,
+    "avg_probe_ms": round(probe_sec / ran * 1000, 1) if ran else 0.0,
+    **st,
+    "store": _PROBE_STORE.stats(),
+  }
+
+def _probe_hls_codecs(src_path: str) -> dict:
+  """探测 HLS copy 是否能被浏览器/HLS.js 稳定解析。"""
+  info = _PROBE_STORE.get(src_path)
+  if info is None:
+    # 文件不存在时 ok=False；ffprobe 失败按「未知编码」处理（后续判定会走转码）
+    return {"video": "", "audio": "", "pix_fmt": "", "duration": 0.0, "ok": os.path.exists(src_path)}
+  return dict(info, ok=True)
 
 def _probe_media_duration_fallback(src_path: str) -> float:
-  """ffprobe 个别文件读不到 format.duration 时，用 ffmpeg stderr 的 Duration 兜底。"""
-  try:
-    p = subprocess.run(
-      ["ffmpeg", "-hide_banner", "-i", src_path],
-      stdout=subprocess.PIPE,
-      stderr=subprocess.PIPE,
-      text=True,
-      timeout=10,
-    )
-    txt = (p.stderr or "") + "\n" + (p.stdout or "")
-    m = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", txt)
-    if not m:
-      return 0.0
-    hh, mm, ss = int(m.group(1)), int(m.group(2)), float(m.group(3))
-    return max(0.0, hh * 3600 + mm * 60 + ss)
-  except Exception:
-    return 0.0
+  """ffprobe 个别文件读不到 format.duration 时，用 ffmpeg stderr 的 Duration 兜底（探测时已一并取好）。"""
+  info = _PROBE_STORE.get(src_path)
+  return float((info or {}).get("fallback_duration") or 0.0)
 
 def _hls_source_size(src_path: str) -> int:
   try:
@@ -5043,19 +6288,13 @@ _start_audio_cache_cleaner()
 def _verify_audio_timestamps(audio_path: str, video_src: str, vid: str) -> bool:
     """Check that extracted audio starts near t=0 and duration matches the source video."""
     try:
-        probe_audio = subprocess.run(
-            ["ffprobe", "-v", "quiet", "-print_format", "json",
-             "-show_format", "-show_streams", "-select_streams", "a:0",
-             audio_path],
-            capture_output=True, text=True, timeout=10)
-        ainfo = json.loads(probe_audio.stdout)
-
-        fmt_start = float(ainfo.get("format", {}).get("start_time", "0") or "0")
-        streams = ainfo.get("streams", [])
-        stream_start = float(streams[0].get("start_time", "0") or "0") if streams else 0.0
-        audio_dur = float(ainfo.get("format", {}).get("duration", "0") or "0")
-
-        start = max(fmt_start, stream_start)
+        # 抽取中的临时文件不入探测库；源视频的时长直接取共享探测记录
+        ainfo = _PROBE_STORE.get(audio_path, persist=False)
+        if ainfo is None:
+            return True
+
+        start = max(ainfo.get("start_time") or 0.0, ainfo.get("audio_start_time") or 0.0)
+        audio_dur = ainfo.get("format_duration") or 0.0
         if start > 0.5:
             print(f"[AUDIO_CACHE] copy has start_time={start:.2f}s, "
                   f"falling back to transcode for {vid}")
@@ -5063,22 +6302,15 @@ def _verify_audio_timestamps(audio_path: str, video_src: str, vid: str) -> bool:
 
         # Also compare durations: if audio is significantly longer than the
         # source video, there's a hidden timestamp offset (e.g. edit lists).
-        try:
-            probe_video = subprocess.run(
-                ["ffprobe", "-v", "quiet", "-print_format", "json",
-                 "-show_format", video_src],
-                capture_output=True, text=True, timeout=10)
-            vinfo = json.loads(probe_video.stdout)
-            video_dur = float(vinfo.get("format", {}).get("duration", "0") or "0")
-            if video_dur > 0 and audio_dur > 0:
-                diff = audio_dur - video_dur
-                if diff > 1.0:
-                    print(f"[AUDIO_CACHE] audio duration ({audio_dur:.1f}s) exceeds "
-                          f"video ({video_dur:.1f}s) by {diff:.1f}s, "
-                          f"falling back to transcode for {vid}")
-                    return False
-        except Exception:
-            pass
+        vinfo = _PROBE_STORE.get(video_src)
+        video_dur = (vinfo or {}).get("format_duration") or 0.0
+        if video_dur > 0 and audio_dur > 0:
+            diff = audio_dur - video_dur
+            if diff > 1.0:
+                print(f"[AUDIO_CACHE] audio duration ({audio_dur:.1f}s) exceeds "
+                      f"video ({video_dur:.1f}s) by {diff:.1f}s, "
+                      f"falling back to transcode for {vid}")
+                return False
 
         return True
     except Exception:
@@ -0,0 +1,357 @@
+# media_probe.py — 媒体探测结果的持久化存储（SQLite）
+#
+# HLS 编码判定、竖横屏筛选、音轨抽取校验、码率估算原本各自跑 ffprobe、各存一份进程内字典，
+# 重启即失效。这里对每个文件只跑一次完整的 ffprobe（-show_format -show_streams），
+# 归纳成一条摘要记录，按 (path, mtime_ns, size) 存进 SQLite，所有调用方共用。
+# 前面挂一层有界 LRU，命中时不碰数据库；同一文件并发请求只探测一次。
+import json, os, re, sqlite3, struct, subprocess, threading, time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# 摘要格式版本：字段含义变化时 +1，旧记录视为未探测
+PROBE_VERSION = 2
+
+_MEM_CACHE_SIZE = 4096
+_FFPROBE_TIMEOUT = 10
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_MP4_EXTS = (".mp4", ".m4v", ".mov")
+_ffprobe_missing_logged = False
+
+
+def _float(x) -> float:
+    try:
+        return float(x or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _int(x) -> int:
+    try:
+        return int(x or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _fps(stream: dict) -> float:
+    for rate_key in ("avg_frame_rate", "r_frame_rate"):
+        rate = (stream.get(rate_key) or "").strip()
+        if "/" in rate:
+            n, d = rate.split("/", 1)
+            fps = _float(n) / max(1.0, _float(d))
+            if fps > 0:
+                return fps
+    return 0.0
+
+
+def _rotation(stream: dict) -> int:
+    rot = _int((stream.get("tags") or {}).get("rotate"))
+    for sd in (stream.get("side_data_list") or []):
+        if "rotation" in sd:
+            rot = int(_float(sd.get("rotation")))
+            break
+    return rot
+
+
+def summarize(data: dict) -> dict:
+    """
+    把 ffprobe 的 JSON 输出归纳成摘要：
+      video/audio/pix_fmt/color_*：首条视频/音频流的编码信息
+      width/height：编码尺寸；rotation：旋转角度（显示尺寸需按它交换宽高）
+      duration：优先视频流时长，其次容器、音频（与播放器显示一致）
+      start_time/audio_start_time：容器与首条音频流的起始时间（音轨抽取校验用）
+      bit_rate：容器码率（bps），缺失时由大小/时长推算（run_ffprobe 中补）
+    """
+    fmt = data.get("format") or {}
+    info = {
+        "video": "", "audio": "", "pix_fmt": "",
+        "width": 0, "height": 0, "rotation": 0, "fps": 0.0,
+        "color_space": "", "color_transfer": "", "color_primaries": "",
+        "format_duration": _float(fmt.get("duration")),
+        "video_duration": 0.0, "audio_duration": 0.0,
+        "start_time": _float(fmt.get("start_time")),
+        "audio_start_time": 0.0,
+        "bit_rate": _int(fmt.get("bit_rate")),
+    }
+    for s in (data.get("streams") or []):
+        typ = (s.get("codec_type") or "").lower()
+        d = _float(s.get("duration"))
+        if typ == "video" and not info["video"]:
+            info.update({
+                "video": (s.get("codec_name") or "").lower(),
+                "pix_fmt": (s.get("pix_fmt") or "").lower(),
+                "width": _int(s.get("width")),
+                "height": _int(s.get("height")),
+                "rotation": _rotation(s),
+                "fps": _fps(s),
+                "color_space": (s.get("color_space") or "").lower(),
+                "color_transfer": (s.get("color_transfer") or "").lower(),
+                "color_primaries": (s.get("color_primaries") or "").lower(),
+                "video_duration": max(0.0, d),
+            })
+        elif typ == "audio" and not info["audio"]:
+            info.update({
+                "audio": (s.get("codec_name") or "").lower(),
+                "audio_duration": max(0.0, d),
+                "audio_start_time": _float(s.get("start_time")),
+            })
+    info["duration"] = max(0.0, info["video_duration"] or info["format_duration"] or info["audio_duration"])
+    return info
+
+
+def mp4_moov_position(path: str) -> Tuple[int, bool]:
+    """
+    扫 MP4/MOV 顶层 box，返回 (moov 偏移, moov 是否在 mdat 之前)。
+    moov 在后的文件浏览器直连播放要先 Range 到文件尾，适合做 faststart。非 MP4 或解析失败返回 (-1, False)。
+    """
+    if not path.lower().endswith(_MP4_EXTS):
+        return -1, False
+    try:
+        with open(path, "rb") as f:
+            total = os.fstat(f.fileno()).st_size
+            off, mdat = 0, -1
+            while off + 8 <= total:
+                f.seek(off)
+                hdr = f.read(16)
+                if len(hdr) < 8:
+                    break
+                size, typ = struct.unpack(">I4s", hdr[:8])
+                if size == 1 and len(hdr) >= 16:
+                    size = struct.unpack(">Q", hdr[8:16])[0]
+                elif size == 0:
+                    size = total - off
+                if size < 8:
+                    break
+                if typ == b"moov":
+                    return off, mdat < 0
+                if typ == b"mdat" and mdat < 0:
+                    mdat = off
+                off += size
+    except OSError:
+        pass
+    return -1, False
+
+
+def run_ffprobe(path: str) -> Optional[dict]:
+    """对 path 跑一次完整 ffprobe 并归纳；读不到时长时用 ffmpeg 的 Duration 行兜底。失败返回 None。"""
+    try:
+        p = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=_FFPROBE_TIMEOUT,
+        )
+        data = json.loads(p.stdout or "{}")
+    except FileNotFoundError as e:
+        # 没装 ffprobe 时后台预探测会对每个文件都失败，只提示一次
+        global _ffprobe_missing_logged
+        if not _ffprobe_missing_logged:
+            _ffprobe_missing_logged = True
+            print(f"[probe] ⚠ 找不到 ffprobe，媒体探测不可用：{e}")
+        return None
+    except Exception as e:
+        print(f"[probe] ffprobe 失败 {path}: {e}")
+        return None
+    if not data:
+        return None
+    info = summarize(data)
+    info["fallback_duration"] = 0.0
+    if info["format_duration"] <= 0:
+        try:
+            p = subprocess.run(["ffmpeg", "-hide_banner", "-i", path], stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True, timeout=_FFPROBE_TIMEOUT)
+            m = _DURATION_RE.search((p.stderr or "") + "\n" + (p.stdout or ""))
+            if m:
+                info["fallback_duration"] = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+        except Exception:
+            pass
+    info["moov_offset"], info["faststart"] = mp4_moov_position(path)
+    if not info["bit_rate"]:
+        dur = info["duration"] or info["fallback_duration"]
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if dur > 0 and size > 0:
+            info["bit_rate"] = int(size * 8 / dur)
+    return info
+
+
+class MediaColumns(NamedTuple):
+    """排序/筛选用的紧凑列。width/height 为显示尺寸（已按 rotation 交换）。"""
+    mtime_ns: int
+    size: int
+    duration: float
+    width: int
+    height: int
+    bit_rate: int
+    codec: str
+
+
+def _columns_of(info: dict) -> tuple:
+    w, h = info.get("width") or 0, info.get("height") or 0
+    if abs(info.get("rotation") or 0) % 180 == 90:
+        w, h = h, w
+    return (float(info.get("duration") or info.get("fallback_duration") or 0.0), int(w), int(h),
+            int(info.get("bit_rate") or 0), info.get("video") or "")
+
+
+def file_key(path: str) -> Optional[Tuple[str, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+class ProbeStore:
+    """
+    探测结果存储。get(path) 返回摘要 dict（调用方不得修改），文件不存在或探测失败返回 None。
+    失败结果只记在内存里（ffprobe 暂时不可用、文件还没下载完时，重启后会再试）。
+    """
+
+    def __init__(self, db_path: str, probe_fn=run_ffprobe):
+        self.db_path = db_path
+        self.probe_fn = probe_fn
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._mem: "OrderedDict[str, Tuple[int, int, Optional[dict]]]" = OrderedDict()
+        self._inflight: Dict[tuple, threading.Event] = {}
+        self.stats_counters = {"mem_hits": 0, "db_hits": 0, "probes": 0, "failures": 0}
+        # 全部记录的紧凑列（首次 columns() 时整表读入，之后随新探测增量更新）；version 每写入一条 +1
+        self.version = 0
+        self._columns: Optional[Dict[str, MediaColumns]] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS media_probe (
+                path      TEXT PRIMARY KEY,
+                mtime_ns  INTEGER NOT NULL,
+                size      INTEGER NOT NULL,
+                version   INTEGER NOT NULL,
+                probed_at REAL NOT NULL,
+                info      TEXT NOT NULL
+            )""")
+            # 排序/筛选用的展开列，不必逐条解析 info
+            have = {r[1] for r in conn.execute("PRAGMA table_info(media_probe)")}
+            for col, decl in (("duration", "REAL NOT NULL DEFAULT 0"), ("width", "INTEGER NOT NULL DEFAULT 0"),
+                              ("height", "INTEGER NOT NULL DEFAULT 0"), ("bit_rate", "INTEGER NOT NULL DEFAULT 0"),
+                              ("codec", "TEXT NOT NULL DEFAULT ''")):
+                if col not in have:
+                    conn.execute(f"ALTER TABLE media_probe ADD COLUMN {col} {decl}")
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, path: str, mtime_ns: int, size: int, info: Optional[dict]):
+        self._mem[path] = (mtime_ns, size, info)
+        self._mem.move_to_end(path)
+        while len(self._mem) > _MEM_CACHE_SIZE:
+            self._mem.popitem(last=False)
+
+    def _lookup(self, key: Tuple[str, int, int]):
+        """已知结果（含失败）返回 (True, info)；需要探测返回 (False, None)。须持锁调用。"""
+        path, mtime_ns, size = key
+        hit = self._mem.get(path)
+        if hit is not None and hit[0] == mtime_ns and hit[1] == size:
+            self._mem.move_to_end(path)
+            self.stats_counters["mem_hits"] += 1
+            return True, hit[2]
+        try:
+            row = self._db().execute(
+                "SELECT mtime_ns, size, version, info FROM media_probe WHERE path=?", (path,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"[probe] 读取探测记录失败：{e}")
+            row = None
+        if row and row[0] == mtime_ns and row[1] == size and row[2] == PROBE_VERSION:
+            info = json.loads(row[3])
+            self._remember(path, mtime_ns, size, info)
+            self.stats_counters["db_hits"] += 1
+            return True, info
+        return False, None
+
+    def ensure(self, path: str) -> str:
+        """后台预探测用：已有记录返回 "cached"，否则探测一次，返回 "probed" / "failed"；文件不存在返回 "missing"。"""
+        key = file_key(path)
+        if key is None:
+            return "missing"
+        with self._lock:
+            if self._lookup(key)[0]:
+                return "cached"
+        return "probed" if self.get(path) is not None else "failed"
+
+    def get(self, path: str, persist: bool = True) -> Optional[dict]:
+        """
+        取 path 的探测摘要，没有就现场探测一次。persist=False 用于临时文件
+        （如抽取中的音轨），结果不落库、不进缓存。
+        """
+        if not persist:
+            return self.probe_fn(path)
+        key = file_key(path)
+        if key is None:
+            return None
+        while True:
+            with self._lock:
+                known, info = self._lookup(key)
+                if known:
+                    return info
+                ev = self._inflight.get(key)
+                if ev is None:
+                    ev = self._inflight[key] = threading.Event()
+                    break
+            ev.wait(_FFPROBE_TIMEOUT * 3)
+        try:
+            info = self.probe_fn(path)
+            with self._lock:
+                self.stats_counters["probes"] += 1
+                path_abs, mtime_ns, size = key
+                self._remember(path_abs, mtime_ns, size, info)
+                if info is None:
+                    self.stats_counters["failures"] += 1
+                else:
+                    cols = _columns_of(info)
+                    try:
+                        with self._db() as conn:
+                            conn.execute(
+                                "INSERT OR REPLACE INTO media_probe(path, mtime_ns, size, version, probed_at, info, "
+                                "duration, width, height, bit_rate, codec) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
+                                (path_abs, mtime_ns, size, PROBE_VERSION, time.time(),
+                                 json.dumps(info, separators=(",", ":"))) + cols)
+                    except sqlite3.Error as e:
+                        print(f"[probe] 写入探测记录失败：{e}")
+                    if self._columns is not None:
+                        self._columns[path_abs] = MediaColumns(mtime_ns, size, *cols)
+                    self.version += 1
+            return info
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            ev.set()
+
+    def columns(self) -> Tuple[int, Dict[str, MediaColumns]]:
+        """
+        (version, 绝对路径 → MediaColumns)。只含已落库的记录，不触发探测；
+        调用方需自行用 mtime_ns/size 判断记录是否还对应当前文件。返回的 dict 只读。
+        """
+        with self._lock:
+            if self._columns is None:
+                cols: Dict[str, MediaColumns] = {}
+                try:
+                    for row in self._db().execute(
+                            "SELECT path, mtime_ns, size, duration, width, height, bit_rate, codec "
+                            "FROM media_probe WHERE version=?", (PROBE_VERSION,)):
+                        cols[row[0]] = MediaColumns(*row[1:])
+                except sqlite3.Error as e:
+                    print(f"[probe] 读取探测列失败：{e}")
+                self._columns = cols
+            return self.version, self._columns
+
+    def stats(self) -> dict:
+        with self._lock:
+            try:
+                rows = self._db().execute("SELECT COUNT(*) FROM media_probe").fetchone()[0]
+            except sqlite3.Error:
+                rows = -1
+            return dict(self.stats_counters, rows=rows, mem_entries=len(self._mem), inflight=len(self._inflight))
@@ -9,6 +9,7 @@ class FolderOut(BaseModel):
 class VideoOut(BaseModel):
     id: str
     title: str
+    author: str = ""
     mtime: float
     size: int
     rating: str
@@ -16,6 +17,8 @@ class VideoOut(BaseModel):
     video_url: str
     workshop_url: str
     is_workshop: bool = True
+    lqip: str = ""   # 16px WebP data URI，后台算好后才有
+    color: str = ""  # 预览图主色 #rrggbb
 
 class ScanResponse(BaseModel):
     breadcrumb: List[str]
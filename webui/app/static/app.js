@@ -2569,6 +2569,7 @@ async function apiCreateFolder(parent, title){
     headers:{"Content-Type":"application/json"},
     body: JSON.stringify({ parent, title })
   }).catch(()=>null);
+  markCatalogStale();
   return !!(r && r.ok);
 }
 async function apiMoveDetailed(payload, dest_path){
@@ -2578,6 +2579,7 @@ async function apiMoveDetailed(payload, dest_path){
     headers:{"Content-Type":"application/json"},
     body: JSON.stringify({ ids: p.ids, folder_paths: p.folderPaths, dest_path: dest_path || "/" })
   }).catch(()=>null);
+  markCatalogStale();
   if (!r || !r.ok) return { ok: false, moved: 0, moved_folders: 0 };
   const j = await r.json().catch(()=>({}));
   return {
@@ -3448,11 +3450,22 @@ async function showDiagIfEmpty(){
   }catch(_){}
 }
 
+// 当前页面数据所属的目录快照版本；/api/scan/watch?since= 据此判断服务端是否已发布新数据。
+// 列表请求带上 cv=版本：同一版本内的 URL 内容不变，浏览器可直接复用缓存（前进/后退不回源）；
+// 版本未知（刚做过增删移动）时不带 cv，服务端只允许回源校验，保证看到自己的修改。
+let lastCatalogTag = "";
+function markCatalogStale(){ lastCatalogTag = ""; }
+function withCatalogVersion(params){
+  if (lastCatalogTag) params.set("cv", lastCatalogTag);
+  return params;
+}
 async function apiScan(opts, page, signal){
   const params = new URLSearchParams({ path:opts.path, page, per_page:opts.per_page, sort_idx:opts.sort_idx, mature_only:String(opts.mature_only), q:opts.q });
-  const res = await fetch(`/api/scan?${params.toString()}`, { signal });
+  const res = await fetch(`/api/scan?${withCatalogVersion(params).toString()}`, { signal });
   if (!res.ok) throw new Error(`HTTP ${res.status}`);
-  return res.json();
+  const data = await res.json();
+  if (data.catalog) lastCatalogTag = data.catalog;
+  return data;
 }
 
 function resetPrefetch(){ if (prefetchState.controller) try{ prefetchState.controller.abort(); }catch(_){}
@@ -3504,6 +3517,7 @@ async function loadNextPage(){
     if (state.page===1){ grid().innerHTML=""; state.tiles=[]; }
     const newIds = appendTiles(data);
     if (newIds.length) syncWatched(newIds);
+    if (newIds.length) paintGridSprite(newIds);
 
     state.hasMore = state.page < data.total_pages;
     state.page += 1;
@@ -3561,7 +3575,7 @@ function appendTiles(data){
     const fallback = base;
     const el = document.createElement("div");
     el.className="tile"; el.dataset.type="video"; el.dataset.vid=v.id; el.dataset.idx=idx;
-    el.innerHTML = `<div class="thumb">
+    el.innerHTML = `<div class="thumb"${thumbPlaceholderAttrs(v)}>
                       <img
                         src="${thumb}"
                         alt="preview" draggable="false" loading="lazy" decoding="async" fetchpriority="low"
@@ -3584,6 +3598,47 @@ function appendTiles(data){
   return batchVideoIds;
 }
 
+/* —— 低清占位：/api/scan 带回的 16px WebP + 主色，瓦片创建时直接铺在 .thumb 底下 —— */
+function thumbPlaceholderAttrs(v){
+  const lqip = typeof v.lqip === "string" && v.lqip.startsWith("data:image/webp;base64,") ? v.lqip : "";
+  const color = /^#[0-9a-f]{6}$/i.test(v.color || "") ? v.color : "";
+  if (!lqip && !color) return "";
+  const style = [
+    color ? `background-color:${color}` : "",
+    lqip ? `background-image:url(${lqip});background-size:cover;background-position:center` : "",
+  ].filter(Boolean).join(";");
+  return ` style="${style}"${lqip ? ` data-lqip="${lqip}"` : ""}`;
+}
+
+/* —— 首屏雪碧图：一页瓦片的首帧拼成一张图，一次请求先铺底，动图缩略图照常懒加载后盖上去 —— */
+const GRID_SPRITE_TILE = 96;
+async function paintGridSprite(ids){
+  if (!ids || ids.length < 2) return;
+  let atlas = null;
+  try{
+    const r = await fetch("/api/preview/sprite", {
+      method:"POST", headers:{ "Content-Type":"application/json" },
+      body: JSON.stringify({ ids, s: GRID_SPRITE_TILE }),
+    });
+    if (r.ok) atlas = await r.json();
+  }catch(_){}
+  if (!atlas || !atlas.url) return;
+  const { url, tile, cols, rows, tiles } = atlas;
+  for (const t of state.tiles){
+    if (t.type !== "video") continue;
+    const pos = tiles[String(t.vid)];
+    const thumb = pos && t.el && t.el.querySelector(".thumb");
+    if (!thumb || thumb.dataset.sprite) continue;
+    const col = pos[0] / tile, row = pos[1] / tile;
+    // 雪碧图叠在低清占位上面，雪碧图还没下载完时仍露出占位
+    const lq = thumb.dataset.lqip;
+    thumb.dataset.sprite = "1";
+    thumb.style.backgroundImage = lq ? `url("${url}"), url(${lq})` : `url("${url}")`;
+    thumb.style.backgroundSize = `${cols * 100}% ${rows * 100}%` + (lq ? ", cover" : "");
+    thumb.style.backgroundPosition = `${cols > 1 ? col / (cols - 1) * 100 : 0}% ${rows > 1 ? row / (rows - 1) * 100 : 0}%` + (lq ? ", center" : "");
+  }
+}
+
 /* —— 封面图延迟载入 —— */
 function deferImage(img){
   if (!img || img.dataset.deferred === "1") return;
@@ -3656,7 +3711,7 @@ function createTileFromSpec(spec, idx){
   const thumb = `${base}?s=256&fmt=webp&q=80`;
   const fallback = base;
   el.className = "tile"; el.dataset.type = "video"; el.dataset.vid = v.id; el.dataset.idx = idx;
-  el.innerHTML = `<div class="thumb">
+  el.innerHTML = `<div class="thumb"${thumbPlaceholderAttrs(v)}>
                     <img
                       src="${thumb}"
                       alt="preview" draggable="false" loading="lazy" decoding="async" fetchpriority="low"
@@ -3768,7 +3823,7 @@ async function softRefreshCurrentScanContext(){
   setInfStatus("检测到文件变化，正在更新…");
   state.isLoading = true;
   try{
-    await fetch("/api/scan/refresh", { method: "POST", cache: "no-store" });
+    // /api/scan/watch 已把变化源标记为 dirty，下面的 /api/scan 会只做增量扫描
     const opts = snapshotOpts();
     const pages = [];
     for (let p = 1; p <= loadedPages; p++){
@@ -3789,6 +3844,7 @@ async function softRefreshCurrentScanContext(){
     const frag = document.createDocumentFragment();
     const nextTiles = [];
     const videoIds = [];
+    const newVideoIds = [];
     specs.forEach((spec, idx)=>{
       const key = spec.type === "parent" ? `parent:${spec.path}` : spec.type === "folder" ? `folder:${spec.path}` : `video:${String(spec.vid)}`;
       const old = existing.get(key);
@@ -3796,6 +3852,7 @@ async function softRefreshCurrentScanContext(){
       frag.appendChild(tile.el);
       nextTiles.push(tile);
       if (tile.type === "video") videoIds.push(String(tile.vid));
+      if (!old && tile.type === "video") newVideoIds.push(String(tile.vid));
     });
     grid().replaceChildren(frag);
     state.tiles = nextTiles;
@@ -3803,6 +3860,8 @@ async function softRefreshCurrentScanContext(){
     state.hasMore = pages.length < last.total_pages;
     setInfStatus(state.hasMore ? "下拉加载更多…" : "已到底部");
     if (videoIds.length) syncWatched(videoIds);
+    // 复用的瓦片保留原来的雪碧图底；新建的瓦片补一张
+    if (newVideoIds.length) paintGridSprite(newVideoIds);
     bindDelegatedEvents(); bindRubber(); installFolderDrop(); resetPrefetch(); schedulePrefetch();
     try{ window.scrollTo(scrollX, scrollY); }catch(_){}
   }catch(_){
@@ -3818,28 +3877,42 @@ async function refreshCurrentScanContext(reason="manual"){
   try {
     await fetch("/api/scan/refresh", { method: "POST", cache: "no-store" });
   } catch (_) {}
+  markCatalogStale();
   changeContext({});
 }
 
-const scanWatch = { timer:null, running:false, lastAutoRefresh:0, pending:false };
+// 目录变化通知：优先用 /api/scan/events（SSE，快照一发布就推送），连接不可用时退回 15 秒轮询 /api/scan/watch
+const scanWatch = { timer:null, running:false, lastAutoRefresh:0, pending:false, source:null, retryTimer:null };
+async function applyCatalogChange(tag){
+  // 新版本的 URL 浏览器里不会有缓存，随后的软刷新一定拿到新数据
+  if (tag) lastCatalogTag = tag;
+  if (isPlayerActive() || document.visibilityState !== "visible"){
+    scanWatch.pending = true;
+    return;
+  }
+  const wait = 10000 - (Date.now() - scanWatch.lastAutoRefresh);
+  if (wait > 0){
+    // 刚自动刷新过：攒到冷却结束再刷一次，不丢这次变化
+    if (!scanWatch.pending){
+      scanWatch.pending = true;
+      setTimeout(flushPendingScanRefresh, wait);
+    }
+    return;
+  }
+  scanWatch.lastAutoRefresh = Date.now();
+  scanWatch.pending = false;
+  await refreshCurrentScanContext("auto");
+}
 async function checkScanChanges(){
   if (scanWatch.running) return;
   if (document.visibilityState !== "visible") return;
   scanWatch.running = true;
   try{
-    const r = await fetch("/api/scan/watch", { cache: "no-store" });
+    const r = await fetch(`/api/scan/watch?since=${encodeURIComponent(lastCatalogTag)}`, { cache: "no-store" });
     if (!r.ok) return;
     const j = await r.json().catch(()=>null);
     if (!j || !j.changed) return;
-    if (isPlayerActive()){
-      scanWatch.pending = true;
-      return;
-    }
-    const now = Date.now();
-    if (now - scanWatch.lastAutoRefresh < 10000) return;
-    scanWatch.lastAutoRefresh = now;
-    scanWatch.pending = false;
-    await refreshCurrentScanContext("auto");
+    await applyCatalogChange(j.catalog);
   }catch(_){
   }finally{
     scanWatch.running = false;
@@ -3848,14 +3921,51 @@ async function checkScanChanges(){
 async function flushPendingScanRefresh(){
   if (!scanWatch.pending) return;
   if (document.visibilityState !== "visible") return;
+  if (isPlayerActive()) return;
   scanWatch.pending = false;
   scanWatch.lastAutoRefresh = Date.now();
   await refreshCurrentScanContext("auto");
 }
-function startScanWatch(){
+function startScanPolling(){
   if (scanWatch.timer) return;
   scanWatch.timer = setInterval(checkScanChanges, 15000);
 }
+function stopScanPolling(){
+  if (!scanWatch.timer) return;
+  clearInterval(scanWatch.timer);
+  scanWatch.timer = null;
+}
+function startScanEvents(){
+  if (scanWatch.source) return;
+  let es;
+  try{ es = new EventSource("/api/scan/events"); }catch(_){ startScanPolling(); return; }
+  scanWatch.source = es;
+  es.addEventListener("catalog", (ev)=>{
+    stopScanPolling();
+    let j = null;
+    try{ j = JSON.parse(ev.data); }catch(_){ return; }
+    // 刚做过增删移动（版本未知）时随后的列表请求本来就会取新数据，这里不必再刷
+    if (!j || !j.catalog || !lastCatalogTag || j.catalog === lastCatalogTag) return;
+    applyCatalogChange(j.catalog);
+  });
+  es.onerror = ()=>{
+    // 断线期间用轮询兜底；EventSource 会按服务端给的 retry 自动重连，重连后收到首条事件即停掉轮询
+    startScanPolling();
+    if (es.readyState === EventSource.CLOSED){
+      scanWatch.source = null;
+      if (!scanWatch.retryTimer){
+        scanWatch.retryTimer = setTimeout(()=>{ scanWatch.retryTimer = null; startScanEvents(); }, 60000);
+      }
+    }
+  };
+}
+function startScanWatch(){
+  if (typeof EventSource === "undefined"){ startScanPolling(); return; }
+  startScanEvents();
+}
+document.addEventListener("visibilitychange", ()=>{
+  if (document.visibilityState === "visible") flushPendingScanRefresh();
+});
 
 /* ===================== 关键：进入/切换路径 ===================== */
 function changeContext({path, sort_idx, mature_only, q}={}){
@@ -6267,16 +6377,31 @@ async function progressivePlayFolder(path){
   primeBusy("正在启动播放器…");
   cancelProgressive();
   setInfStatus("准备读取文件夹…");
-  const all = await getFolderItems(path);
-  await syncWatched(all.map(x=>x.id));
-  if (!all.length){ hideBusy(); alert("该文件夹没有可播放视频"); return; }
-  const initial = all.filter(x=>!isWatched(x.id)).slice(0, Math.min(30, all.length));
+  // 流式读取：凑够首批未完成项就开播，其余边到边追加到播放列表
+  const stream = streamFolderItems(path);
+  const initial = [], rest = [];
+  let total = 0, ended = false;
+  while (initial.length < 30){
+    const r = await stream.next();
+    if (r.done){ ended = true; break; }
+    total += r.value.length;
+    await syncWatched(r.value.map(x=>x.id));
+    for (const x of r.value){ if (!isWatched(x.id)) (initial.length < 30 ? initial : rest).push(x); }
+  }
+  if (!total){ hideBusy(); alert("该文件夹没有可播放视频"); return; }
   if (!initial.length){ hideBusy(); alert("该文件夹没有未完成的视频"); return; }
   await startPlaylist(initial, 0, path);
   progressive.seen = new Set(player.ids);
-  const rest = all.filter(x => !isWatched(x.id) && !progressive.seen.has(x.id));
   const BATCH = 200;
-  const producer = async function* (){ for (const part of chunk(rest, BATCH)) yield part; };
+  const producer = async function* (){
+    for (const part of chunk(rest, BATCH)) yield part;
+    if (ended) return;
+    for await (const part of stream){
+      await syncWatched(part.map(x=>x.id));
+      const pending = part.filter(x => !isWatched(x.id) && !progressive.seen.has(x.id));
+      if (pending.length) yield pending;
+    }
+  };
   progressiveAppendFrom(producer, "文件夹后台加载");
 }
 async function progressivePlaySelection(){
@@ -6309,18 +6434,56 @@ async function progressivePlaySelection(){
   };
   progressiveAppendFrom(producer, "批量后台加载");
 }
-async function getFolderItems(path, {withOrientation=false}={}){
-  const params = new URLSearchParams({ path, sort_idx: state.sort_idx, mature_only: state.mature_only, with_meta: "1" });
-  if (withOrientation) params.set("with_orientation", "1");
-  const r = await fetch(`/api/folder_videos?${params.toString()}`);
-  const j = await r.json();
-  return (j.items || []).map(it => ({
+function folderItemFromJson(it){
+  return {
     id: String(it.id),
     title: it.title || `视频 ${it.id}`,
     orientation: it.orientation || "unknown",
     width: Number(it.width || 0),
     height: Number(it.height || 0),
-  }));
+  };
+}
+// orientation：只要某一朝向时交给服务端按分类位图预筛（已探测为另一朝向的不再下发、不再探测），
+// 未探测的项仍随 with_orientation 逐项探测，由调用方按探测结果再过滤
+function folderItemsParams(path, withOrientation, orientation){
+  const params = new URLSearchParams({ path, sort_idx: state.sort_idx, mature_only: state.mature_only, with_meta: "1" });
+  if (withOrientation) params.set("with_orientation", "1");
+  if (orientation === "portrait" || orientation === "landscape") params.set("facet", `orientation:${orientation},unknown`);
+  return params;
+}
+async function getFolderItems(path, {withOrientation=false, orientation="all"}={}){
+  const params = folderItemsParams(path, withOrientation, orientation);
+  const r = await fetch(`/api/folder_videos?${withCatalogVersion(params).toString()}`);
+  const j = await r.json();
+  return (j.items || []).map(folderItemFromJson);
+}
+// 流式读取 /api/folder_videos?stream=1（NDJSON，按排序顺序逐行到达），每收到一段就交出一批；
+// 超大文件夹/需要朝向探测时，前几项到了就能开播。浏览器不支持流式读取时退回一次性请求。
+async function* streamFolderItems(path, {withOrientation=false, orientation="all"}={}){
+  const params = folderItemsParams(path, withOrientation, orientation);
+  params.set("stream", "1");
+  const r = await fetch(`/api/folder_videos?${withCatalogVersion(params).toString()}`);
+  if (!r.ok || !r.body || typeof TextDecoder === "undefined"){
+    yield await getFolderItems(path, {withOrientation, orientation});
+    return;
+  }
+  const reader = r.body.getReader();
+  const dec = new TextDecoder();
+  let buf = "";
+  try{
+    for (;;){
+      const { value, done } = await reader.read();
+      buf += done ? dec.decode() : dec.decode(value, { stream:true });
+      const lines = buf.split("\n");
+      buf = done ? "" : lines.pop();
+      const batch = [];
+      for (const line of lines){ if (line.trim()) batch.push(folderItemFromJson(JSON.parse(line))); }
+      if (batch.length) yield batch;
+      if (done) break;
+    }
+  }finally{
+    try{ reader.cancel(); }catch(_){}
+  }
 }
 function getCurrentlyLoadedVideoItems(){
   const out = []; for (const t of state.tiles){ if (t.type === "video") out.push({ id:String(t.vid), title:t.title || `视频 ${t.vid}` }); }
@@ -6369,14 +6532,38 @@ function openWallpaperTileMenu(t){
   const openFolderOrientationMenu = (path, mode)=>{
     menu.innerHTML = "";
     const run = async (orientation)=>{
-      const all = await getFolderItems(path, {withOrientation:true});
-      const items = filterByOrientation(all, orientation);
       const label = orientation === "portrait" ? "竖屏" : (orientation === "landscape" ? "横屏" : "全部");
-      if (!items.length){ alert(`该文件夹没有可播放的${label}视频`); return; }
+      if (mode === "random"){
+        // 加权随机需要完整列表
+        const items = filterByOrientation(await getFolderItems(path, {withOrientation:true, orientation}), orientation);
+        if (!items.length){ alert(`该文件夹没有可播放的${label}视频`); return; }
+        primeBusy("正在启动播放器…");
+        await startPlaylist(weightedRandomOrder(items), 0, path);
+        return;
+      }
+      // 顺序/循环播放：朝向探测逐项进行，拿到第一批符合的就开播，其余流式追加
       primeBusy("正在启动播放器…");
-      if (mode === "loop") await startPlaylist(items, 0, path, {loop:true});
-      else if (mode === "random") await startPlaylist(weightedRandomOrder(items), 0, path);
-      else await startPlaylist(items, 0, path);
+      const stream = streamFolderItems(path, {withOrientation:true, orientation});
+      const initial = [];
+      let ended = false;
+      // 循环模式单项时 <video loop> 会原地循环，至少凑两项再开播
+      const need = mode === "loop" ? 2 : 1;
+      while (initial.length < need){
+        const r = await stream.next();
+        if (r.done){ ended = true; break; }
+        initial.push(...filterByOrientation(r.value, orientation));
+      }
+      if (!initial.length){ hideBusy(); alert(`该文件夹没有可播放的${label}视频`); return; }
+      await startPlaylist(initial, 0, path, mode === "loop" ? {loop:true} : {});
+      progressive.seen = new Set(player.ids);
+      if (ended) return;
+      const producer = async function* (){
+        for await (const part of stream){
+          const items = filterByOrientation(part, orientation);
+          if (items.length) yield items;
+        }
+      };
+      progressiveAppendFrom(producer, "文件夹后台加载");
     };
     add("竖屏", ()=>run("portrait"));
     add("横屏", ()=>run("landscape"));
@@ -6620,6 +6807,7 @@ async function deleteByIds(ids){
       headers:{"Content-Type":"application/json"},
       body: JSON.stringify({ids})
     });
+    markCatalogStale();
     return !!(r && r.ok);
   }catch(_){
     return false;
@@ -7248,6 +7436,7 @@ function openContextMenu(x,y){
               headers:{"Content-Type":"application/json"},
               body: JSON.stringify({ paths:[path] })
             });
+            markCatalogStale();
             clearSel();
             changeContext({});
           }
@@ -7333,6 +7522,7 @@ function openContextMenu(x,y){
                 headers:{"Content-Type":"application/json"},
                 body: JSON.stringify({ paths: folderPaths })
               });
+              markCatalogStale();
             }
             clearSel();
             changeContext({});
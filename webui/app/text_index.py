@@ -0,0 +1,183 @@
+# text_index.py — /api/scan 筛选用的标题/上传者倒排索引
+#
+# 按字符 1-gram + 2-gram 建倒排表（中文标题常见两字词，三元组对它没有区分度），
+# 每个筛选词先用倒排表求交得到候选集，再交给原有匹配函数逐项复核，结果与逐项扫描一致。
+# 索引随三源合并增量维护：只对标题/上传者变化的项重建条目，删除用墓碑标记，墓碑过多再整体重建。
+import threading, time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# 上传者可能在合并之后才由 Steam 补全；作者为空的项总是进入候选，定期回查
+_UNKNOWN_AUTHOR_RECHECK_SEC = 5.0
+_RESULT_CACHE_SIZE = 64
+
+
+def _grams(text: str) -> Set[str]:
+    out = set(text)
+    out.update(text[i:i + 2] for i in range(len(text) - 1))
+    return out
+
+
+def _query_grams(text: str) -> Set[str]:
+    if len(text) <= 1:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class TextIndex:
+    """
+    标题/上传者 n-gram 倒排索引。词项对象需有 text（已 casefold）与 field（any/title/author）属性。
+    update() 由合并线程调用，match() 由请求线程调用，内部自带锁。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._ids: List[Optional[str]] = []           # 序号 → id（None = 已删除）
+        self._ord: Dict[str, int] = {}                # id → 序号
+        self._keys: Dict[str, Tuple[str, str]] = {}   # id → 建索引时的 (title, author) 原文
+        self._title: Dict[str, array] = {}            # gram → 序号数组（升序）
+        self._author: Dict[str, array] = {}
+        self._unknown_author: Set[int] = set()
+        self._unknown_checked_at = 0.0
+        self._results: "OrderedDict[tuple, FrozenSet[str]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ord)
+
+    # ---- 维护 ----
+
+    def _add(self, vid: str, key: Tuple[str, str]):
+        o = len(self._ids)
+        self._ids.append(vid)
+        self._ord[vid] = o
+        self._keys[vid] = key
+        title, author = key
+        for g in _grams((title or "").casefold()):
+            self._title.setdefault(g, array("I")).append(o)
+        author_cf = (author or "").casefold()
+        if author_cf:
+            for g in _grams(author_cf):
+                self._author.setdefault(g, array("I")).append(o)
+        else:
+            self._unknown_author.add(o)
+
+    def _drop(self, vid: str):
+        o = self._ord.pop(vid)
+        self._keys.pop(vid, None)
+        self._ids[o] = None
+        self._unknown_author.discard(o)
+
+    def _rebuild(self):
+        keys = list(self._keys.items())
+        self._ids, self._ord, self._keys = [], {}, {}
+        self._title, self._author, self._unknown_author = {}, {}, set()
+        for vid, key in keys:
+            self._add(vid, key)
+
+    def update(self, id_map: Dict[str, object]) -> None:
+        """按当前 id_map 增量同步（只比较标题/上传者原文，变了才重建该项条目）。"""
+        with self._lock:
+            changed = False
+            for vid in [k for k in self._ord if k not in id_map]:
+                self._drop(vid)
+                changed = True
+            for vid, v in id_map.items():
+                key = (v.title or "", getattr(v, "author", "") or "")
+                if self._keys.get(vid) != key:
+                    if vid in self._ord:
+                        self._drop(vid)
+                    self._add(vid, key)
+                    changed = True
+            if len(self._ids) - len(self._ord) > max(1024, len(self._ord)):
+                self._rebuild()
+            if changed:
+                self.version += 1
+                self._results.clear()
+
+    def _recheck_unknown_authors(self, id_map: Dict[str, object]):
+        now = time.time()
+        if not self._unknown_author or now - self._unknown_checked_at < _UNKNOWN_AUTHOR_RECHECK_SEC:
+            return
+        self._unknown_checked_at = now
+        changed = False
+        for o in list(self._unknown_author):
+            vid = self._ids[o]
+            v = id_map.get(vid) if vid is not None else None
+            if v is None or not getattr(v, "author", ""):
+                continue
+            self._drop(vid)
+            self._add(vid, (v.title or "", v.author))
+            changed = True
+        if changed:
+            self.version += 1
+            self._results.clear()
+
+    def content_version(self, id_map: Dict[str, object]) -> int:
+        """当前索引版本（先做一次限频的上传者补全回查）；上传者被就地补全后版本会变，可用作缓存校验。"""
+        with self._lock:
+            self._recheck_unknown_authors(id_map)
+            return self.version
+
+    # ---- 查询 ----
+
+    @staticmethod
+    def _lookup(postings: Dict[str, array], text: str) -> Set[int]:
+        grams = _query_grams(text)
+        lists = sorted((postings.get(g) for g in grams), key=lambda a: len(a) if a is not None else 0)
+        if not lists or lists[0] is None:
+            return set()
+        out = set(lists[0])
+        for arr in lists[1:]:
+            if not out:
+                break
+            out.intersection_update(arr)
+        return out
+
+    def _candidates(self, terms: Iterable) -> Set[int]:
+        cands: Optional[Set[int]] = None
+        for term in terms:
+            if term.field == "title":
+                c = self._lookup(self._title, term.text)
+            elif term.field == "author":
+                c = self._lookup(self._author, term.text) | self._unknown_author
+            else:
+                c = (self._lookup(self._title, term.text) | self._lookup(self._author, term.text)
+                     | self._unknown_author)
+            cands = c if cands is None else (cands & c)
+            if not cands:
+                break
+        return cands or set()
+
+    def match(self, id_map: Dict[str, object], terms: List, verify: Callable[[object], bool]) -> FrozenSet[str]:
+        """
+        返回 id_map 中满足全部词项的 id 集合。倒排表只负责缩小范围，
+        最终是否命中由 verify(VideoItem) 决定（即原有的逐项匹配逻辑）。
+        """
+        with self._lock:
+            self._recheck_unknown_authors(id_map)
+            ck = (id(id_map), self.version, tuple(terms))
+            hit = self._results.get(ck)
+            if hit is not None:
+                self._results.move_to_end(ck)
+                return hit
+            ids = self._ids
+            cand_ids = [ids[o] for o in self._candidates(terms)]
+        out = frozenset(vid for vid in cand_ids if vid is not None and verify(id_map.get(vid)))
+        with self._lock:
+            self._results[ck] = out
+            while len(self._results) > _RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._ord),
+                "tombstones": len(self._ids) - len(self._ord),
+                "title_grams": len(self._title),
+                "author_grams": len(self._author),
+                "unknown_author": len(self._unknown_author),
+                "version": self.version,
+            }
@@ -0,0 +1,361 @@
+# thumbs.py — 预览缩略图渲染：独立进程池 + 优先级任务队列
+#
+# Pillow 解码 / LANCZOS 缩放 / 编码（尤其 GIF 逐帧转动态 WebP）是纯 CPU 活，放在请求线程里会占住
+# 线程池和 GIL。这里把渲染交给子进程：
+#   - 同一缓存文件的并发请求合并成一个任务（按缓存 key 去重）
+#   - 任务先进本地优先级队列，进程池里同时只放 workers 个，数字小的先出队
+#     （首帧占位 < 正式缩略图 < 后台预生成），高优先级任务不会压在进程池内部队列后面
+#   - 已排队的任务被更高优先级的请求再次提交时就地提权
+# 渲染函数只依赖 Pillow，spawn 出的子进程不会导入 main。
+import base64
+import concurrent.futures
+import heapq
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+PRIORITY_STILL = 0      # 动图的首帧占位：请求在等
+PRIORITY_RENDER = 1     # 正式缩略图：请求在等（或随占位返回后继续）
+PRIORITY_BACKGROUND = 2  # 后台预生成
+
+
+def _square(img, size: int):
+    """等比缩到短边 >= size，再居中裁切 size×size；size 为 0 时原样返回。"""
+    from PIL import Image
+    if not size:
+        return img
+    w, h = img.size
+    if w == 0 or h == 0:
+        return img
+    scale = size / float(min(w, h))
+    new_w = max(size, int(w * scale))
+    new_h = max(size, int(h * scale))
+    if (new_w, new_h) != (w, h):
+        img = img.resize((new_w, new_h), Image.LANCZOS)
+    left = max((img.width - size) // 2, 0)
+    top = max((img.height - size) // 2, 0)
+    return img.crop((left, top, left + size, top + size))
+
+
+def _open(src_path: str, size: int):
+    from PIL import Image
+    im = Image.open(src_path)
+    if size and im.format == "JPEG":
+        # JPEG 缩小时让解码器直接按 1/2、1/4、1/8 解码（结果仍不小于 size×size），省掉大部分解码与缩放
+        im.draft(im.mode, (size, size))
+    return im
+
+
+def render(src_path: str, dst_path: str, size: int, fmt: Optional[str], quality: int,
+           still: bool = False) -> Tuple[str, bool]:
+    """
+    把 src_path 渲染成 dst_path（先写临时文件再原子替换），返回 (dst_path, 源是否动图)。
+    fmt：webp / jpg / png / None（保持原格式）。动图且输出 webp 时逐帧转动态 WebP，
+    still=True 时只取首帧（占位用，编码档位也放低）。
+    """
+    from PIL import ImageSequence
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    try:
+        with _open(src_path, size) as im:
+            animated = bool(getattr(im, "is_animated", False) and getattr(im, "n_frames", 1) > 1)
+            if animated and fmt == "webp" and not still:
+                frames = []
+                durations = []
+                try:
+                    for f in ImageSequence.Iterator(im):
+                        frames.append(_square(f.convert("RGBA"), size))
+                        durations.append(f.info.get("duration", im.info.get("duration", 40)))
+                except Exception:
+                    # 退化：取第一帧静态
+                    im.seek(0)
+                    frames = [_square(im.convert("RGBA"), size)]
+                    durations = [im.info.get("duration", 40)]
+                if not frames:
+                    frames = [_square(im.convert("RGBA"), size)]
+                    durations = [40]
+                frames[0].save(tmp_path, format="WEBP", save_all=True,
+                               append_images=frames[1:] if len(frames) > 1 else None,
+                               duration=durations, loop=0, quality=quality, method=6)
+            else:
+                # 静态图、动图首帧或不转码动图：导出为 webp/jpeg/png/或原格式
+                fmt_out = ("WEBP" if fmt == "webp" else
+                           "JPEG" if fmt in ("jpg", "jpeg") else
+                           "PNG" if fmt == "png" else None)
+                base = im.convert("RGBA") if im.mode not in ("RGB", "RGBA") else im
+                base = _square(base, size)
+                save_kwargs = {}
+                if fmt_out == "JPEG":
+                    base = base.convert("RGB")
+                    save_kwargs.update(dict(quality=quality, progressive=True, optimize=True))
+                elif fmt_out == "WEBP":
+                    save_kwargs.update(dict(quality=quality, method=4 if still else 6))
+                elif fmt_out == "PNG":
+                    save_kwargs.update(dict(optimize=True))
+                out_fmt = fmt_out or (im.format if im.format in ("PNG", "JPEG", "WEBP", "GIF") else "PNG")
+                base.save(tmp_path, format=out_fmt, **save_kwargs)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return dst_path, animated
+
+
+def render_sprite(sources: List[str], dst_path: str, size: int, cols: int, quality: int) -> Tuple[str, List[int]]:
+    """
+    把每个源的首帧缩成 size×size，按 cols 列从左到右、从上到下拼成一张 WebP 雪碧图（透明底）。
+    返回 (dst_path, 读取失败的序号)；失败的格子留空。
+    """
+    from PIL import Image
+    rows = max(1, -(-len(sources) // cols))
+    sheet = Image.new("RGBA", (cols * size, rows * size), (0, 0, 0, 0))
+    failed = []
+    for i, src in enumerate(sources):
+        try:
+            with _open(src, size) as im:
+                tile = _square(im.convert("RGBA"), size)
+                sheet.paste(tile, ((i % cols) * size, (i // cols) * size))
+        except Exception:
+            failed.append(i)
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    try:
+        sheet.save(tmp_path, format="WEBP", quality=quality, method=4)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return dst_path, failed
+
+
+def _dominant_color(img) -> str:
+    """中位切分量化成 5 色，取像素最多的那一色。"""
+    pal = img.quantize(colors=5)
+    _, idx = max(pal.getcolors())
+    r, g, b = pal.getpalette()[idx * 3:idx * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def render_placeholders(sources: List[str], size: int = 16, quality: int = 40) -> List[Optional[Tuple[str, str]]]:
+    """
+    每个源首帧的低清占位：(size×size 的 WebP data URI, "#rrggbb" 主色)，与 sources 一一对应；
+    读不出来的为 None。解码走与缩略图相同的 _open/_square（JPEG 同样按 draft 缩小解码）。
+    """
+    out: List[Optional[Tuple[str, str]]] = []
+    for src in sources:
+        try:
+            with _open(src, size) as im:
+                small = _square(im.convert("RGB"), size)
+            buf = io.BytesIO()
+            small.save(buf, format="WEBP", quality=quality, method=6)
+            uri = "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+            out.append((uri, _dominant_color(small)))
+        except Exception:
+            out.append(None)
+    return out
+
+
+class BytesLRU:
+    """
+    按字节预算淘汰的 LRU：put(key, value, nbytes) 记账，超出 budget 从最久未用的开始丢；
+    单项超过 max_item 的不收。get(key, check) 里 check(value) 为假视为过期，删掉并记一次未命中。
+    """
+
+    def __init__(self, budget: int, max_item: int):
+        self.budget = max(0, int(budget))
+        self.max_item = max(0, int(max_item))
+        self._data: "OrderedDict[object, Tuple[object, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, check: Optional[Callable[[object], bool]] = None):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and check is not None and not check(hit[0]):
+                del self._data[key]
+                self._bytes -= hit[1]
+                hit = None
+            if hit is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return hit[0]
+
+    def put(self, key, value, nbytes: int) -> bool:
+        if nbytes > self.max_item or nbytes > self.budget:
+            return False
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.budget:
+                _, (_, n) = self._data.popitem(last=False)
+                self._bytes -= n
+                self.evictions += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            looked = self.hits + self.misses
+            return {
+                "items": len(self._data), "bytes": self._bytes, "budget": self.budget,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_ratio": round(self.hits / looked, 3) if looked else 0.0,
+            }
+
+
+class _Job:
+    __slots__ = ("key", "fn", "args", "priority", "future", "started", "submitted_at")
+
+    def __init__(self, key, fn, args, priority):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.started = False
+        self.submitted_at = time.monotonic()
+
+
+class ThumbEngine:
+    """
+    渲染任务队列。submit(key, fn, *args, priority=...) 返回 concurrent.futures.Future，
+    同 key 未完成的任务直接复用。workers > 0 用 spawn 子进程池；0 退回单个后台线程（不开子进程）。
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(0, int(workers))
+        self._limit = max(1, self.workers)
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[int, int, str]] = []
+        self._jobs: Dict[str, _Job] = {}
+        self._running = 0
+        self._seq = itertools.count()
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {"submitted": 0, "coalesced": 0, "done": 0, "failed": 0, "restarts": 0,
+                       "render_ms": 0.0, "queue_wait_ms": 0.0}
+
+    def submit(self, key: str, fn: Callable, *args, priority: int = PRIORITY_RENDER) -> concurrent.futures.Future:
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._stats["coalesced"] += 1
+                if not job.started and priority < job.priority:
+                    job.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._seq), key))
+                return job.future
+            job = _Job(key, fn, args, priority)
+            self._jobs[key] = job
+            self._stats["submitted"] += 1
+            heapq.heappush(self._heap, (priority, next(self._seq), key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="thumb-dispatch", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return job.future
+
+    def pending(self, key: str) -> Optional[concurrent.futures.Future]:
+        with self._cond:
+            job = self._jobs.get(key)
+            return job.future if job is not None else None
+
+    def backlog(self, max_priority: int = PRIORITY_RENDER) -> int:
+        """排队中（未开始）且优先级不低于 max_priority 的任务数。"""
+        with self._cond:
+            return sum(1 for j in self._jobs.values() if not j.started and j.priority <= max_priority)
+
+    def _make_executor(self) -> concurrent.futures.Executor:
+        if self.workers > 0:
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumb")
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._closed and (self._running >= self._limit or not self._heap):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, key = heapq.heappop(self._heap)
+                job = self._jobs.get(key)
+                if job is None or job.started:
+                    continue  # 提权后留下的旧堆项
+                job.started = True
+                if not job.future.set_running_or_notify_cancel():
+                    self._jobs.pop(key, None)
+                    continue
+                self._running += 1
+                self._stats["queue_wait_ms"] += (time.monotonic() - job.submitted_at) * 1000.0
+                if self._executor is None:
+                    self._executor = self._make_executor()
+                executor = self._executor
+            started = time.monotonic()
+            try:
+                inner = executor.submit(job.fn, *job.args)
+            except Exception as e:  # 进程池已坏（子进程崩溃）
+                inner = concurrent.futures.Future()
+                inner.set_exception(e)
+            inner.add_done_callback(lambda f, job=job, executor=executor, started=started:
+                                    self._finish(job, executor, started, f))
+
+    def _finish(self, job: _Job, executor, started: float, inner: concurrent.futures.Future):
+        exc = inner.exception()
+        with self._cond:
+            self._running -= 1
+            self._jobs.pop(job.key, None)
+            self._stats["render_ms"] += (time.monotonic() - started) * 1000.0
+            self._stats["failed" if exc is not None else "done"] += 1
+            if isinstance(exc, BrokenProcessPool) and self._executor is executor:
+                self._executor = None
+                self._stats["restarts"] += 1
+            self._cond.notify()
+        if isinstance(exc, BrokenProcessPool):
+            executor.shutdown(wait=False, cancel_futures=True)
+        if exc is not None:
+            job.future.set_exception(exc)
+        else:
+            job.future.set_result(inner.result())
+
+    def stats(self) -> dict:
+        with self._cond:
+            st = dict(self._stats)
+            queued = [j for j in self._jobs.values() if not j.started]
+            st.update({
+                "workers": self.workers,
+                "mode": "process" if self.workers > 0 else "thread",
+                "running": self._running,
+                "queued": len(queued),
+                "queued_by_priority": {p: sum(1 for j in queued if j.priority == p)
+                                       for p in sorted({j.priority for j in queued})},
+            })
+        finished = st["done"] + st["failed"]
+        st["avg_render_ms"] = round(st.pop("render_ms") / finished, 1) if finished else 0.0
+        st["avg_queue_wait_ms"] = round(st.pop("queue_wait_ms") / finished, 1) if finished else 0.0
+        return st
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            executor, self._executor = self._executor, None
+            self._cond.notify_all()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
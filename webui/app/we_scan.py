@@ -1,8 +1,13 @@
 # we_scan.py — 最小化修改版（方案2：严格只碰 folders/items）
 import hashlib
-import os, json, math, re, shutil, threading
+import atexit
+import os, json, math, re, shutil, struct, sys, threading
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
 
 MIN_TILE_EDGE = 180
 
@@ -10,24 +15,190 @@ MIN_TILE_EDGE = 180
 VIDEO_EXTS = {".mp4", ".mkv", ".webm", ".avi", ".mov", ".m4v", ".mpg", ".mpeg"}
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
 
-@dataclass
+# ---- VideoItem 紧凑存储 ----
+# 路径类字段（预览图 / 视频 / config 键）绝大多数共用少数几个根目录（如 <workshop>/content/431960），
+# 去掉倒数两级之前的前缀放进驻留表，项里只存 "\0" + 表序号字符 + 后缀；前缀太短或表满时原样存。
+# 指纹打包成 40 字节 bytes，分级/类型/上传者这类高度重复的短串 sys.intern 共享。
+_PATH_ROOTS: List[str] = []
+_PATH_ROOT_IDS: Dict[str, int] = {}
+_PATH_ROOTS_MAX = 250          # 序号编码成单个 latin-1 字符，保证后缀串不被撑成宽字符
+_PATH_ROOT_MIN_LEN = 8
+_path_roots_lock = threading.Lock()
+_FP_STRUCT = struct.Struct("<5q")
+_FP_ZERO = _FP_STRUCT.pack(0, 0, 0, 0, 0)
+
+
+def _pack_path(path: str) -> str:
+    if not path:
+        return ""
+    tail = max(path.rfind("/"), path.rfind("\\"))
+    cut = max(path.rfind("/", 0, tail), path.rfind("\\", 0, tail)) + 1 if tail > 0 else 0
+    if cut < _PATH_ROOT_MIN_LEN:
+        return path
+    root = path[:cut]
+    rid = _PATH_ROOT_IDS.get(root)
+    if rid is None:
+        with _path_roots_lock:
+            rid = _PATH_ROOT_IDS.get(root)
+            if rid is None:
+                if len(_PATH_ROOTS) >= _PATH_ROOTS_MAX:
+                    return path
+                rid = len(_PATH_ROOTS)
+                _PATH_ROOTS.append(root)
+                _PATH_ROOT_IDS[root] = rid
+    return "\0" + chr(rid + 1) + path[cut:]
+
+
+def _unpack_path(packed: str) -> str:
+    if not packed or packed[0] != "\0":
+        return packed
+    return _PATH_ROOTS[ord(packed[1]) - 1] + packed[2:]
+
+
 class VideoItem:
-    id: str
-    title: str
-    preview_path: str
-    video_path: str
-    mtime: float
-    size: int
-    rating: str
-    vtype: str
-    # 上传者 / 作者（来自 project.json 的 author/creator 等字段，或 Steam API）
-    author: str = ""
-    # project.json 中的 Steam ID，可跳过 GetPublishedFileDetails
-    author_steamid: str = ""
-    # config.json 的 items 键：创意工坊为 10 位 id；myprojects / projects/backup 等为 UNC 或相对路径
-    we_config_key: str = ""
-    # 同一视频在 config 中若出现多条等价键（不同 UNC 前缀），移动时需全部 prune
-    we_config_key_aliases: List[str] = field(default_factory=list)
+    """
+    一个视频项。构造参数与属性名同原先的 dataclass（FIELDS 为全部字段，astuple() 按此顺序取值）；
+    内部用 __slots__ 紧凑存储，路径/指纹按上面的规则打包，读属性时还原。
+    """
+
+    FIELDS = ("id", "title", "preview_path", "video_path", "mtime", "size", "rating", "vtype",
+              "author", "author_steamid", "we_config_key", "we_config_key_aliases", "fp")
+    __slots__ = ("id", "title", "_preview", "_video", "mtime", "size", "rating", "vtype",
+                 "author", "author_steamid", "_key", "we_config_key_aliases", "_fp")
+
+    # author：上传者 / 作者（来自 project.json 的 author/creator 等字段，或 Steam API）
+    # author_steamid：project.json 中的 Steam ID，可跳过 GetPublishedFileDetails
+    # we_config_key：config.json 的 items 键：创意工坊为 10 位 id；myprojects / projects/backup 等为 UNC 或相对路径
+    # we_config_key_aliases：同一视频在 config 中若出现多条等价键（不同 UNC 前缀），移动时需全部 prune
+    # fp：项目指纹（见 item_fingerprint），用于变化巡检与快照复核；全 0 = 未知
+    def __init__(self, id: str, title: str, preview_path: str, video_path: str, mtime: float, size: int,
+                 rating: str, vtype: str, author: str = "", author_steamid: str = "", we_config_key: str = "",
+                 we_config_key_aliases: Iterable[str] = (),
+                 fp: Tuple[int, int, int, int, int] = (0, 0, 0, 0, 0)):
+        self.id = id
+        self.title = title
+        self.preview_path = preview_path
+        self.video_path = video_path
+        self.mtime = mtime
+        self.size = size
+        self.rating = sys.intern(rating or "")
+        self.vtype = sys.intern(vtype or "")
+        self.author = sys.intern(author) if author else ""
+        self.author_steamid = author_steamid
+        self.we_config_key = we_config_key
+        self.we_config_key_aliases = tuple(we_config_key_aliases or ())
+        self.fp = fp
+
+    @property
+    def preview_path(self) -> str:
+        return _unpack_path(self._preview)
+
+    @preview_path.setter
+    def preview_path(self, value: str):
+        self._preview = _pack_path(value)
+
+    @property
+    def video_path(self) -> str:
+        return _unpack_path(self._video)
+
+    @video_path.setter
+    def video_path(self, value: str):
+        self._video = _pack_path(value)
+
+    @property
+    def we_config_key(self) -> str:
+        return _unpack_path(self._key)
+
+    @we_config_key.setter
+    def we_config_key(self, value: str):
+        self._key = _pack_path(value)
+
+    @property
+    def fp(self) -> Tuple[int, int, int, int, int]:
+        return _FP_STRUCT.unpack(self._fp)
+
+    @fp.setter
+    def fp(self, value: Tuple[int, int, int, int, int]):
+        self._fp = _FP_STRUCT.pack(*value) if any(value) else _FP_ZERO
+
+    def astuple(self) -> tuple:
+        return tuple(getattr(self, f) for f in self.FIELDS)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "VideoItem(" + ", ".join(f"{f}={getattr(self, f)!r}" for f in self.FIELDS) + ")"
+
+
+class _LegacyItem:
+    """旧版（普通 dataclass、带 __dict__）VideoItem 的内存估算替身，只给 catalog_memory_report 用。"""
+
+
+def _legacy_item_bytes(v: VideoItem) -> int:
+    o = _LegacyItem()
+    for f in VideoItem.FIELDS:
+        setattr(o, f, getattr(v, f))
+    o.we_config_key_aliases = list(v.we_config_key_aliases)
+    total = sys.getsizeof(o) + sys.getsizeof(o.__dict__)
+    # 旧版每项的字符串都是解析 JSON / 拼路径得到的独立对象（id 与字典键共享，不计）
+    for f in ("title", "preview_path", "video_path", "rating", "vtype", "author", "author_steamid"):
+        total += sys.getsizeof(getattr(o, f))
+    if o.we_config_key != v.id:
+        total += sys.getsizeof(o.we_config_key)
+    total += sys.getsizeof(o.we_config_key_aliases) + sum(sys.getsizeof(a) for a in o.we_config_key_aliases)
+    total += sys.getsizeof(o.fp) + sum(sys.getsizeof(x) for x in o.fp)
+    return total + sys.getsizeof(o.mtime) + sys.getsizeof(o.size)
+
+
+def _compact_item_bytes(v: VideoItem, shared: Dict[int, int]) -> int:
+    total = sys.getsizeof(v) + sys.getsizeof(v.title) + sys.getsizeof(v._preview) + sys.getsizeof(v._video)
+    if v._key is not v.id:
+        total += sys.getsizeof(v._key)
+    if v._fp is not _FP_ZERO:
+        total += sys.getsizeof(v._fp)
+    if v.we_config_key_aliases:
+        total += sys.getsizeof(v.we_config_key_aliases) + sum(sys.getsizeof(a) for a in v.we_config_key_aliases)
+    # 驻留的短串各项共享，只记一次
+    for x in (v.rating, v.vtype, v.author, v.author_steamid):
+        shared.setdefault(id(x), sys.getsizeof(x))
+    return total + sys.getsizeof(v.mtime) + sys.getsizeof(v.size)
+
+
+def catalog_memory_report(id_map: Dict[str, VideoItem], index: Optional["FolderIndex"] = None,
+                          sample: int = 2000) -> dict:
+    """
+    视频项内存估算（sys.getsizeof 逐字段累加，最多抽样 sample 项）：
+    bytes_per_item 为当前紧凑存储，legacy_bytes_per_item 为同样数据用旧版 dataclass 存储的估算值。
+    """
+    items = list(id_map.values())
+    step = max(1, len(items) // sample) if sample > 0 else 1
+    picked = items[::step]
+    shared: Dict[int, int] = {}
+    compact = sum(_compact_item_bytes(v, shared) for v in picked)
+    legacy = sum(_legacy_item_bytes(v) for v in picked)
+    n = len(picked) or 1
+    roots = sys.getsizeof(_PATH_ROOTS) + sum(sys.getsizeof(r) for r in _PATH_ROOTS)
+    per_item = (compact + sum(shared.values())) / n + (roots / len(items) if items else 0)
+    out = {
+        "items": len(items),
+        "sampled": len(picked),
+        "bytes_per_item": round(per_item, 1),
+        "legacy_bytes_per_item": round(legacy / n, 1),
+        "total_mb": round(per_item * len(items) / 1048576, 2),
+        "legacy_total_mb": round(legacy / n * len(items) / 1048576, 2),
+        "path_roots": len(_PATH_ROOTS),
+    }
+    if index is not None:
+        out["folder_index_bytes"] = (
+            sys.getsizeof(index.order) + sys.getsizeof(index._pos) + sys.getsizeof(index._extra_pos)
+            + sum(sys.getsizeof(p) for p in index._extra_pos.values())
+        )
+    return out
 
 
 def _author_from_pdata(pdata: dict) -> str:
@@ -60,6 +231,37 @@ class FolderNode:
 def safe_join(*parts) -> str:
     return os.path.normpath(os.path.join(*parts))
 
+def _stat_ns_size(path: str, follow_symlinks: bool = True) -> Tuple[int, int]:
+    try:
+        st = os.stat(path, follow_symlinks=follow_symlinks)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return 0, 0
+
+def item_fingerprint(id_dir: str, video_path: str = "") -> Tuple[int, int, int, int, int]:
+    """
+    项目指纹：(目录 mtime_ns, project.json mtime_ns, project.json 大小, 视频 mtime_ns, 视频大小)，
+    不存在的记 0。Steam 就地更新项目（换视频文件、改标题）时至少有一项会变。
+    """
+    dir_mtime, _ = _stat_ns_size(id_dir)
+    pj_mtime, pj_size = _stat_ns_size(safe_join(id_dir, "project.json"))
+    v_mtime, v_size = _stat_ns_size(video_path, follow_symlinks=False) if video_path else (0, 0)
+    return (dir_mtime, pj_mtime, pj_size, v_mtime, v_size)
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+def parallel_map(fn: Callable[[_T], _R], args: List[_T], workers: int = 1) -> List[_R]:
+    """
+    对 args 逐个调用 fn，结果顺序与输入一致。
+    workers>1 时用有界线程池并发：单项扫描以 stat/open 为主，网络挂载（SMB/NFS）上
+    耗时几乎全是往返延迟，并发可以把延迟重叠起来。
+    """
+    if workers <= 1 or len(args) <= 1:
+        return [fn(a) for a in args]
+    with ThreadPoolExecutor(max_workers=min(workers, len(args)), thread_name_prefix="we-scan") as ex:
+        return list(ex.map(fn, args))
+
 def load_we_config(we_path: str) -> dict:
     cfg_path = os.path.join(we_path, "config.json")
     if not os.path.exists(cfg_path):
@@ -165,7 +367,9 @@ def scan_single_workshop_item(workshop_root: str, wid: str) -> Optional[VideoIte
     """扫描单个创意工坊项目目录，返回 VideoItem 或 None（非视频/不完整/不存在）。"""
     id_dir = safe_join(workshop_root, wid)
     pj = safe_join(id_dir, "project.json")
-    if not os.path.isfile(pj):
+    # 先取指纹再读内容：读取期间若有改动，指纹偏旧，下次巡检时会再扫一次
+    fp = item_fingerprint(id_dir)
+    if not fp[1]:
         return None
     try:
         with open(pj, "r", encoding="utf-8") as f:
@@ -184,11 +388,12 @@ def scan_single_workshop_item(workshop_root: str, wid: str) -> Optional[VideoIte
     if not (preview_path and video_path
             and os.path.isfile(preview_path) and os.path.isfile(video_path)):
         return None
-    mtime, size = 0.0, 0
+    mtime, size, mtime_ns = 0.0, 0, 0
     try:
         st = os.stat(video_path, follow_symlinks=False)
         mtime = getattr(st, "st_mtime", 0.0)
         size = getattr(st, "st_size", 0)
+        mtime_ns = st.st_mtime_ns
     except Exception:
         pass
     return VideoItem(
@@ -198,24 +403,38 @@ def scan_single_workshop_item(workshop_root: str, wid: str) -> Optional[VideoIte
         author=_author_from_pdata(pdata),
         author_steamid=_steamid_from_pdata(pdata),
         we_config_key=wid,
+        fp=fp[:3] + (mtime_ns, size),
     )
 
 
-def scan_workshop_items(workshop_root_431960: str) -> Dict[str, VideoItem]:
+def scan_workshop_ids(workshop_root: str, wids: Iterable[str], workers: int = 1) -> Dict[str, Optional[VideoItem]]:
+    """扫描一批创意工坊项目目录，返回 {wid: VideoItem 或 None}，按 wid 排序保证结果确定。"""
+    def one(wid: str) -> Optional[VideoItem]:
+        try:
+            return scan_single_workshop_item(workshop_root, wid)
+        except Exception as e:
+            print(f"[we_scan] 扫描 {wid} 异常：", e)
+            return None
+    ids = sorted(wids)
+    return dict(zip(ids, parallel_map(one, ids, workers)))
+
+
+def scan_workshop_items(workshop_root_431960: str, workers: int = 1) -> Dict[str, VideoItem]:
     """全量扫描 Workshop 目录（仅首次启动时使用，后续由 main 做增量）。"""
     id_map: Dict[str, VideoItem] = {}
     if not os.path.isdir(workshop_root_431960):
         return id_map
+    wids: List[str] = []
     try:
         with os.scandir(workshop_root_431960) as entries:
             for entry in entries:
-                if not (entry.is_dir(follow_symlinks=False) and entry.name.isdigit()):
-                    continue
-                item = scan_single_workshop_item(workshop_root_431960, entry.name)
-                if item:
-                    id_map[item.id] = item
+                if entry.is_dir(follow_symlinks=False) and entry.name.isdigit():
+                    wids.append(entry.name)
     except Exception as e:
         print("[we_scan] 扫描异常：", e)
+    for wid, item in scan_workshop_ids(workshop_root_431960, wids, workers).items():
+        if item:
+            id_map[item.id] = item
     return id_map
 
 
@@ -274,6 +493,7 @@ def scan_single_myproject_item(we_path: str, we_cfg: dict, folder_name: str) ->
     id_dir = safe_join(mp_root, folder_name)
     if not os.path.isdir(id_dir):
         return None
+    fp = item_fingerprint(id_dir)
 
     pj = safe_join(id_dir, "project.json")
     title = folder_name
@@ -315,11 +535,12 @@ def scan_single_myproject_item(we_path: str, we_cfg: dict, folder_name: str) ->
         return None
 
     cfg_key = build_we_config_key_for_myproject(install_dir, folder_name, video_rel)
-    mtime, size = 0.0, 0
+    mtime, size, mtime_ns = 0.0, 0, 0
     try:
         st = os.stat(video_path, follow_symlinks=False)
         mtime = getattr(st, "st_mtime", 0.0)
         size = getattr(st, "st_size", 0)
+        mtime_ns = st.st_mtime_ns
     except Exception:
         pass
     author = _author_from_pdata(pdata)
@@ -329,15 +550,30 @@ def scan_single_myproject_item(we_path: str, we_cfg: dict, folder_name: str) ->
         mtime=mtime, size=size, rating=rating or "", vtype=vtype,
         author=author,
         we_config_key=cfg_key,
+        fp=fp[:3] + (mtime_ns, size),
     )
 
 
-def scan_myprojects_items(we_path: str, we_cfg: dict) -> Dict[str, VideoItem]:
+def scan_myproject_dirs(we_path: str, we_cfg: dict, folder_names: Iterable[str],
+                        workers: int = 1) -> Dict[str, Optional[VideoItem]]:
+    """扫描一批 myprojects 子文件夹，返回 {文件夹名: VideoItem 或 None}，按名字排序。"""
+    def one(name: str) -> Optional[VideoItem]:
+        try:
+            return scan_single_myproject_item(we_path, we_cfg, name)
+        except Exception as e:
+            print(f"[we_scan] 扫描 myprojects/{name} 异常：", e)
+            return None
+    names = sorted(folder_names)
+    return dict(zip(names, parallel_map(one, names, workers)))
+
+
+def scan_myprojects_items(we_path: str, we_cfg: dict, workers: int = 1) -> Dict[str, VideoItem]:
     """全量扫描 myprojects 目录（仅首次启动时使用，后续由 main 做增量）。"""
     out: Dict[str, VideoItem] = {}
     mp_root = safe_join(we_path, "projects", "myprojects")
     if not os.path.isdir(mp_root):
         return out
+    names: List[str] = []
     try:
         with os.scandir(mp_root) as entries:
             for entry in entries:
@@ -346,11 +582,12 @@ def scan_myprojects_items(we_path: str, we_cfg: dict) -> Dict[str, VideoItem]:
                 fn = entry.name
                 if fn.startswith(".") or ".." in fn:
                     continue
-                item = scan_single_myproject_item(we_path, we_cfg, fn)
-                if item:
-                    out[item.id] = item
+                names.append(fn)
     except Exception as e:
         print("[we_scan] myprojects 扫描异常：", e)
+    for _, item in scan_myproject_dirs(we_path, we_cfg, names, workers).items():
+        if item:
+            out[item.id] = item
     return out
 
 
@@ -448,106 +685,205 @@ def _video_metadata_from_project_json(abs_video: str) -> Optional[Tuple[str, str
     return (title, preview_path, rating, vtype_out, author)
 
 
-def scan_config_linked_project_videos(we_path: str, we_cfg: dict) -> Dict[str, VideoItem]:
+def config_linked_video_keys(we_cfg: dict) -> Dict[str, str]:
     """
-    从 config.json 的 folders.items 中收集指向 WE projects/ 下视频文件的路径键
-    （如 projects/backup/<id>/xxx.mp4，UNC //NAS/.../wallpaper_engine/projects/...），
-    在容器内解析为 WE_PATH/projects/<rel>。与 SMB 主机名、盘符无关。
+    config.json 的 folders.items 中指向 WE projects/ 下视频文件的原始键 → projects 相对路径
+    （如 projects/backup/<id>/xxx.mp4，UNC //NAS/.../wallpaper_engine/projects/...）。
+    纯字符串解析，不碰文件系统；创意工坊 id 与 myprojects 下的键不在此列。
     """
-    out: Dict[str, VideoItem] = {}
-    folders_list = extract_folders_list(we_cfg)
     raw_keys: Set[str] = set()
-    _collect_raw_item_keys_from_folders(folders_list, raw_keys)
-    projects_root = safe_join(we_path, "projects")
-    if not os.path.isdir(projects_root):
-        return out
-
+    _collect_raw_item_keys_from_folders(extract_folders_list(we_cfg), raw_keys)
+    out: Dict[str, str] = {}
     for raw in raw_keys:
         s = str(raw).strip()
         if re.fullmatch(r"\d{10}", s):
             continue
-        norm = s.replace("\\", "/")
-        rel = extract_projects_relative_path(norm)
+        rel = extract_projects_relative_path(s.replace("\\", "/"))
         if not rel or not _is_video_relpath(rel):
             continue
-        seg0 = rel.split("/")[0].lower() if rel else ""
-        if seg0 == "myprojects":
-            continue
-        abs_v = safe_join(projects_root, *rel.split("/"))
-        if not os.path.isfile(abs_v):
+        if rel.split("/")[0].lower() == "myprojects":
             continue
-        cid = canonical_id_for_projects_file_rel(rel)
+        out[s] = rel
+    return out
 
-        meta = _video_metadata_from_project_json(abs_v)
-        if meta:
-            title, preview, rating, vtype, author = meta
-        else:
-            author = ""
-            preview = _preview_for_standalone_video(abs_v, projects_root)
-            if not preview or not os.path.isfile(preview):
-                continue
-            title = _title_for_proj_video(abs_v, rel)
-            rating = ""
-            vtype = "video"
 
-        mtime, size = 0.0, 0
-        try:
-            st = os.stat(abs_v, follow_symlinks=False)
-            mtime = getattr(st, "st_mtime", 0.0)
-            size = getattr(st, "st_size", 0)
-        except Exception:
-            pass
-        if cid in out:
-            ex = out[cid]
-            if s != ex.we_config_key and s not in ex.we_config_key_aliases:
-                ex.we_config_key_aliases.append(s)
+def scan_config_linked_key(projects_root: str, key: str, rel: str) -> Optional[VideoItem]:
+    """扫描单个 config 链接键，在容器内解析为 WE_PATH/projects/<rel>；文件不存在或缺预览图返回 None。"""
+    abs_v = safe_join(projects_root, *rel.split("/"))
+    if not os.path.isfile(abs_v):
+        return None
+    cid = canonical_id_for_projects_file_rel(rel)
+    fp = item_fingerprint(os.path.dirname(abs_v), abs_v)
+
+    meta = _video_metadata_from_project_json(abs_v)
+    if meta:
+        title, preview, rating, vtype, author = meta
+    else:
+        author = ""
+        preview = _preview_for_standalone_video(abs_v, projects_root)
+        if not preview or not os.path.isfile(preview):
+            return None
+        title = _title_for_proj_video(abs_v, rel)
+        rating = ""
+        vtype = "video"
+
+    mtime, size = 0.0, 0
+    try:
+        st = os.stat(abs_v, follow_symlinks=False)
+        mtime = getattr(st, "st_mtime", 0.0)
+        size = getattr(st, "st_size", 0)
+    except Exception:
+        pass
+    return VideoItem(
+        id=cid,
+        title=title,
+        preview_path=preview,
+        video_path=abs_v,
+        mtime=mtime,
+        size=size,
+        rating=rating or "",
+        vtype=vtype or "video",
+        author=author or "",
+        we_config_key=key,
+        fp=fp,
+    )
+
+
+def scan_config_linked_keys(we_path: str, keys: Dict[str, str], workers: int = 1) -> Dict[str, Optional[VideoItem]]:
+    """扫描一批 config 链接键（{原始键: 相对路径}），返回 {原始键: VideoItem 或 None}。"""
+    projects_root = safe_join(we_path, "projects")
+    if not os.path.isdir(projects_root):
+        return {k: None for k in keys}
+    ordered = sorted(keys)
+    found = parallel_map(lambda k: scan_config_linked_key(projects_root, k, keys[k]), ordered, workers)
+    return dict(zip(ordered, found))
+
+
+def merge_config_linked_items(per_key: Dict[str, Optional[VideoItem]],
+                              prev: Optional[Dict[str, VideoItem]] = None) -> Dict[str, VideoItem]:
+    """
+    按原始键的扫描结果合成 {规范 id: VideoItem}：指向同一文件的多条键（不同 UNC 前缀）归为一项，
+    排序最前的键作 we_config_key，其余记为别名。与 prev 中同 id 的项内容相同则沿用旧对象。
+    """
+    first: Dict[str, VideoItem] = {}
+    keys: Dict[str, List[str]] = {}
+    for raw in sorted(per_key):
+        v = per_key[raw]
+        if v is None:
             continue
-        out[cid] = VideoItem(
-            id=cid,
-            title=title,
-            preview_path=preview,
-            video_path=abs_v,
-            mtime=mtime,
-            size=size,
-            rating=rating or "",
-            vtype=vtype or "video",
-            author=author or "",
-            we_config_key=s,
-            we_config_key_aliases=[],
-        )
+        if v.id not in first:
+            first[v.id] = v
+        keys.setdefault(v.id, []).append(raw)
+    out: Dict[str, VideoItem] = {}
+    prev = prev or {}
+    for cid, v in first.items():
+        key, aliases = keys[cid][0], tuple(keys[cid][1:])
+        if v.we_config_key != key or v.we_config_key_aliases != aliases:
+            v = VideoItem(*v.astuple())
+            v.we_config_key, v.we_config_key_aliases = key, aliases
+        old = prev.get(cid)
+        out[cid] = old if old is not None and old == v else v
     return out
 
 
-def collect_unassigned_items(id_map: Dict[str, VideoItem], roots: List[FolderNode]) -> List[str]:
-    assigned: Set[str] = set()
-    def walk(node: FolderNode):
-        assigned.update(node.items)
-        for sf in node.subfolders:
-            walk(sf)
-    for r in roots:
-        walk(r)
-    return sorted([i for i in id_map.keys() if i not in assigned])
-
-def find_node_by_path(roots: List[FolderNode], path_parts: List[str]) -> Tuple[List[FolderNode], List[str]]:
-    if not path_parts or path_parts == ['']:
-        return roots, []
-    cur = roots
-    for depth, name in enumerate(path_parts):
-        found = next((n for n in cur if n.title == name), None)
-        if not found:
-            return [], []
-        if depth == len(path_parts) - 1:
-            return found.subfolders, found.items
-        cur = found.subfolders
-    return [], []
+@dataclass(eq=False)
+class FolderIndexNode:
+    path: str                                   # "/" 或 "/A/B"
+    title: str
+    parent: Optional['FolderIndexNode']
+    items: List[str]                            # 直属视频 id（config 原样，可能含已不存在的 id）
+    children: List['FolderIndexNode'] = field(default_factory=list)
+    start: int = 0                              # 子树视频在 FolderIndex.order 中的 [start, end)
+    end: int = 0
 
-def all_ids_recursive(nodes: List[FolderNode]) -> List[str]:
-    out: List[str] = []
-    for n in nodes:
-        out.extend(n.items)
-        if n.subfolders:
-            out.extend(all_ids_recursive(n.subfolders))
-    return out
+
+class FolderIndex:
+    """
+    文件夹树的扁平索引，单次先序遍历建立（O(节点数 + 条目数)）：
+      - nodes：路径 → 节点（带 parent 指针）；同名兄弟文件夹按路径只认第一个（按标题逐级查找时先匹配到的那个）
+      - order：先序排列的视频 id（只含 id_map 中存在的），每个节点的子树是其中连续的一段，
+        祖先之间共享同一个数组，不再每层复制一份后代 id
+      - root_unassigned：未归入任何文件夹的视频（主页直属），按 id 排序
+      - 每个 id 在 order 中的位置：任意一组 id 换算成有序位置数组后，
+        「某子树里有几个」就是两次二分（见 positions_of / count_in）
+    """
+
+    _POS_CACHE_SIZE = 16
+
+    def __init__(self, roots: List[FolderNode], id_map: Dict[str, VideoItem]):
+        self.order: List[str] = []
+        self.nodes: Dict[str, FolderIndexNode] = {}
+        self._pos_cache: "OrderedDict[tuple, List[int]]" = OrderedDict()
+        self._pos_lock = threading.Lock()
+        assigned: Set[str] = set()
+        order = self.order
+
+        def build(fn: FolderNode, parent: FolderIndexNode) -> FolderIndexNode:
+            path = (parent.path.rstrip("/") + "/" + fn.title)
+            node = FolderIndexNode(path=path, title=fn.title, parent=parent, items=fn.items)
+            self.nodes.setdefault(path, node)
+            node.start = len(order)
+            assigned.update(fn.items)
+            order.extend(i for i in fn.items if i in id_map)
+            node.children = [build(sf, node) for sf in fn.subfolders]
+            node.end = len(order)
+            return node
+
+        root = FolderIndexNode(path="/", title="", parent=None, items=[])
+        self.nodes["/"] = root
+        root.children = [build(r, root) for r in roots]
+        self.root_unassigned: List[str] = sorted(i for i in id_map.keys() if i not in assigned)
+        root.items = self.root_unassigned
+        order.extend(root.items)
+        root.end = len(order)
+        self.root = root
+        # id → 首次出现位置；同一视频归在多个文件夹时其余位置另存
+        self._pos: Dict[str, int] = {}
+        self._extra_pos: Dict[str, List[int]] = {}
+        for p, vid in enumerate(order):
+            if self._pos.setdefault(vid, p) != p:
+                self._extra_pos.setdefault(vid, []).append(p)
+
+    def node(self, path_parts: List[str]) -> Optional[FolderIndexNode]:
+        parts = [p for p in path_parts if p]
+        return self.nodes.get("/" + "/".join(parts) if parts else "/")
+
+    def subtree_ids(self, node: FolderIndexNode) -> List[str]:
+        """节点自身 + 全部后代文件夹中的视频 id（同一视频在多个文件夹里会出现多次）。"""
+        return self.order[node.start:node.end]
+
+    def positions_of(self, ids: Iterable[str]) -> List[int]:
+        """一组 id 在 order 中的全部位置（升序）。"""
+        out: List[int] = []
+        pos, extra = self._pos, self._extra_pos
+        for vid in ids:
+            p = pos.get(vid)
+            if p is None:
+                continue
+            out.append(p)
+            if vid in extra:
+                out.extend(extra[vid])
+        out.sort()
+        return out
+
+    def cached_positions(self, key: tuple, ids_fn: Callable[[], Iterable[str]]) -> List[int]:
+        """positions_of 的结果按 key 缓存（索引每代重建，缓存随之作废）。"""
+        with self._pos_lock:
+            hit = self._pos_cache.get(key)
+            if hit is not None:
+                self._pos_cache.move_to_end(key)
+                return hit
+        out = self.positions_of(ids_fn())
+        with self._pos_lock:
+            self._pos_cache[key] = out
+            while len(self._pos_cache) > self._POS_CACHE_SIZE:
+                self._pos_cache.popitem(last=False)
+        return out
+
+    @staticmethod
+    def count_in(node: FolderIndexNode, positions: List[int]) -> int:
+        """positions 中落在 node 子树内的个数（同一视频在子树内多个文件夹出现按多次计）。"""
+        return bisect_left(positions, node.end) - bisect_left(positions, node.start)
 
 # === 保持真实删除（不可恢复！）===
 def delete_id_dir(workshop_root: str, wid: str) -> bool:
@@ -604,11 +940,152 @@ def delete_myprojects_local_dir(we_path: str, canonical_id: str) -> bool:
 #   方案2：严格只碰 folders/items，不改 UI 状态键
 # =====================================================================
 
-_WRITE_LOCK = threading.Lock()
-
 def _cfg_path(we_path: str) -> str:
     return os.path.join(we_path, "config.json")
 
+
+class WeConfigManager:
+    """
+    config.json 的内存副本 + 合并写回：
+      - 解析结果按文件 (mtime_ns, 大小) 缓存，文件没变就不再 JSON 解析整个配置；
+      - 编辑以操作函数的形式作用在内存副本上，并记入待落盘队列；一段时间（write_delay）内的
+        多次编辑合并成一次原子写（仍先备份 .bak）；
+      - 落盘前或读取时发现 Wallpaper Engine 改过文件，则重新解析，再把尚未落盘的编辑按顺序重放，
+        不会用旧副本覆盖 WE 的修改。
+    读取走 reading()（持锁期间不得把 cfg 里的对象带出去长期引用），修改走 edit()。
+    """
+
+    def __init__(self, we_path: str, write_delay: float = 0.5,
+                 on_write: Optional[Callable[[int, Tuple[int, int]], None]] = None):
+        self.we_path = we_path
+        self.path = _cfg_path(we_path)
+        self.write_delay = write_delay
+        self.on_write = on_write            # 落盘后回调 (version, 文件指纹)，调用时不持本锁
+        self.version = 0                    # 内存副本每变一次（重新解析 / 编辑）+1
+        self._lock = threading.RLock()
+        self._cfg: Optional[dict] = None
+        self._fp: Optional[Tuple[int, int]] = None
+        self._pending: List[Callable[[dict], Tuple[bool, object]]] = []
+        self._timer: Optional[threading.Timer] = None
+        self._stats = {"parses": 0, "external_reloads": 0, "edits": 0, "writes": 0, "write_errors": 0,
+                       "replay_errors": 0}
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _sync_locked(self) -> dict:
+        fp = self._stat()
+        if self._cfg is not None and fp == self._fp:
+            return self._cfg
+        if fp is None:
+            raise FileNotFoundError(f"找不到 config.json: {self.path}")
+        with open(self.path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        self._stats["parses"] += 1
+        if self._cfg is not None:
+            self._stats["external_reloads"] += 1
+            if self._pending:
+                print(f"[config] config.json 已被外部修改，重新读取并重放 {len(self._pending)} 个未落盘的编辑")
+        kept = []
+        for op in self._pending:
+            # 重放失败（如 WE 已删掉该编辑依赖的结构）只丢这一个编辑，其余照常重放
+            try:
+                op(cfg)
+            except Exception as e:
+                self._stats["replay_errors"] += 1
+                print(f"[config] ⚠ 重放未落盘的编辑失败，已丢弃该编辑: {e}")
+                continue
+            kept.append(op)
+        self._pending = kept
+        self._cfg, self._fp = cfg, fp
+        self.version += 1
+        return cfg
+
+    @contextmanager
+    def reading(self):
+        """持锁读取当前配置（含尚未落盘的编辑）。"""
+        with self._lock:
+            yield self._sync_locked()
+
+    def edit(self, op: Callable[[dict], Tuple[bool, _R]]) -> _R:
+        """
+        op(cfg) → (是否有改动, 返回值)。有改动则记入待落盘队列；op 抛异常时丢弃内存副本
+        （下次从文件重新解析并重放此前的编辑），与原先「失败不写文件」一致。
+        """
+        with self._lock:
+            cfg = self._sync_locked()
+            try:
+                changed, result = op(cfg)
+            except Exception:
+                self._cfg = None
+                raise
+            if changed:
+                self._pending.append(op)
+                self._stats["edits"] += 1
+                self.version += 1
+                if self.write_delay > 0 and self._timer is None:
+                    self._timer = threading.Timer(self.write_delay, self._flush_quietly)
+                    self._timer.daemon = True
+                    self._timer.start()
+        # 立即落盘放在锁外：on_write 回调会取调用方自己的锁（main 的扫描锁），
+        # 而扫描线程是先取扫描锁再来读配置，持本锁回调会与之死锁
+        if changed and self.write_delay <= 0:
+            self.flush()
+        return result
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[config] ⚠ 写回 config.json 失败（编辑保留在内存，下次编辑时重试）: {e}")
+
+    def flush(self) -> bool:
+        """立即把待落盘的编辑写回文件；没有待写内容返回 False。"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return False
+            try:
+                cfg = self._sync_locked()
+                _write_config_atomic_with_backup(self.we_path, cfg)
+            except Exception:
+                self._stats["write_errors"] += 1
+                raise
+            self._fp = self._stat()
+            self._pending = []
+            self._stats["writes"] += 1
+            version, fp = self.version, self._fp
+        if self.on_write is not None and fp is not None:
+            self.on_write(version, fp)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), version=self.version,
+                        cached=self._cfg is not None, write_delay_sec=self.write_delay)
+
+
+_CONFIG_MANAGERS: Dict[str, WeConfigManager] = {}
+_config_managers_lock = threading.Lock()
+
+
+def config_manager(we_path: str, **options) -> WeConfigManager:
+    """每个 WE 目录一个 WeConfigManager；首次调用时的 options 生效（main 启动时先行创建并配置）。"""
+    key = os.path.abspath(we_path)
+    with _config_managers_lock:
+        mgr = _CONFIG_MANAGERS.get(key)
+        if mgr is None:
+            mgr = WeConfigManager(we_path, **options)
+            _CONFIG_MANAGERS[key] = mgr
+            atexit.register(mgr._flush_quietly)
+        return mgr
+
 def _locate_folders_slot(we_cfg: dict) -> Tuple[dict, str]:
     """
     只定位“folders”容器，避免写入/覆盖其它 UI/状态键：
@@ -752,8 +1229,7 @@ def delete_folders(we_path: str, paths: List[str]) -> int:
     if not norm_paths:
         return 0
 
-    with _WRITE_LOCK:
-        cfg = load_we_config(we_path)
+    def op(cfg: dict) -> Tuple[bool, int]:
         container, key = _locate_folders_slot(cfg)
         folders = container.setdefault(key, [])
 
@@ -761,10 +1237,9 @@ def delete_folders(we_path: str, paths: List[str]) -> int:
         for parts in norm_paths:
             if _delete_folder_by_parts(folders, parts):
                 removed += 1
+        return bool(removed), removed
 
-        if removed:
-            _write_config_atomic_with_backup(we_path, cfg)
-        return removed
+    return config_manager(we_path).edit(op)
 
 def create_folder(we_path: str, parent_path: str, title: str) -> None:
     """
@@ -777,8 +1252,8 @@ def create_folder(we_path: str, parent_path: str, title: str) -> None:
         raise ValueError("文件夹名称不能为空")
 
     parts = [p for p in parent_path.split("/") if p]
-    with _WRITE_LOCK:
-        cfg = load_we_config(we_path)
+
+    def op(cfg: dict) -> Tuple[bool, None]:
         container, key = _locate_folders_slot(cfg)
         folders = container.setdefault(key, [])
 
@@ -798,8 +1273,9 @@ def create_folder(we_path: str, parent_path: str, title: str) -> None:
         exists = next((x for x in target_list if x.get("title") == title), None)
         if not exists:
             target_list.append({"type": "folder", "title": title, "items": {}, "subfolders": []})
+        return True, None
 
-        _write_config_atomic_with_backup(we_path, cfg)
+    config_manager(we_path).edit(op)
 
 def _primary_config_keys_for_write(ids: List[str], id_map: Optional[Dict[str, VideoItem]]) -> List[str]:
     """移动/写入目标文件夹时，每条目只写一个主键（避免 WE 里出现重复引用）。"""
@@ -855,8 +1331,7 @@ def move_items(we_path: str, ids: List[str], dest_path: str, id_map: Optional[Di
     prune_keys = _all_config_keys_for_prune(ids, id_map)
     write_keys = _primary_config_keys_for_write(ids, id_map)
 
-    with _WRITE_LOCK:
-        cfg = load_we_config(we_path)
+    def op(cfg: dict) -> Tuple[bool, None]:
         container, key = _locate_folders_slot(cfg)
         folders = container.setdefault(key, [])
 
@@ -881,8 +1356,9 @@ def move_items(we_path: str, ids: List[str], dest_path: str, id_map: Optional[Di
             items = node.setdefault("items", {})
             for k in write_keys:
                 items[str(k)] = 1
+        return True, None
 
-        _write_config_atomic_with_backup(we_path, cfg)
+    config_manager(we_path).edit(op)
 
 
 def _path_to_parts(path: str) -> List[str]:
@@ -978,9 +1454,8 @@ def move_folders(we_path: str, source_paths: List[str], dest_path: str) -> int:
     dest_parts = _path_to_parts(dest_path) if dest_path != "/" else []
     norm_sources.sort(key=len, reverse=True)
 
-    moved = 0
-    with _WRITE_LOCK:
-        cfg = load_we_config(we_path)
+    def op(cfg: dict) -> Tuple[bool, int]:
+        moved = 0
         container, key = _locate_folders_slot(cfg)
         folders = container.setdefault(key, [])
 
@@ -1006,7 +1481,6 @@ def move_folders(we_path: str, source_paths: List[str], dest_path: str) -> int:
             else:
                 target_list.append(node)
             moved += 1
+        return bool(moved), moved
 
-        if moved:
-            _write_config_atomic_with_backup(we_path, cfg)
-    return moved
\ No newline at end of file
+    return config_manager(we_path).edit(op)
@@ -0,0 +1,74 @@
+# bench_scan.py — 全量扫描的线程数基准（SCAN_WORKERS 取值参考）
+#
+# 在临时目录生成 N 个创意工坊视频项目，分别用不同线程数跑 scan_workshop_items()。
+# --latency-ms 给每次 stat/open 加固定延迟，模拟 SMB/NFS 挂载上的往返。
+#
+#   cd webui && python bench_scan.py --items 10000
+#   cd webui && python bench_scan.py --items 2000 --latency-ms 0.5
+import argparse
+import builtins
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from app import we_scan
+
+
+def make_tree(root: str, n: int) -> None:
+    for i in range(n):
+        d = os.path.join(root, str(1000000000 + i))
+        os.makedirs(d)
+        with open(os.path.join(d, "project.json"), "w", encoding="utf-8") as f:
+            json.dump({"type": "video", "title": f"item {i}", "file": "v.mp4", "preview": "preview.gif"}, f)
+        for name in ("v.mp4", "preview.gif"):
+            with open(os.path.join(d, name), "wb") as f:
+                f.write(b"\0" * 16)
+
+
+def inject_latency(sec: float) -> None:
+    """os.stat / os.scandir / open 每次调用先睡 sec 秒（睡眠释放 GIL，与网络 IO 等待一致）。"""
+    def slow(fn):
+        def wrapper(*a, **kw):
+            time.sleep(sec)
+            return fn(*a, **kw)
+        return wrapper
+    os.stat = slow(os.stat)
+    os.scandir = slow(os.scandir)
+    we_scan.open = slow(builtins.open)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=10000)
+    ap.add_argument("--workers", default="1,8,16")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_scan_")
+    try:
+        make_tree(root, args.items)
+        if args.latency_ms > 0:
+            inject_latency(args.latency_ms / 1000.0)
+        we_scan.scan_workshop_items(root, 1)  # 预热 page cache
+        base = None
+        for workers in (int(w) for w in args.workers.split(",")):
+            best = min(_timed(root, workers) for _ in range(args.repeat))
+            base = base or best
+            print(f"workers={workers:<3} {best:7.2f}s  x{base / best:.1f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _timed(root: str, workers: int) -> float:
+    t0 = time.perf_counter()
+    n = len(we_scan.scan_workshop_items(root, workers))
+    dt = time.perf_counter() - t0
+    assert n > 0
+    return dt
+
+
+if __name__ == "__main__":
+    main()